@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { apiService } from '../services/api';
-import { HistoryRecord } from '../types';
-import { formatDate, exportToCSV } from '../utils/helpers';
+import { FieldData, HistoryRecord } from '../types';
+import { formatDate, downloadFile } from '../utils/helpers';
 import { Download, RefreshCw, Search, ChevronLeft, ChevronRight } from 'lucide-react';
 
 interface HistoryTableProps {
@@ -10,25 +10,39 @@ interface HistoryTableProps {
 
 const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
   const [history, setHistory] = useState<HistoryRecord[]>([]);
+  const [total, setTotal] = useState(0);
+  const [fieldData, setFieldData] = useState<FieldData | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterEmpresa, setFilterEmpresa] = useState('');
   const [filterFundo, setFilterFundo] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
+  // Cursor con el que se pide cada página ya visitada (el de la página 1 es null);
+  // el backend solo pagina hacia adelante
+  const [pageCursors, setPageCursors] = useState<(string | null)[]>([null]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const itemsPerPage = 10;
 
-  const loadHistory = async () => {
+  const loadPage = async (page: number, cursors: (string | null)[]) => {
     try {
       setLoading(true);
       setError(null);
-      console.log('📊 Loading history...');
+      console.log('📊 Loading history page', page);
       
-      const response = await apiService.getHistory();
+      const response = await apiService.getHistory(cursors[page - 1], itemsPerPage, {
+        empresa: filterEmpresa,
+        fundo: filterFundo
+      });
       
       if (response.success && response.data) {
-        setHistory(response.data);
-        console.log('📊 History loaded:', response.data.length, 'records');
+        const { records, nextCursor: next, total: count } = response.data;
+        setHistory(records);
+        setTotal(count);
+        setNextCursor(next);
+        setPageCursors(next ? [...cursors.slice(0, page), next] : cursors.slice(0, page));
+        setCurrentPage(page);
+        console.log('📊 History page loaded:', records.length, 'of', count, 'records');
       } else {
         setError('No se pudieron cargar los datos del historial');
       }
@@ -40,18 +54,29 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
     }
   };
 
+  const loadHistory = () => loadPage(currentPage, pageCursors);
+
+  // Volver a la primera página cuando cambien los filtros
+  useEffect(() => {
+    loadPage(1, [null]);
+  }, [filterEmpresa, filterFundo]);
+
+  // Opciones de los filtros desde los datos de campo (no desde el historial descargado)
   useEffect(() => {
-    loadHistory();
+    apiService.getFieldData()
+      .then(setFieldData)
+      .catch((err) => console.error('❌ Error loading field data:', err));
   }, []);
 
-  const handleExportCSV = () => {
-    if (history.length === 0) {
+  const handleExportCSV = async () => {
+    if (total === 0) {
       onNotification('No hay datos para exportar', 'warning');
       return;
     }
 
     try {
-      exportToCSV(history, 'historial_luz_sombra.csv');
+      const csv = await apiService.exportHistory({ empresa: filterEmpresa, fundo: filterFundo });
+      downloadFile(csv, 'historial_luz_sombra.csv', 'text/csv;charset=utf-8;');
       onNotification('✅ Historial exportado exitosamente', 'success');
     } catch (error) {
       console.error('Error exporting CSV:', error);
@@ -59,38 +84,44 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
     }
   };
 
-  const filteredHistory = history
-    .filter(record => {
-      const matchesSearch = 
-        record.empresa.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        record.fundo.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        record.sector.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        record.lote.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        record.hilera.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        record.numero_planta.toLowerCase().includes(searchTerm.toLowerCase());
-
-      const matchesEmpresa = !filterEmpresa || record.empresa === filterEmpresa;
-      const matchesFundo = !filterFundo || record.fundo === filterFundo;
-
-      return matchesSearch && matchesEmpresa && matchesFundo;
-    })
-    .sort((a, b) => parseInt(b.id) - parseInt(a.id)); // Ordenar por ID descendente (más recientes primero)
+  // La búsqueda libre filtra solo la página cargada; empresa y fundo los filtra el backend
+  const filteredHistory = history.filter(record => {
+    const term = searchTerm.toLowerCase();
+    return (
+      record.empresa.toLowerCase().includes(term) ||
+      record.fundo.toLowerCase().includes(term) ||
+      record.sector.toLowerCase().includes(term) ||
+      record.lote.toLowerCase().includes(term) ||
+      record.hilera.toLowerCase().includes(term) ||
+      record.numero_planta.toLowerCase().includes(term)
+    );
+  });
 
   // Calcular paginación
-  const totalPages = Math.ceil(filteredHistory.length / itemsPerPage);
+  const totalPages = Math.max(Math.ceil(total / itemsPerPage), 1);
   const startIndex = (currentPage - 1) * itemsPerPage;
-  const endIndex = startIndex + itemsPerPage;
-  const paginatedHistory = filteredHistory.slice(startIndex, endIndex);
+  const endIndex = startIndex + history.length;
+  const hasPrevious = currentPage > 1;
+  const hasNext = nextCursor !== null;
 
-  // Resetear página cuando cambien los filtros
-  useEffect(() => {
-    setCurrentPage(1);
-  }, [searchTerm, filterEmpresa, filterFundo]);
+  const goToPrevious = () => {
+    if (hasPrevious && !loading) {
+      loadPage(currentPage - 1, pageCursors);
+    }
+  };
 
-  const uniqueEmpresas = [...new Set(history.map(record => record.empresa))];
-  const uniqueFundos = [...new Set(history.map(record => record.fundo))];
+  const goToNext = () => {
+    if (hasNext && !loading) {
+      loadPage(currentPage + 1, pageCursors);
+    }
+  };
+
+  const uniqueEmpresas = fieldData?.empresa ?? [];
+  const uniqueFundos = filterEmpresa
+    ? Object.keys(fieldData?.hierarchical?.[filterEmpresa] ?? {})
+    : fieldData?.fundo ?? [];
 
-  if (loading) {
+  if (loading && history.length === 0) {
     return (
       <div className="space-y-6">
         {/* Header Skeleton */}
@@ -196,7 +227,7 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
                 type="text"
                 value={searchTerm}
                 onChange={(e) => setSearchTerm(e.target.value)}
-                placeholder="Buscar en todos los campos..."
+                placeholder="Buscar en esta página..."
                 className="w-full pl-10 pr-3 py-2 border border-gray-300 dark:border-dark-600 rounded-lg bg-white dark:bg-dark-700 text-gray-900 dark:text-white placeholder-gray-500 dark:placeholder-dark-400 focus:outline-none focus:ring-2 focus:ring-primary-500 focus:border-primary-500 transition-all duration-200"
               />
             </div>
@@ -208,7 +239,10 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
             </label>
             <select
               value={filterEmpresa}
-              onChange={(e) => setFilterEmpresa(e.target.value)}
+              onChange={(e) => {
+                setFilterEmpresa(e.target.value);
+                setFilterFundo('');
+              }}
               className="w-full px-3 py-2 border border-gray-300 dark:border-dark-600 rounded-lg bg-white dark:bg-dark-700 text-gray-900 dark:text-white focus:outline-none focus:ring-2 focus:ring-primary-500 focus:border-primary-500 transition-all duration-200"
             >
               <option value="">Todas las empresas</option>
@@ -240,7 +274,8 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
         </div>
 
         <div className="mt-4 text-sm text-gray-600 dark:text-dark-300">
-          Mostrando {startIndex + 1}-{Math.min(endIndex, filteredHistory.length)} de {filteredHistory.length} registros (de {history.length} total)
+          Mostrando {total === 0 ? 0 : startIndex + 1}-{endIndex} de {total} registros
+          {searchTerm && ` (${filteredHistory.length} coinciden con la búsqueda en esta página)`}
         </div>
       </div>
 
@@ -283,14 +318,14 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
               </tr>
             </thead>
             <tbody className="bg-white dark:bg-dark-800 divide-y divide-gray-200 dark:divide-dark-700">
-              {paginatedHistory.length === 0 ? (
+              {filteredHistory.length === 0 ? (
                 <tr>
                   <td colSpan={10} className="px-6 py-4 text-center text-gray-500 dark:text-dark-400">
                     No se encontraron registros
                   </td>
                 </tr>
               ) : (
-                paginatedHistory.map((record) => (
+                filteredHistory.map((record) => (
                   <tr key={record.id} className="hover:bg-gray-50 dark:hover:bg-dark-700 transition-colors duration-200">
                     <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900 dark:text-white">
                       {record.empresa}
@@ -345,15 +380,15 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
         <div className="bg-white dark:bg-dark-800 px-4 py-3 flex items-center justify-between border-t border-gray-200 dark:border-dark-700 sm:px-6 rounded-xl shadow-2xl border border-gray-200 dark:border-dark-700">
           <div className="flex-1 flex justify-between sm:hidden">
             <button
-              onClick={() => setCurrentPage(prev => Math.max(prev - 1, 1))}
-              disabled={currentPage === 1}
+              onClick={goToPrevious}
+              disabled={!hasPrevious || loading}
               className="relative inline-flex items-center px-4 py-2 border border-gray-300 dark:border-dark-600 text-sm font-medium rounded-lg text-gray-700 dark:text-dark-200 bg-white dark:bg-dark-700 hover:bg-gray-50 dark:hover:bg-dark-600 disabled:opacity-50 disabled:cursor-not-allowed transition-all duration-200"
             >
               Anterior
             </button>
             <button
-              onClick={() => setCurrentPage(prev => Math.min(prev + 1, totalPages))}
-              disabled={currentPage === totalPages}
+              onClick={goToNext}
+              disabled={!hasNext || loading}
               className="ml-3 relative inline-flex items-center px-4 py-2 border border-gray-300 dark:border-dark-600 text-sm font-medium rounded-lg text-gray-700 dark:text-dark-200 bg-white dark:bg-dark-700 hover:bg-gray-50 dark:hover:bg-dark-600 disabled:opacity-50 disabled:cursor-not-allowed transition-all duration-200"
             >
               Siguiente
@@ -369,44 +404,16 @@ const HistoryTable: React.FC<HistoryTableProps> = ({ onNotification }) => {
             <div>
               <nav className="relative z-0 inline-flex rounded-md shadow-sm -space-x-px" aria-label="Pagination">
                 <button
-                  onClick={() => setCurrentPage(prev => Math.max(prev - 1, 1))}
-                  disabled={currentPage === 1}
+                  onClick={goToPrevious}
+                  disabled={!hasPrevious || loading}
                   className="relative inline-flex items-center px-2 py-2 rounded-l-lg border border-gray-300 dark:border-dark-600 bg-white dark:bg-dark-700 text-sm font-medium text-gray-700 dark:text-dark-300 hover:bg-gray-50 dark:hover:bg-dark-600 hover:text-gray-900 dark:hover:text-white disabled:opacity-50 disabled:cursor-not-allowed transition-all duration-200"
                 >
                   <ChevronLeft className="h-5 w-5" />
                 </button>
                 
-                {/* Números de página */}
-                {Array.from({ length: Math.min(5, totalPages) }, (_, i) => {
-                  let pageNum: number;
-                  if (totalPages <= 5) {
-                    pageNum = i + 1;
-                  } else if (currentPage <= 3) {
-                    pageNum = i + 1;
-                  } else if (currentPage >= totalPages - 2) {
-                    pageNum = totalPages - 4 + i;
-                  } else {
-                    pageNum = currentPage - 2 + i;
-                  }
-                  
-                  return (
-                    <button
-                      key={pageNum}
-                      onClick={() => setCurrentPage(pageNum)}
-                      className={`relative inline-flex items-center px-4 py-2 border text-sm font-medium transition-all duration-200 ${
-                        currentPage === pageNum
-                          ? 'z-10 bg-primary-600 border-primary-500 text-white shadow-lg'
-                          : 'bg-white dark:bg-dark-700 border-gray-300 dark:border-dark-600 text-gray-700 dark:text-dark-300 hover:bg-gray-50 dark:hover:bg-dark-600 hover:text-gray-900 dark:hover:text-white'
-                      }`}
-                    >
-                      {pageNum}
-                    </button>
-                  );
-                })}
-                
                 <button
-                  onClick={() => setCurrentPage(prev => Math.min(prev + 1, totalPages))}
-                  disabled={currentPage === totalPages}
+                  onClick={goToNext}
+                  disabled={!hasNext || loading}
                   className="relative inline-flex items-center px-2 py-2 rounded-r-lg border border-gray-300 dark:border-dark-600 bg-white dark:bg-dark-700 text-sm font-medium text-gray-700 dark:text-dark-300 hover:bg-gray-50 dark:hover:bg-dark-600 hover:text-gray-900 dark:hover:text-white disabled:opacity-50 disabled:cursor-not-allowed transition-all duration-200"
                 >
                   <ChevronRight className="h-5 w-5" />
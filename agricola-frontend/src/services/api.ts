@@ -4,6 +4,41 @@ import { config } from '../config/environment';
 
 const API_BASE_URL = config.apiUrl;
 
+// EXIF metadata always fits in the first 64 KB of a JPEG
+const EXIF_MAX_BYTES = 64 * 1024;
+
+export interface GpsCheckResult {
+  filename: string;
+  hasGps: boolean;
+  lat: number | null;
+  lng: number | null;
+  fecha: string | null;
+}
+
+export interface HistoryFilters {
+  empresa?: string;
+  fundo?: string;
+  sector?: string;
+  lote?: string;
+}
+
+export interface HistoryPage {
+  records: HistoryRecord[];
+  nextCursor: string | null;
+  total: number;
+}
+
+// Only send the filters that have a value
+const historyFilterParams = (filters: HistoryFilters): Record<string, string> => {
+  const params: Record<string, string> = {};
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value) {
+      params[key] = value;
+    }
+  });
+  return params;
+};
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   timeout: 120000, // 2 minutes timeout for image processing
@@ -72,17 +107,39 @@ export const apiService = {
     return Promise.all(promises);
   },
 
-  // Get processing history
-  getHistory: async (): Promise<ApiResponse<HistoryRecord[]>> => {
-    const response = await api.get('/api/historial');
-    // El backend devuelve { success: true, procesamientos: [...] }
-    // pero el frontend espera { success: true, data: [...] }
-    if (response.data.success && response.data.procesamientos) {
-      return {
-        success: true,
-        data: response.data.procesamientos
-      };
+  // Get one page of processing history (filters are applied by the backend)
+  getHistory: async (
+    cursor: string | null = null,
+    limit: number = 50,
+    filters: HistoryFilters = {}
+  ): Promise<ApiResponse<HistoryPage>> => {
+    const params: Record<string, string | number> = { limit, ...historyFilterParams(filters) };
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    const response = await api.get('/api/historial', { params });
+    // El backend devuelve { success: true, procesamientos: [...], next_cursor, total }
+    // pero el frontend espera { success: true, data: ... }
+    if (!response.data.success || !response.data.procesamientos) {
+      return response.data;
     }
+
+    return {
+      success: true,
+      data: {
+        records: response.data.procesamientos,
+        nextCursor: response.data.next_cursor || null,
+        total: response.data.total
+      }
+    };
+  },
+
+  // Export the filtered history as CSV (streamed by the backend)
+  exportHistory: async (filters: HistoryFilters = {}): Promise<Blob> => {
+    const response = await api.get('/api/historial/exportar', {
+      params: { formato: 'csv', ...historyFilterParams(filters) },
+      responseType: 'blob',
+    });
     return response.data;
   },
 
@@ -104,6 +161,21 @@ export const apiService = {
     });
     return response.data;
   },
+
+  // Check GPS info of many images at once (only the first 64 KB of each file is sent)
+  checkGpsInfoBatch: async (files: File[]): Promise<ApiResponse<GpsCheckResult[]>> => {
+    const formData = new FormData();
+    files.forEach((file) => {
+      formData.append('files', file.slice(0, EXIF_MAX_BYTES), file.name);
+    });
+
+    const response = await api.post('/api/check-gps-info/batch', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  },
 };
 
 export default apiService;
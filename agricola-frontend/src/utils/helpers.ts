@@ -25,7 +25,7 @@ export const generateId = (): string => {
   return Date.now().toString(36) + Math.random().toString(36).substr(2);
 };
 
-export const downloadFile = (content: string, filename: string, contentType: string = 'text/csv'): void => {
+export const downloadFile = (content: string | Blob, filename: string, contentType: string = 'text/csv'): void => {
   const blob = new Blob([content], { type: contentType });
   const url = URL.createObjectURL(blob);
   const link = document.createElement('a');
@@ -1,59 +1,37 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Optional
-import json
-import base64
+from typing import Optional, List
+from pydantic import BaseModel
 import os
+import uuid
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 
-from src.google_sheets.sheets_client import GoogleSheetsClient
-
-# Función para cargar configuración desde variables de entorno o archivo
-def load_google_sheets_config():
-    """Carga la configuración de Google Sheets desde variables de entorno o archivo"""
-    config = {}
-    
-    # Intentar cargar desde variables de entorno primero
-    if os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID'):
-        config['spreadsheet_id'] = os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID')
-        config['sheet_name'] = os.getenv('GOOGLE_SHEETS_SHEET_NAME', 'Data-app')
-        
-        # Cargar credenciales desde Base64 si están disponibles
-        if os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64'):
-            credentials_b64 = os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64')
-            credentials_json = base64.b64decode(credentials_b64).decode('utf-8')
-            config['credentials'] = json.loads(credentials_json)
-        
-        # Cargar token desde Base64 si está disponible
-        if os.getenv('GOOGLE_SHEETS_TOKEN_BASE64'):
-            token_b64 = os.getenv('GOOGLE_SHEETS_TOKEN_BASE64')
-            token_json = base64.b64decode(token_b64).decode('utf-8')
-            config['token'] = json.loads(token_json)
-            
-        return config
-    
-    # Fallback: cargar desde archivo (para desarrollo local)
-    try:
-        with open('google_sheets_config.json', 'r') as f:
-            file_config = json.load(f)
-            config.update(file_config)
-    except FileNotFoundError:
-        print("⚠️ No se encontró google_sheets_config.json y no hay variables de entorno configuradas")
-        config = {
-            'spreadsheet_id': 'demo',
-            'sheet_name': 'Data-app'
-        }
-    
-    return config
+from src.google_sheets.sheets_client import GoogleSheetsClient, HEADERS
+from src.google_sheets.read_cache import CacheEntry
+from src.google_sheets.field_index import LEVELS
+from src.metadata.field_locator import default_field_locator
+from src.metadata.gps_extractor import GPSMetadataExtractor
+from src.database import RepositorioRegistros, SincronizadorSheets, EstadisticasRegistros, MapaCalorSombra
+from src.database.repositorio import CAMPOS_REGISTRO
+from src.alertas.motor_alertas import MotorAlertas
+from src.services.respuestas import RespuestaJSON, CompresionMiddleware, a_columnas
+from src.services.exportacion import paginas_historial, exportar_csv, exportar_parquet
+from src.services.subidas import GestorSubidas, ConflictoOffset, TAMANO_FRAGMENTO, MAX_TAMANO_FRAGMENTO
 
 # Crear la aplicación FastAPI
 app = FastAPI(
     title="API Agrícola Luz-Sombra",
     description="API para procesar imágenes agrícolas y calcular porcentajes de luz y sombra",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=RespuestaJSON
 )
 
 # Configurar archivos estáticos para React
@@ -92,68 +70,601 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar cliente de Google Sheets
+# Comprimir (Brotli/GZip) las respuestas de más de 1 KB
+app.add_middleware(CompresionMiddleware, minimum_size=1024)
+
+# Inicializar cliente de Google Sheets (la configuración se lee una sola vez;
+# la autenticación se hace en segundo plano al arrancar)
 try:
-    # Crear archivos temporales desde variables de entorno si están disponibles
-    if os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64'):
-        credentials_b64 = os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64')
-        # Agregar padding si es necesario
-        missing_padding = len(credentials_b64) % 4
-        if missing_padding:
-            credentials_b64 += '=' * (4 - missing_padding)
-        credentials_json = base64.b64decode(credentials_b64).decode('utf-8')
-        with open('credentials.json', 'w') as f:
-            f.write(credentials_json)
-        print("✅ Credenciales cargadas desde variable de entorno")
-    
-    if os.getenv('GOOGLE_SHEETS_TOKEN_BASE64'):
-        token_b64 = os.getenv('GOOGLE_SHEETS_TOKEN_BASE64')
-        # Agregar padding si es necesario
-        missing_padding = len(token_b64) % 4
-        if missing_padding:
-            token_b64 += '=' * (4 - missing_padding)
-        token_json = base64.b64decode(token_b64).decode('utf-8')
-        with open('token.json', 'w') as f:
-            f.write(token_json)
-        print("✅ Token cargado desde variable de entorno")
-    
     sheets_client = GoogleSheetsClient()
     print("✅ Google Sheets client inicializado")
 except Exception as e:
     print(f"⚠️ Error inicializando Google Sheets client: {e}")
     sheets_client = None
 
+# Base de datos local: las consultas se responden desde SQLite y Sheets se sincroniza en segundo plano
+repositorio = RepositorioRegistros(os.getenv('AGRICOLA_DB_PATH', 'agricola.db'))
+sincronizador = SincronizadorSheets(repositorio, sheets_client).iniciar() if sheets_client else None
+
+# Estadísticas precalculadas: se cargan una vez y se actualizan con cada registro insertado
+estadisticas = EstadisticasRegistros()
+repositorio.suscribir(estadisticas.agregar_registros)
+
+# Estadísticas del historial de Sheets mientras no hay base local: se alimentan de forma
+# incremental desde la copia del historial del cliente
+estadisticas_sheets = EstadisticasRegistros()
+cursor_estadisticas_sheets = None
+estadisticas_sheets_lock = threading.Lock()
+
+def obtener_estadisticas_sheets() -> EstadisticasRegistros:
+    """Agregados del historial de Sheets, actualizados solo con las filas nuevas de la copia"""
+    global estadisticas_sheets, cursor_estadisticas_sheets
+    # Refresca la copia del cliente si su caché venció
+    entry = sheets_client.get_historial_entry()
+    with estadisticas_sheets_lock:
+        nuevos, cursor = sheets_client.get_historial_since(cursor_estadisticas_sheets)
+        if not cursor[1]:
+            # Sin copia (modo demo o Sheets no disponible): agregados de los pocos registros de ejemplo
+            temporales = EstadisticasRegistros()
+            temporales.agregar_registros(entry.value.get('procesamientos', []))
+            return temporales
+        if cursor_estadisticas_sheets is None or cursor[0] != cursor_estadisticas_sheets[0]:
+            # La copia se releyó desde cero: nuevos trae todos los registros
+            estadisticas_sheets = EstadisticasRegistros()
+        estadisticas_sheets.agregar_registros(nuevos)
+        cursor_estadisticas_sheets = cursor
+        return estadisticas_sheets
+
+# Motor de alertas por lote: agregados iniciados con el historial y actualizados con cada registro
+motor_alertas = MotorAlertas()
+repositorio.suscribir(motor_alertas.cargar_registros)
+
+# Mapa de calor de sombra: rejilla por zoom, también actualizada con cada registro
+mapa_calor = MapaCalorSombra()
+repositorio.suscribir(mapa_calor.agregar_registros)
+
+@app.on_event("startup")
+async def warm_up_google_sheets():
+    """Autentica y precarga Google Sheets en segundo plano para que la primera petición no espere"""
+    if sheets_client:
+        sheets_client.warm_up()
+
+# Extracción de metadatos GPS: solo se lee la cabecera EXIF, que cabe en los primeros 64 KB
+gps_extractor = GPSMetadataExtractor()
+gps_executor = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) + 4), thread_name_prefix="gps")
+EXIF_MAX_BYTES = 64 * 1024
+
+# Servicio de procesamiento: el modelo se carga con la primera imagen
+procesamiento_service = None
+procesamiento_service_lock = threading.Lock()
+
+def procesar_imagen_subida(contenido: bytes, nombre_archivo: str, metadatos: dict) -> dict:
+    """Procesa una imagen recibida, guarda su registro (local + Sheets) y devuelve el resultado"""
+    global procesamiento_service
+    if procesamiento_service is None:
+        # Las subidas se procesan en varios hilos: el modelo se carga una sola vez
+        with procesamiento_service_lock:
+            if procesamiento_service is None:
+                from src.services.procesamiento_service_v2 import ProcesamientoServiceV2
+                procesamiento_service = ProcesamientoServiceV2(motor_alertas=motor_alertas)
+    
+    gps = gps_extractor.extract_metadata(contenido[:EXIF_MAX_BYTES], nombre_archivo)
+    # Los niveles de campo del formulario tienen prioridad sobre los deducidos por GPS
+    campo = {nivel: metadatos.get(nivel) or (gps['campo'] or {}).get(nivel, '') for nivel in LEVELS}
+    resultado = procesamiento_service.procesar_imagen_bytes(
+        contenido, "{}", campo['lote'] or nombre_archivo, nombre_archivo, campo=campo
+    )
+    
+    ahora = datetime.now()
+    fecha = gps['fecha_tomada'] or ahora
+    dispositivo = gps['dispositivo']
+    record = {
+        'id': uuid.uuid4().hex,
+        'fecha': fecha.strftime('%Y-%m-%d'),
+        'hora': fecha.strftime('%H:%M:%S'),
+        'imagen': nombre_archivo,
+        'nombre_archivo': resultado.get('ruta_imagen_resultado', ''),
+        **campo,
+        'hilera': metadatos.get('hilera', ''),
+        'numero_planta': metadatos.get('numero_planta', ''),
+        'latitud': gps['gps_latitud'] if gps['gps_latitud'] is not None else metadatos.get('latitud'),
+        'longitud': gps['gps_longitud'] if gps['gps_longitud'] is not None else metadatos.get('longitud'),
+        'porcentaje_luz': round(resultado['porcentaje_luz'], 2),
+        'porcentaje_sombra': round(resultado['porcentaje_sombra'], 2),
+        'dispositivo': f"{dispositivo.get('fabricante', '')} {dispositivo.get('modelo', '')}".strip(),
+        'software': dispositivo.get('software', ''),
+        'direccion': gps['direccion'] or '',
+        'timestamp': ahora.isoformat(),
+    }
+    if sincronizador:
+        sincronizador.registrar(record)
+    else:
+        repositorio.insertar(record)
+    return {**resultado, 'registro': record}
+
+# Subidas reanudables: el procesamiento empieza al recibir el último fragmento
+subidas = GestorSubidas(procesar_imagen_subida)
+
+def usar_local() -> bool:
+    """True si la base local ya tiene datos de la hoja (si no, se consulta Sheets directamente)"""
+    return sincronizador is not None and sincronizador.listo.is_set()
+
 # Montar directorio de resultados para servir imágenes procesadas
 if os.path.exists("resultados"):
     app.mount("/resultados", StaticFiles(directory="resultados"), name="resultados")
 
+def etag_local(*partes) -> str:
+    """ETag de una respuesta de la base local: versión de los datos + parámetros, sin serializar el contenido"""
+    clave = repr((repositorio.modificado_en,) + partes).encode('utf-8')
+    return '"' + hashlib.sha1(clave).hexdigest() + '"'
+
+def cabeceras_cache(etag: str, fetched_at: float) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(fetched_at, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+def no_modificado(request: Request, etag: str, fetched_at: float) -> bool:
+    """True si el navegador ya tiene la versión indicada (If-None-Match / If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag in [e.strip() for e in if_none_match.split(",")]
+    if request.headers.get("if-modified-since"):
+        try:
+            desde = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            return int(fetched_at) <= desde
+        except (TypeError, ValueError):
+            pass
+    return False
+
+def respuesta_cacheable(request: Request, entry) -> Response:
+    """Respuesta JSON con ETag/Last-Modified; 304 si el navegador ya tiene esta versión"""
+    headers = cabeceras_cache(entry.etag, entry.fetched_at)
+    if no_modificado(request, entry.etag, entry.fetched_at):
+        return Response(status_code=304, headers=headers)
+    return RespuestaJSON(content=entry.value, headers=headers)
+
 # Endpoints de Google Sheets
 @app.get("/api/google-sheets/field-data")
-async def get_field_data():
+async def get_field_data(request: Request):
     """Obtiene datos de campo desde Google Sheets"""
     try:
+        if usar_local():
+            modificado_en, etag = repositorio.modificado_en, etag_local('field-data')
+            if no_modificado(request, etag, modificado_en):
+                return Response(status_code=304, headers=cabeceras_cache(etag, modificado_en))
+            return respuesta_cacheable(request, CacheEntry(repositorio.datos_campo(), modificado_en, etag))
         if not sheets_client:
             raise HTTPException(status_code=500, detail="Google Sheets no configurado")
         
-        data = sheets_client.get_field_data()
-        return data
+        return respuesta_cacheable(request, sheets_client.get_field_data_entry())
+    except Exception as e:
+        print(f"❌ Error obteniendo datos de campo: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo datos de campo: {str(e)}")
+
+@app.get("/api/google-sheets/field-data/opciones")
+async def get_field_data_opciones(
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None,
+    q: str = "",
+    limit: Optional[int] = None
+):
+    """
+    Opciones del siguiente nivel para selects en cascada
+    
+    Sin parámetros devuelve las empresas; con empresa, sus fundos; con empresa y fundo,
+    sus sectores; con los tres, sus lotes. q filtra por prefijo.
+    """
+    ruta = []
+    for valor in (empresa, fundo, sector):
+        if not valor:
+            break
+        ruta.append(valor)
+    if len(ruta) < sum(1 for v in (empresa, fundo, sector) if v):
+        raise HTTPException(status_code=400, detail="Los niveles deben indicarse en orden: empresa, fundo, sector")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit debe ser mayor o igual a 1")
+    
+    try:
+        indice = repositorio.indice_campo() if usar_local() else sheets_client.get_field_index()
     except Exception as e:
         print(f"❌ Error obteniendo datos de campo: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo datos de campo: {str(e)}")
+    
+    return {
+        "success": True,
+        "nivel": LEVELS[len(ruta)],
+        "opciones": indice.get_children(tuple(ruta), q, limit)
+    }
+
+@app.get("/api/google-sheets/field-data/buscar")
+async def buscar_field_data(nivel: str, q: str, limit: int = 20):
+    """Búsqueda por prefijo (typeahead) en todos los valores de un nivel"""
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit debe ser mayor o igual a 1")
+    try:
+        indice = repositorio.indice_campo() if usar_local() else sheets_client.get_field_index()
+        return {"success": True, "nivel": nivel, "opciones": indice.search(nivel, q, limit)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/google-sheets/field-data/ubicar")
+async def ubicar_field_data(lat: float, lng: float):
+    """Campo (empresa/fundo/sector/lote) que contiene unas coordenadas, según los polígonos locales"""
+    campo = default_field_locator().locate(lat, lng)
+    return {"success": campo is not None, "campo": campo}
+
+def resumen_gps(contenido: bytes, filename: str) -> dict:
+    """Metadatos mínimos para el chequeo previo de GPS (sin geocodificación)"""
+    metadata = gps_extractor.extract_metadata(contenido, filename, geocode=False)
+    fecha = metadata['fecha_tomada']
+    return {
+        "filename": filename,
+        "hasGps": metadata['gps_latitud'] is not None and metadata['gps_longitud'] is not None,
+        "lat": metadata['gps_latitud'],
+        "lng": metadata['gps_longitud'],
+        "fecha": fecha.isoformat() if fecha else None,
+    }
+
+@app.post("/api/check-gps-info")
+async def check_gps_info(file: UploadFile = File(...)):
+    """Indica si una imagen tiene coordenadas GPS (basta con enviar sus primeros 64 KB)"""
+    contenido = await file.read(EXIF_MAX_BYTES)
+    resumen = await asyncio.get_running_loop().run_in_executor(gps_executor, resumen_gps, contenido, file.filename)
+    coordenadas = {"lat": resumen["lat"], "lng": resumen["lng"]} if resumen["hasGps"] else None
+    return {"success": True, "data": {"hasGps": resumen["hasGps"], "coordinates": coordenadas, "fecha": resumen["fecha"]}}
+
+@app.post("/api/check-gps-info/batch")
+async def check_gps_info_batch(files: List[UploadFile] = File(...)):
+    """
+    Chequeo de GPS de varias imágenes a la vez
+    
+    Cada archivo puede ser la imagen completa o solo sus primeros 64 KB; la
+    extracción se reparte en un pool de hilos. Devuelve
+    [{filename, hasGps, lat, lng, fecha}] en el orden recibido.
+    """
+    contenidos = [(await f.read(EXIF_MAX_BYTES), f.filename) for f in files]
+    loop = asyncio.get_running_loop()
+    resultados = await asyncio.gather(*(
+        loop.run_in_executor(gps_executor, resumen_gps, contenido, filename)
+        for contenido, filename in contenidos
+    ))
+    return {"success": True, "data": resultados}
+
+class NuevaSubida(BaseModel):
+    """Datos para crear una subida reanudable"""
+    nombre_archivo: str
+    tamano: int
+    sha256: str
+    empresa: Optional[str] = None
+    fundo: Optional[str] = None
+    sector: Optional[str] = None
+    lote: Optional[str] = None
+    hilera: Optional[str] = None
+    numero_planta: Optional[str] = None
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+
+@app.post("/api/subidas", status_code=201)
+async def crear_subida(datos: NuevaSubida):
+    """
+    Crea una subida reanudable
+    
+    Después se envían los fragmentos con PUT /api/subidas/{id}?offset=N (cuerpo = bytes
+    del fragmento); si la conexión se corta, GET /api/subidas/{id} indica el offset
+    recibido. Al llegar el último fragmento se valida el SHA-256 y empieza el procesamiento.
+    """
+    metadatos = datos.model_dump(exclude={'nombre_archivo', 'tamano', 'sha256'}, exclude_none=True)
+    try:
+        subida = subidas.crear(datos.tamano, datos.nombre_archivo, datos.sha256, metadatos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **subida, "tamano_fragmento": TAMANO_FRAGMENTO}
+
+@app.put("/api/subidas/{subida_id}")
+async def enviar_fragmento(subida_id: str, offset: int, request: Request):
+    """Recibe un fragmento a partir de `offset`; 409 con el offset esperado si no coincide"""
+    longitud = request.headers.get("content-length")
+    if longitud:
+        if not longitud.isdigit():
+            raise HTTPException(status_code=400, detail="Content-Length inválido")
+        if int(longitud) > MAX_TAMANO_FRAGMENTO:
+            raise HTTPException(status_code=413, detail=f"Los fragmentos no pueden superar {MAX_TAMANO_FRAGMENTO} bytes")
+    
+    contenido = await request.body()
+    try:
+        subida = subidas.recibir(subida_id, offset, contenido)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConflictoOffset as e:
+        return RespuestaJSON(
+            status_code=409,
+            content={"success": False, "detail": str(e), "offset": e.offset_esperado}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **subida}
+
+@app.get("/api/subidas/{subida_id}")
+async def get_subida(subida_id: str):
+    """Estado de una subida: offset recibido (para reanudar), estado y resultado si ya terminó"""
+    try:
+        return {"success": True, **subidas.estado(subida_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/subidas/{subida_id}/finalizar")
+async def finalizar_subida(subida_id: str, espera: float = 60):
+    """
+    Espera (hasta `espera` segundos) a que termine el procesamiento y devuelve el resultado
+    
+    El procesamiento ya empezó al recibir el último fragmento; si no terminó a
+    tiempo, el estado sigue siendo 'procesando' y se puede volver a consultar.
+    """
+    try:
+        subida = subidas.estado(subida_id)
+        futuro = subidas.futuro(subida_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    if subida['offset'] < subida['tamano'] or subida['estado'] == 'checksum_invalido':
+        return RespuestaJSON(
+            status_code=409,
+            content={"success": False, "detail": "La subida no está completa", **subida}
+        )
+    
+    if futuro is not None and espera > 0:
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(futuro)), timeout=min(espera, 300))
+        except Exception:
+            # Tiempo agotado o error de procesamiento: el estado lo refleja
+            pass
+    
+    subida = subidas.estado(subida_id)
+    return {"success": subida['estado'] == 'completado', **subida}
 
 @app.get("/api/historial")
-async def get_historial():
-    """Obtiene historial de procesamientos desde Google Sheets"""
+async def get_historial(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = 1000,
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None,
+    lote: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    luz_min: Optional[float] = None,
+    luz_max: Optional[float] = None,
+    sombra_min: Optional[float] = None,
+    sombra_max: Optional[float] = None,
+    formato: str = "registros"
+):
+    """
+    Obtiene historial de procesamientos (base local o Google Sheets), paginado y filtrado
+    
+    formato=columnar devuelve `procesamientos` como un arreglo por campo en lugar de una lista de objetos.
+    """
     try:
-        if not sheets_client:
+        if not usar_local() and not sheets_client:
             raise HTTPException(status_code=500, detail="Google Sheets no configurado")
+        if not 1 <= limit <= 5000:
+            raise HTTPException(status_code=400, detail="limit debe estar entre 1 y 5000")
+        if formato not in ("registros", "columnar"):
+            raise HTTPException(status_code=400, detail="formato debe ser 'registros' o 'columnar'")
+        
+        filtros = {
+            'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote,
+            'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta,
+            'luz_min': luz_min, 'luz_max': luz_max,
+            'sombra_min': sombra_min, 'sombra_max': sombra_max,
+        }
+        local = usar_local()
+        try:
+            if local:
+                # El ETag sale de la versión de la base y los parámetros: un 304 no consulta SQLite
+                modificado_en = repositorio.modificado_en
+                etag = etag_local(cursor, limit, tuple(filtros.items()), formato)
+                if no_modificado(request, etag, modificado_en):
+                    return Response(status_code=304, headers=cabeceras_cache(etag, modificado_en))
+                page = CacheEntry(repositorio.historial(cursor, limit, filtros), modificado_en, etag)
+            else:
+                page = sheets_client.get_historial_page(cursor, limit, filtros)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        data = sheets_client.get_historial()
-        return data
+        if formato == "columnar":
+            # Mismo contenido que la página por registros: su ETag se deriva del de ella
+            etag = page.etag if local else page.etag[:-1] + '-columnar"'
+            page = CacheEntry({
+                **page.value,
+                'formato': 'columnar',
+                'procesamientos': a_columnas(page.value['procesamientos'], CAMPOS_REGISTRO)
+            }, page.fetched_at, etag)
+        
+        return respuesta_cacheable(request, page)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error obteniendo historial: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo historial: {str(e)}")
 
+@app.get("/api/historial/exportar")
+async def exportar_historial(
+    formato: str = "csv",
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None,
+    lote: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    luz_min: Optional[float] = None,
+    luz_max: Optional[float] = None,
+    sombra_min: Optional[float] = None,
+    sombra_max: Optional[float] = None
+):
+    """Exporta el historial completo (con los mismos filtros que /api/historial) en CSV o Parquet, en streaming"""
+    if formato not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'csv' o 'parquet'")
+    if not usar_local() and not sheets_client:
+        raise HTTPException(status_code=500, detail="Google Sheets no configurado")
+    
+    filtros = {
+        'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote,
+        'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta,
+        'luz_min': luz_min, 'luz_max': luz_max,
+        'sombra_min': sombra_min, 'sombra_max': sombra_max,
+    }
+    if usar_local():
+        obtener_pagina = repositorio.historial
+    else:
+        obtener_pagina = lambda cursor, limit, filtros: sheets_client.get_historial_page(cursor, limit, filtros).value
+    paginas = paginas_historial(obtener_pagina, filtros)
+    nombre = f"historial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    
+    if formato == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="La exportación Parquet requiere pyarrow")
+        contenido, media_type = exportar_parquet(paginas, CAMPOS_REGISTRO), "application/vnd.apache.parquet"
+    else:
+        contenido, media_type = exportar_csv(paginas, CAMPOS_REGISTRO, HEADERS), "text/csv"
+    
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
+def validar_consulta_espacial(*puntos):
+    """503 si el índice espacial local aún no tiene datos; 400 si alguna coordenada está fuera de rango"""
+    if not usar_local():
+        raise HTTPException(status_code=503, detail="Índice local no disponible: la base local aún no se sincronizó")
+    for lat, lng in puntos:
+        if not -90 <= lat <= 90:
+            raise HTTPException(status_code=400, detail="La latitud debe estar entre -90 y 90")
+        if not -180 <= lng <= 180:
+            raise HTTPException(status_code=400, detail="La longitud debe estar entre -180 y 180")
+
+@app.get("/api/historial/area")
+async def get_historial_area(
+    lat_min: float,
+    lng_min: float,
+    lat_max: float,
+    lng_max: float,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None,
+    lote: Optional[str] = None,
+    limit: int = 5000
+):
+    """Registros dentro de una caja (la parte visible de un mapa), desde el índice espacial local"""
+    validar_consulta_espacial((lat_min, lng_min), (lat_max, lng_max))
+    if not 1 <= limit <= 50000:
+        raise HTTPException(status_code=400, detail="limit debe estar entre 1 y 50000")
+    
+    filtros = {
+        'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote,
+        'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta,
+    }
+    try:
+        return repositorio.en_area(lat_min, lng_min, lat_max, lng_max, filtros, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/historial/cercanos")
+async def get_historial_cercanos(
+    lat: float,
+    lng: float,
+    k: int = 10,
+    radio_max_m: Optional[float] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None,
+    lote: Optional[str] = None
+):
+    """Los k registros más cercanos a un punto, ordenados por distancia (campo distancia_m)"""
+    validar_consulta_espacial((lat, lng))
+    if not 1 <= k <= 1000:
+        raise HTTPException(status_code=400, detail="k debe estar entre 1 y 1000")
+    
+    filtros = {
+        'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote,
+        'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta,
+    }
+    try:
+        return repositorio.cercanos(lat, lng, k, filtros, radio_max_m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/google-sheets/estado")
+async def get_google_sheets_estado():
+    """Contadores del limitador de cuota de Google Sheets (peticiones, esperas, reintentos, 429)"""
+    if not sheets_client:
+        raise HTTPException(status_code=500, detail="Google Sheets no configurado")
+    
+    return {"success": True, "rate_limiter": sheets_client.rate_limiter.stats()}
+
+@app.get("/api/estadisticas")
+async def get_estadisticas(
+    agrupar: str = "lote",
+    empresa: Optional[str] = None,
+    fundo: Optional[str] = None,
+    sector: Optional[str] = None
+):
+    """
+    Estadísticas de luz/sombra (conteo, promedio, mínimo, máximo y cuantiles) globales y por grupo
+    
+    agrupar: empresa, fundo, sector, lote, dia o semana
+    empresa/fundo/sector: filtran grupos y total; deben ser un prefijo de la clave del
+    nivel (p. ej. empresa+fundo con agrupar=lote), si no se responde 400
+    """
+    filtros = {'empresa': empresa, 'fundo': fundo, 'sector': sector}
+    try:
+        if usar_local():
+            resultado = estadisticas.consultar(agrupar, filtros)
+        elif sheets_client:
+            # Sin base local (p. ej. modo demo): agregados del historial de Sheets
+            resultado = obtener_estadisticas_sheets().consultar(agrupar, filtros)
+        else:
+            raise HTTPException(status_code=500, detail="Google Sheets no configurado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"success": True, "estadisticas": resultado}
+
+@app.get("/api/mapa-calor/{z}/{x}/{y}.{formato}")
+async def get_tesela_mapa_calor(request: Request, z: int, x: int, y: int, formato: str):
+    """
+    Tesela XYZ del mapa de calor de sombra
+    
+    formato=png devuelve una imagen 256×256 (transparente donde no hay registros);
+    formato=json devuelve las celdas con su conteo y sombra promedio.
+    """
+    if not 0 <= z <= 22:
+        raise HTTPException(status_code=400, detail="z debe estar entre 0 y 22")
+    try:
+        mapa_calor.validar(z, x, y, formato)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    etag = f'"{z}-{x}-{y}-{formato}-{mapa_calor.version(z, x, y)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [e.strip() for e in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    contenido = mapa_calor.tesela(z, x, y, formato)
+    
+    media_type = "image/png" if formato == "png" else "application/json"
+    return Response(content=contenido, media_type=media_type, headers=headers)
+
 @app.post("/api/google-sheets/update-headers")
 async def update_headers():
     """Actualiza los headers de Google Sheets"""
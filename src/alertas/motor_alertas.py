@@ -0,0 +1,201 @@
+"""
+Motor de alertas incremental por lote
+Mantiene agregados de porcentaje de sombra por empresa/fundo/sector/lote y evalúa
+reglas configurables con cada registro nuevo, sin releer el historial.
+"""
+
+import math
+import operator
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CLAVES_LOTE = ('empresa', 'fundo', 'sector', 'lote')
+
+OPERADORES = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '<=': operator.le,
+    '<': operator.lt,
+}
+
+# Umbrales en puntos porcentuales (porcentaje_sombra va de 0 a 100)
+REGLAS_POR_DEFECTO = [
+    {'nombre': 'sombra_alta', 'metrica': 'ultimo', 'operador': '>=', 'umbral': 40.0},
+    {'nombre': 'tendencia_sombra', 'metrica': 'ewma', 'operador': '>=', 'umbral': 40.0, 'min_registros': 5},
+]
+
+
+class AgregadoLote:
+    """Agregados acumulados de porcentaje de sombra de un lote, actualizados en O(1)"""
+
+    def __init__(self, alpha_ewma: float = 0.3, tamano_ventana: int = 50):
+        self.alpha_ewma = alpha_ewma
+        self.conteo = 0
+        self.media = 0.0
+        self.ewma = None
+        self.ultimo = None
+        self.ventana = deque(maxlen=tamano_ventana)
+
+    def actualizar(self, porcentaje_sombra: float):
+        """Incorpora un registro nuevo"""
+        self.conteo += 1
+        self.media += (porcentaje_sombra - self.media) / self.conteo
+        if self.ewma is None:
+            self.ewma = porcentaje_sombra
+        else:
+            self.ewma += self.alpha_ewma * (porcentaje_sombra - self.ewma)
+        self.ultimo = porcentaje_sombra
+        self.ventana.append(porcentaje_sombra)
+
+    def copia(self) -> 'AgregadoLote':
+        agregado = AgregadoLote(self.alpha_ewma, self.ventana.maxlen)
+        agregado.conteo, agregado.media, agregado.ewma, agregado.ultimo = self.conteo, self.media, self.ewma, self.ultimo
+        agregado.ventana.extend(self.ventana)
+        return agregado
+
+    def cuantil(self, q: float) -> Optional[float]:
+        """Cuantil q (0..1) de la ventana reciente, con interpolación lineal"""
+        if not self.ventana:
+            return None
+        valores = sorted(self.ventana)
+        posicion = q * (len(valores) - 1)
+        inferior = math.floor(posicion)
+        superior = min(inferior + 1, len(valores) - 1)
+        return valores[inferior] + (valores[superior] - valores[inferior]) * (posicion - inferior)
+
+    def metrica(self, nombre: str) -> Optional[float]:
+        """
+        Valor de una métrica: 'ultimo', 'media', 'ewma', 'conteo' o un cuantil
+        de la ventana como 'p50', 'p90'...
+        """
+        if nombre in ('ultimo', 'media', 'ewma', 'conteo'):
+            return getattr(self, nombre)
+        if nombre.startswith('p') and nombre[1:].isdigit():
+            return self.cuantil(int(nombre[1:]) / 100)
+        raise ValueError(f"Métrica desconocida: {nombre}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'conteo': self.conteo,
+            'media': round(self.media, 2),
+            'ewma': round(self.ewma, 2) if self.ewma is not None else None,
+            'ultimo': self.ultimo,
+            'p50': self.cuantil(0.5),
+            'p90': self.cuantil(0.9),
+        }
+
+
+class MotorAlertas:
+    """Motor de alertas con agregados por lote y reglas evaluadas incrementalmente"""
+
+    def __init__(self, reglas: List[Dict[str, Any]] = None, alpha_ewma: float = 0.3, tamano_ventana: int = 50):
+        self.reglas = reglas if reglas is not None else REGLAS_POR_DEFECTO
+        for regla in self.reglas:
+            if regla['operador'] not in OPERADORES:
+                raise ValueError(f"Operador desconocido en regla {regla['nombre']}: {regla['operador']}")
+        self.alpha_ewma = alpha_ewma
+        self.tamano_ventana = tamano_ventana
+        self.agregados: Dict[Tuple[str, ...], AgregadoLote] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clave_registro(registro: Dict[str, Any]) -> Tuple[str, ...]:
+        """Clave empresa/fundo/sector/lote de un registro"""
+        return tuple(str(registro.get(campo) or '') for campo in CLAVES_LOTE)
+
+    def registrar(self, registro: Dict[str, Any] = None, clave: Tuple[str, ...] = None,
+                  porcentaje_sombra: float = None) -> List[Dict[str, Any]]:
+        """
+        Actualiza los agregados del lote con un registro nuevo y evalúa las reglas
+
+        Args:
+            registro: Registro de procesamiento (usa sus campos de lote y porcentaje_sombra)
+            clave: Clave explícita del grupo (opcional, en lugar de los campos del registro)
+            porcentaje_sombra: Porcentaje explícito (opcional)
+
+        Returns:
+            List[Dict]: Alertas disparadas por este registro
+        """
+        clave, porcentaje_sombra = self._clave_y_sombra(registro, clave, porcentaje_sombra)
+        if porcentaje_sombra is None:
+            return []
+
+        with self._lock:
+            agregado = self.agregados.get(clave)
+            if agregado is None:
+                agregado = self.agregados[clave] = AgregadoLote(self.alpha_ewma, self.tamano_ventana)
+            agregado.actualizar(porcentaje_sombra)
+            return self._evaluar(clave, agregado)
+
+    def simular(self, registro: Dict[str, Any] = None, clave: Tuple[str, ...] = None,
+                porcentaje_sombra: float = None) -> List[Dict[str, Any]]:
+        """
+        Alertas que dispararía un registro, sin modificar los agregados
+
+        Se usa cuando el registro llegará al motor por otra vía (p. ej. la
+        suscripción al repositorio al guardarlo). Mismos argumentos que registrar.
+        """
+        clave, porcentaje_sombra = self._clave_y_sombra(registro, clave, porcentaje_sombra)
+        if porcentaje_sombra is None:
+            return []
+
+        with self._lock:
+            agregado = self.agregados.get(clave)
+            agregado = agregado.copia() if agregado else AgregadoLote(self.alpha_ewma, self.tamano_ventana)
+        agregado.actualizar(porcentaje_sombra)
+        return self._evaluar(clave, agregado)
+
+    def _clave_y_sombra(self, registro: Optional[Dict[str, Any]], clave: Optional[Tuple[str, ...]],
+                        porcentaje_sombra: Optional[float]) -> Tuple[Tuple[str, ...], Optional[float]]:
+        registro = registro or {}
+        if clave is None:
+            clave = self.clave_registro(registro)
+        if porcentaje_sombra is None:
+            porcentaje_sombra = registro.get('porcentaje_sombra')
+        try:
+            return clave, float(porcentaje_sombra)
+        except (TypeError, ValueError):
+            return clave, None
+
+    def cargar_registros(self, registros: Iterable[Dict[str, Any]]) -> int:
+        """Inicializa los agregados a partir de registros existentes (una sola pasada)"""
+        total = 0
+        for registro in registros:
+            self.registrar(registro)
+            total += 1
+        return total
+
+    def _evaluar(self, clave: Tuple[str, ...], agregado: AgregadoLote) -> List[Dict[str, Any]]:
+        alertas = []
+        for regla in self.reglas:
+            if agregado.conteo < regla.get('min_registros', 1):
+                continue
+            valor = agregado.metrica(regla['metrica'])
+            if valor is not None and OPERADORES[regla['operador']](valor, regla['umbral']):
+                alertas.append({
+                    'regla': regla['nombre'],
+                    'metrica': regla['metrica'],
+                    'valor': round(valor, 2),
+                    'umbral': regla['umbral'],
+                    'grupo': dict(zip(CLAVES_LOTE, clave)),
+                })
+        return alertas
+
+    def evaluar(self, clave: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """Evalúa las reglas sobre los agregados actuales de un grupo"""
+        with self._lock:
+            agregado = self.agregados.get(clave)
+            return self._evaluar(clave, agregado) if agregado else []
+
+    def estado(self) -> List[Dict[str, Any]]:
+        """Agregados y alertas activas de todos los grupos"""
+        with self._lock:
+            return [
+                {
+                    'grupo': dict(zip(CLAVES_LOTE, clave)),
+                    'agregados': agregado.to_dict(),
+                    'alertas': self._evaluar(clave, agregado),
+                }
+                for clave, agregado in self.agregados.items()
+            ]
@@ -1,46 +1,135 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
 
-def analizar_intensidad(path_img, path_mask, clases=["sombra", "luz"]):
-    resultados = {}
+from src.procesamiento.generar_mascaras import indexar_imagenes, buscar_imagen, leer_mascara
 
-    for archivo_mask in os.listdir(path_mask):
-        ruta_mask = os.path.join(path_mask, archivo_mask)
-        nombre_base = archivo_mask.replace(".png", "").replace("mask_", "")
-        clase = [c for c in clases if c in archivo_mask]
-        if not clase:
+
+def _agrupar_mascaras(path_mask, clases):
+    """
+    Agrupa los archivos de máscara por imagen base.
+
+    Acepta el formato actual (mask_<base>.png, un mapa de índices) y el formato
+    anterior (mask_<base>_<clase>.png, una máscara binaria por clase).
+
+    Retorna:
+    - dict nombre_base → {"indice": ruta} o {"clases": {clase: ruta}}
+    """
+    grupos = {}
+    for archivo_mask in sorted(os.listdir(path_mask)):
+        if not archivo_mask.startswith("mask_") or not archivo_mask.endswith(".png"):
             continue
-        clase = clase[0]
+        nombre = archivo_mask[len("mask_"):-len(".png")]
+        ruta_mask = os.path.join(path_mask, archivo_mask)
+
+        clase = next((c for c in clases if nombre.endswith(f"_{c}")), None)
+        if clase:
+            nombre_base = nombre[:-len(clase) - 1]
+            grupos.setdefault(nombre_base, {}).setdefault("clases", {})[clase] = ruta_mask
+        else:
+            grupos.setdefault(nombre, {})["indice"] = ruta_mask
+    return grupos
+
 
-        # Imagen correspondiente
-        nombre_img = "_".join(nombre_base.split("_")[:-1]) + ".JPG"
-        ruta_img = os.path.join(path_img, nombre_img)
+def _mapa_etiquetas(grupo, clases):
+    """
+    Construye un mapa de etiquetas (0 = sin clase, i + 1 = clases[i]) para una imagen.
+    """
+    if "indice" in grupo:
+        mapa, clases_mask = leer_mascara(grupo["indice"])
+        # Reordenar índices de la máscara al orden de `clases`
+        remapeo = np.zeros(256, dtype=np.uint8)
+        for i, clase in enumerate(clases_mask):
+            if clase in clases:
+                remapeo[i + 1] = clases.index(clase) + 1
+        return remapeo[mapa]
 
-        img = cv2.imread(ruta_img, cv2.IMREAD_GRAYSCALE)
+    mapa = None
+    for clase, ruta_mask in grupo["clases"].items():
         mask = cv2.imread(ruta_mask, cv2.IMREAD_GRAYSCALE)
-        if img is None or mask is None:
-            print(f"❌ No se pudo cargar {ruta_img} o {ruta_mask}")
+        if mask is None:
+            print(f"❌ No se pudo cargar {ruta_mask}")
             continue
+        if mapa is None:
+            mapa = np.zeros(mask.shape, dtype=np.uint8)
+        mapa[mask == 255] = clases.index(clase) + 1
+    return mapa
+
+
+def estadisticas_por_clase(img, mapa, n_clases):
+    """
+    Calcula conteo, media, std, min, max e histograma de intensidad por clase en una sola
+    pasada con np.bincount sobre códigos (clase, intensidad).
+
+    Parámetros:
+    - img: imagen en escala de grises uint8
+    - mapa: mapa de etiquetas uint8 del mismo tamaño (0 = sin clase)
+    - n_clases: número de clases (sin contar el fondo)
 
-        # Extraer píxeles donde la máscara es blanca (valor 255)
-        pixeles_clase = img[mask == 255]
+    Retorna:
+    - histogramas (n_clases + 1, 256), conteo, suma y suma de cuadrados por clase
+    """
+    codigos = mapa.ravel().astype(np.intp) * 256 + img.ravel()
+    histogramas = np.bincount(codigos, minlength=(n_clases + 1) * 256).reshape(n_clases + 1, 256)
 
-        if len(pixeles_clase) == 0:
-            print(f"⚠️ Máscara sin cobertura útil: {archivo_mask}")
+    niveles = np.arange(256, dtype=np.float64)
+    conteo = histogramas.sum(axis=1)
+    suma = histogramas @ niveles
+    suma_cuadrados = histogramas @ (niveles ** 2)
+    return histogramas, conteo, suma, suma_cuadrados
+
+
+def _analizar_imagen(nombre_base, grupo, ruta_img, clases):
+    img = cv2.imread(ruta_img, cv2.IMREAD_GRAYSCALE) if ruta_img else None
+    mapa = _mapa_etiquetas(grupo, clases)
+    if img is None or mapa is None:
+        print(f"❌ No se pudo cargar la imagen o máscaras de {nombre_base}")
+        return None, {}
+
+    histogramas, conteo, suma, suma_cuadrados = estadisticas_por_clase(img, mapa, len(clases))
+
+    resultados = {}
+    for i, clase in enumerate(clases, start=1):
+        if conteo[i] == 0:
+            if clase in grupo.get("clases", {}):
+                print(f"⚠️ Máscara sin cobertura útil: {grupo['clases'][clase]}")
             continue
 
-        media = np.mean(pixeles_clase)
-        std = np.std(pixeles_clase)
-        min_val = np.min(pixeles_clase)
-        max_val = np.max(pixeles_clase)
-
-        resultados.setdefault(nombre_img, {})[clase] = {
-            "media": round(media, 2),
-            "std": round(std, 2),
-            "min": int(min_val),
-            "max": int(max_val),
-            "pixeles": len(pixeles_clase)
+        media = suma[i] / conteo[i]
+        std = np.sqrt(max(suma_cuadrados[i] / conteo[i] - media ** 2, 0.0))
+        presentes = np.flatnonzero(histogramas[i])
+
+        resultados[clase] = {
+            "media": round(float(media), 2),
+            "std": round(float(std), 2),
+            "min": int(presentes[0]),
+            "max": int(presentes[-1]),
+            "pixeles": int(conteo[i]),
+            "histograma": histogramas[i].tolist()
         }
 
-    return resultados
\ No newline at end of file
+    return os.path.basename(ruta_img), resultados
+
+
+def analizar_intensidad(path_img, path_mask, clases=["sombra", "luz"], max_workers=None):
+    """
+    Calcula estadísticas de intensidad por clase para cada imagen con máscaras,
+    decodificando cada imagen una sola vez y repartiendo las imágenes entre procesos.
+    """
+    grupos = _agrupar_mascaras(path_mask, clases)
+    nombres = list(grupos)
+    n = len(nombres)
+    imagenes = indexar_imagenes(path_img)
+    rutas_img = [buscar_imagen(imagenes, nombre) for nombre in nombres]
+
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for nombre_img, estadisticas in pool.map(
+            _analizar_imagen, nombres, [grupos[k] for k in nombres], rutas_img, [clases] * n
+        ):
+            if nombre_img and estadisticas:
+                resultados[nombre_img] = estadisticas
+
+    return resultados
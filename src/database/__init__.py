@@ -1 +1,11 @@
 # Database package
+"""
+Repositorio local SQLite y sincronización con Google Sheets
+"""
+
+from .repositorio import RepositorioRegistros
+from .sincronizacion import SincronizadorSheets
+from .estadisticas import EstadisticasRegistros
+from .mapa_calor import MapaCalorSombra
+
+__all__ = ['RepositorioRegistros', 'SincronizadorSheets', 'EstadisticasRegistros', 'MapaCalorSombra']
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Estadísticas precalculadas de luz/sombra
+Agregados por empresa/fundo/sector/lote, por día y por semana que se actualizan
+con cada registro nuevo; las consultas recorren los grupos, nunca el historial.
+"""
+
+import math
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Niveles de agrupación: nombre → campos de la clave
+NIVELES = {
+    'empresa': ('empresa',),
+    'fundo': ('empresa', 'fundo'),
+    'sector': ('empresa', 'fundo', 'sector'),
+    'lote': ('empresa', 'fundo', 'sector', 'lote'),
+    'dia': ('fecha',),
+    'semana': ('semana',),
+}
+
+
+class HistogramaPorcentaje:
+    """
+    Sketch de cuantiles para valores en [0, 100]: histograma de ancho fijo
+    (0.5 puntos por defecto), con memoria constante y error máximo de medio bin
+    """
+
+    def __init__(self, bins: int = 200):
+        self.bins = bins
+        self.conteos = [0] * bins
+
+    def agregar(self, valor: float):
+        indice = int(min(max(valor, 0.0), 100.0) / 100.0 * self.bins)
+        self.conteos[min(indice, self.bins - 1)] += 1
+
+    def cuantil(self, q: float) -> Optional[float]:
+        """Cuantil q (0..1) por rango más cercano (ceil(q·n)), en el centro del bin que lo contiene"""
+        total = sum(self.conteos)
+        if not total:
+            return None
+        rango = max(math.ceil(q * total), 1)
+        acumulado = 0
+        for indice, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= rango:
+                return round((indice + 0.5) * 100.0 / self.bins, 2)
+        return 100.0
+
+
+class ResumenPorcentaje:
+    """Media, mínimo, máximo y cuantiles de un porcentaje"""
+
+    def __init__(self):
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = None
+        self.histograma = HistogramaPorcentaje()
+
+    def agregar(self, valor: float):
+        self.suma += valor
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+        self.histograma.agregar(valor)
+
+    def to_dict(self, conteo: int) -> Dict[str, Any]:
+        return {
+            'promedio': round(self.suma / conteo, 2) if conteo else None,
+            'min': self.minimo,
+            'max': self.maximo,
+            'p10': self.histograma.cuantil(0.1),
+            'p50': self.histograma.cuantil(0.5),
+            'p90': self.histograma.cuantil(0.9),
+        }
+
+
+class Agregado:
+    """Agregado de luz y sombra de un grupo de registros"""
+
+    def __init__(self):
+        self.conteo = 0
+        self.luz = ResumenPorcentaje()
+        self.sombra = ResumenPorcentaje()
+
+    def agregar(self, porcentaje_luz: float, porcentaje_sombra: float):
+        self.conteo += 1
+        self.luz.agregar(porcentaje_luz)
+        self.sombra.agregar(porcentaje_sombra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'conteo': self.conteo,
+            'luz': self.luz.to_dict(self.conteo),
+            'sombra': self.sombra.to_dict(self.conteo),
+        }
+
+
+def semana_iso(fecha: str) -> str:
+    """Semana ISO ('2025-W03') de una fecha YYYY-MM-DD ('' si no es válida)"""
+    try:
+        anio, semana, _ = datetime.strptime(fecha[:10], '%Y-%m-%d').isocalendar()
+    except (TypeError, ValueError):
+        return ''
+    return f'{anio}-W{semana:02d}'
+
+
+class EstadisticasRegistros:
+    """Agregados de todos los niveles de NIVELES, actualizados en O(niveles) por registro"""
+
+    def __init__(self):
+        self.total = Agregado()
+        self.grupos: Dict[str, Dict[Tuple[str, ...], Agregado]] = {nivel: {} for nivel in NIVELES}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _numero(valor: Any) -> Optional[float]:
+        try:
+            return float(valor) if valor not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    def agregar(self, record: Dict[str, Any]):
+        """Incorpora un registro (se ignora si no tiene porcentajes)"""
+        luz = self._numero(record.get('porcentaje_luz'))
+        sombra = self._numero(record.get('porcentaje_sombra'))
+        if luz is None and sombra is None:
+            return
+        luz = luz if luz is not None else 100.0 - sombra
+        sombra = sombra if sombra is not None else 100.0 - luz
+
+        valores = {campo: str(record.get(campo) or '') for campo in ('empresa', 'fundo', 'sector', 'lote')}
+        valores['fecha'] = str(record.get('fecha') or '')[:10]
+        valores['semana'] = semana_iso(valores['fecha'])
+
+        with self._lock:
+            self.total.agregar(luz, sombra)
+            for nivel, campos in NIVELES.items():
+                clave = tuple(valores[campo] for campo in campos)
+                agregado = self.grupos[nivel].get(clave)
+                if agregado is None:
+                    agregado = self.grupos[nivel][clave] = Agregado()
+                agregado.agregar(luz, sombra)
+
+    def agregar_registros(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.agregar(record)
+
+    def consultar(self, agrupar: str = 'lote', filtros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Estadísticas globales y por grupo
+
+        Args:
+            agrupar: Nivel de NIVELES
+            filtros: Igualdad sobre los primeros campos de la clave del nivel
+                (p. ej. empresa, o empresa y fundo); 'total' se limita a ellos
+
+        Returns:
+            Dict: {'total': {...}, 'agrupar': nivel, 'grupos': [{...campos, conteo, luz, sombra}]}
+
+        Raises:
+            ValueError: Si el nivel no existe o los filtros no son un prefijo de su clave
+        """
+        if agrupar not in NIVELES:
+            raise ValueError(f"agrupar debe ser uno de: {', '.join(NIVELES)}")
+
+        campos = NIVELES[agrupar]
+        filtros = {k: v for k, v in (filtros or {}).items() if v not in (None, '')}
+        prefijo = campos[:len(filtros)]
+        if set(filtros) != set(prefijo):
+            if agrupar in ('dia', 'semana'):
+                raise ValueError(f"agrupar={agrupar} no admite filtros de empresa/fundo/sector")
+            validos = ', '.join('+'.join(campos[:i + 1]) for i in range(len(campos)))
+            raise ValueError(f"Con agrupar={agrupar} solo se puede filtrar por: {validos}")
+
+        with self._lock:
+            grupos: List[Dict[str, Any]] = []
+            for clave in sorted(self.grupos[agrupar]):
+                valores = dict(zip(campos, clave))
+                if any(valores[campo] != valor for campo, valor in filtros.items()):
+                    continue
+                grupos.append({**valores, **self.grupos[agrupar][clave].to_dict()})
+
+            if filtros:
+                # Los filtros forman la clave de un nivel superior: su agregado es el total filtrado
+                nivel_total = next(nivel for nivel, claves in NIVELES.items() if claves == prefijo)
+                agregado = self.grupos[nivel_total].get(tuple(filtros[campo] for campo in prefijo))
+                total = (agregado or Agregado()).to_dict()
+            else:
+                total = self.total.to_dict()
+
+        return {'total': total, 'agrupar': agrupar, 'grupos': grupos}
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Mapa de calor de sombra en teselas XYZ
+El porcentaje de sombra se agrega en una rejilla (Web Mercator) para cada nivel
+de zoom, se actualiza con cada registro nuevo y las teselas PNG/JSON ya
+generadas se guardan en caché hasta que cambian sus celdas.
+"""
+
+import io
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from src.services.respuestas import serializar_json
+
+TAMANO_TESELA = 256
+
+# Rampa de color de sombra (porcentaje → RGB): poca sombra en amarillo, mucha en verde oscuro
+RAMPA_SOMBRA = (
+    (0.0, (255, 237, 160)),
+    (25.0, (254, 178, 76)),
+    (50.0, (161, 217, 155)),
+    (75.0, (49, 163, 84)),
+    (100.0, (0, 68, 27)),
+)
+
+
+def _color(porcentaje: float) -> Tuple[int, int, int]:
+    porcentaje = min(max(porcentaje, 0.0), 100.0)
+    for (p0, c0), (p1, c1) in zip(RAMPA_SOMBRA, RAMPA_SOMBRA[1:]):
+        if porcentaje <= p1:
+            t = (porcentaje - p0) / (p1 - p0)
+            return tuple(round(a + (b - a) * t) for a, b in zip(c0, c1))
+    return RAMPA_SOMBRA[-1][1]
+
+
+def mercator(latitud: float, longitud: float) -> Tuple[float, float]:
+    """Coordenadas Web Mercator normalizadas a [0, 1) (x hacia el este, y hacia el sur)"""
+    latitud = min(max(latitud, -85.05112878), 85.05112878)
+    x = (longitud + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(math.radians(latitud))) / math.pi) / 2.0
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+class MapaCalorSombra:
+    """
+    Rejilla de sombra por nivel de zoom
+
+    - celdas[z][(tx, ty)] → {(cx, cy): [conteo, suma_sombra]} con resolucion × resolucion celdas por tesela
+    - Por encima de zoom_max las teselas se recortan de su antecesora en zoom_max
+    """
+
+    def __init__(self, zoom_min: int = 8, zoom_max: int = 17, resolucion: int = 32,
+                 max_teselas_cache: int = 2048):
+        self.zoom_min = zoom_min
+        self.zoom_max = zoom_max
+        self.resolucion = resolucion
+        self.max_teselas_cache = max_teselas_cache
+        self.celdas: Dict[int, Dict[Tuple[int, int], Dict[Tuple[int, int], list]]] = {
+            z: {} for z in range(zoom_min, zoom_max + 1)
+        }
+        # Versión de cada tesela base: cambia con cada registro y forma parte de la clave de caché
+        self._versiones: Dict[Tuple[int, int, int], int] = {}
+        self._cache: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _numero(valor: Any) -> Optional[float]:
+        try:
+            return float(valor) if valor not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    def agregar(self, record: Dict[str, Any]):
+        """Incorpora un registro (se ignora si no tiene coordenadas o porcentaje de sombra)"""
+        latitud = self._numero(record.get('latitud'))
+        longitud = self._numero(record.get('longitud'))
+        sombra = self._numero(record.get('porcentaje_sombra'))
+        if sombra is None and self._numero(record.get('porcentaje_luz')) is not None:
+            sombra = 100.0 - self._numero(record.get('porcentaje_luz'))
+        if latitud is None or longitud is None or sombra is None:
+            return
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180) or (latitud == 0 and longitud == 0):
+            return
+
+        x, y = mercator(latitud, longitud)
+        with self._lock:
+            for z, teselas in self.celdas.items():
+                escala = (1 << z) * self.resolucion
+                gx, gy = int(x * escala), int(y * escala)
+                tesela = (gx // self.resolucion, gy // self.resolucion)
+                celda = (gx % self.resolucion, gy % self.resolucion)
+                acumulado = teselas.setdefault(tesela, {}).setdefault(celda, [0, 0.0])
+                acumulado[0] += 1
+                acumulado[1] += sombra
+                clave = (z,) + tesela
+                self._versiones[clave] = self._versiones.get(clave, 0) + 1
+
+    def agregar_registros(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.agregar(record)
+
+    def _base(self, z: int, x: int, y: int) -> Optional[Tuple[int, int, int]]:
+        """Tesela con datos propios de la que sale (z, x, y): ella misma o su antecesora en zoom_max"""
+        if z < self.zoom_min:
+            return None
+        if z <= self.zoom_max:
+            return z, x, y
+        escala = 1 << (z - self.zoom_max)
+        return self.zoom_max, x // escala, y // escala
+
+    def version(self, z: int, x: int, y: int) -> int:
+        """Versión de los datos de una tesela (0 si no tiene registros)"""
+        base = self._base(z, x, y)
+        return self._versiones.get(base, 0) if base else 0
+
+    def celdas_tesela(self, z: int, x: int, y: int) -> Dict[str, Any]:
+        """
+        Celdas de una tesela en formato vectorial
+
+        Returns:
+            Dict: {'z', 'x', 'y', 'resolucion', 'celdas': [{'x', 'y', 'conteo', 'promedio'}]};
+            x/y de cada celda van de 0 a resolucion - 1 dentro de la tesela. Por encima
+            de zoom_max se devuelve la tesela base (no hay más detalle).
+        """
+        base = self._base(z, x, y)
+        if base is None:
+            return {'z': z, 'x': x, 'y': y, 'resolucion': self.resolucion, 'celdas': []}
+
+        with self._lock:
+            celdas = dict(self.celdas[base[0]].get(base[1:], {}))
+        return {
+            'z': base[0], 'x': base[1], 'y': base[2],
+            'resolucion': self.resolucion,
+            'celdas': [
+                {'x': cx, 'y': cy, 'conteo': conteo, 'promedio': round(suma / conteo, 2)}
+                for (cx, cy), (conteo, suma) in sorted(celdas.items())
+            ]
+        }
+
+    @staticmethod
+    def validar(z: int, x: int, y: int, formato: str):
+        """Lanza ValueError si el formato no existe o la tesela está fuera del mundo"""
+        if formato not in ('png', 'json'):
+            raise ValueError("formato debe ser 'png' o 'json'")
+        if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError("Tesela fuera del mundo")
+
+    def tesela(self, z: int, x: int, y: int, formato: str = 'png') -> bytes:
+        """
+        Tesela XYZ ya generada (de la caché si sus datos no cambiaron)
+
+        Args:
+            z, x, y: Coordenadas de la tesela
+            formato: 'png' (raster 256×256) o 'json' (celdas)
+
+        Returns:
+            bytes: PNG o JSON UTF-8
+        """
+        self.validar(z, x, y, formato)
+
+        clave = (z, x, y, formato, self.version(z, x, y))
+        with self._lock:
+            contenido = self._cache.get(clave)
+            if contenido is not None:
+                self._cache.move_to_end(clave)
+                return contenido
+
+        if formato == 'json':
+            contenido = serializar_json(self.celdas_tesela(z, x, y))
+        else:
+            contenido = self._png(z, x, y)
+
+        with self._lock:
+            self._cache[clave] = contenido
+            while len(self._cache) > self.max_teselas_cache:
+                self._cache.popitem(last=False)
+        return contenido
+
+    def _png(self, z: int, x: int, y: int) -> bytes:
+        base = self._base(z, x, y)
+        imagen = Image.new('RGBA', (self.resolucion, self.resolucion), (0, 0, 0, 0))
+        if base is not None:
+            with self._lock:
+                celdas = dict(self.celdas[base[0]].get(base[1:], {}))
+            pixeles = imagen.load()
+            for (cx, cy), (conteo, suma) in celdas.items():
+                pixeles[cx, cy] = _color(suma / conteo) + (200,)
+
+        if base is not None and z > base[0]:
+            # Recorte de la tesela base correspondiente a (x, y)
+            escala = 1 << (z - base[0])
+            lado = self.resolucion / escala
+            x0, y0 = (x % escala) * lado, (y % escala) * lado
+            imagen = imagen.resize((TAMANO_TESELA, TAMANO_TESELA), Image.NEAREST, box=(x0, y0, x0 + lado, y0 + lado))
+        else:
+            imagen = imagen.resize((TAMANO_TESELA, TAMANO_TESELA), Image.NEAREST)
+
+        salida = io.BytesIO()
+        imagen.save(salida, format='PNG')
+        return salida.getvalue()
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Repositorio local de registros en SQLite
+Base de datos principal de procesamientos y datos de campo; Google Sheets se
+sincroniza en segundo plano (ver sincronizacion.py).
+"""
+
+import base64
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.google_sheets.field_index import FieldDataIndex
+from src.metadata import geohash
+
+# Columnas de un registro, en el mismo orden que HEADERS de la hoja
+CAMPOS_REGISTRO = (
+    'id', 'fecha', 'hora', 'imagen', 'nombre_archivo',
+    'empresa', 'fundo', 'sector', 'lote', 'hilera', 'numero_planta',
+    'latitud', 'longitud', 'porcentaje_luz', 'porcentaje_sombra',
+    'dispositivo', 'software', 'direccion', 'timestamp'
+)
+
+CAMPOS_CAMPO = ('empresa', 'fundo', 'sector', 'lote')
+
+# Filtros de texto (coincidencia exacta) admitidos por historial/estadísticas
+FILTROS_TEXTO = ('empresa', 'fundo', 'sector', 'lote')
+
+# Precisión del geohash guardado con cada registro (~5 m); las consultas usan sus prefijos
+PRECISION_GEOHASH = 9
+
+RADIO_TIERRA_M = 6371008.8
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    fecha TEXT,
+    hora TEXT,
+    imagen TEXT,
+    nombre_archivo TEXT,
+    empresa TEXT,
+    fundo TEXT,
+    sector TEXT,
+    lote TEXT,
+    hilera TEXT,
+    numero_planta TEXT,
+    latitud REAL,
+    longitud REAL,
+    porcentaje_luz REAL,
+    porcentaje_sombra REAL,
+    dispositivo TEXT,
+    software TEXT,
+    direccion TEXT,
+    timestamp TEXT,
+    sincronizado INTEGER NOT NULL DEFAULT 0,
+    geohash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_registros_fecha ON registros (fecha);
+CREATE INDEX IF NOT EXISTS idx_registros_lote ON registros (empresa, fundo, sector, lote);
+CREATE INDEX IF NOT EXISTS idx_registros_planta ON registros (hilera, numero_planta);
+CREATE INDEX IF NOT EXISTS idx_registros_pendientes ON registros (seq) WHERE sincronizado = 0;
+
+CREATE TABLE IF NOT EXISTS campo (
+    empresa TEXT NOT NULL,
+    fundo TEXT NOT NULL,
+    sector TEXT NOT NULL,
+    lote TEXT NOT NULL,
+    PRIMARY KEY (empresa, fundo, sector, lote)
+) WITHOUT ROWID;
+"""
+
+
+class RepositorioRegistros:
+    """
+    Almacén SQLite (modo WAL) de registros de procesamiento y datos de campo
+
+    Cada hilo usa su propia conexión, de modo que las lecturas no esperan a las
+    escrituras; las escrituras se serializan con un lock.
+    """
+
+    def __init__(self, db_path: str = 'agricola.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._suscriptores: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._indice_campo: Optional[FieldDataIndex] = None
+        self.modificado_en = time.time()
+
+        conn = self._conexion()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(ESQUEMA)
+        self._migrar_geohash(conn)
+
+    def _migrar_geohash(self, conn: sqlite3.Connection):
+        """Añade la columna geohash a bases creadas antes del índice espacial y la rellena"""
+        columnas = {row['name'] for row in conn.execute('PRAGMA table_info(registros)')}
+        with conn:
+            if 'geohash' not in columnas:
+                conn.execute('ALTER TABLE registros ADD COLUMN geohash TEXT')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_registros_geohash ON registros (geohash) WHERE geohash IS NOT NULL'
+            )
+            pendientes = conn.execute(
+                'SELECT seq, latitud, longitud FROM registros WHERE geohash IS NULL '
+                'AND latitud IS NOT NULL AND longitud IS NOT NULL'
+            ).fetchall()
+            conn.executemany('UPDATE registros SET geohash = ? WHERE seq = ?', [
+                (self._geohash(row['latitud'], row['longitud']), row['seq']) for row in pendientes
+            ])
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _clave(record: Dict[str, Any]) -> str:
+        """Id del registro; si la fila no tiene id se usa timestamp + imagen"""
+        if record.get('id') not in (None, ''):
+            return str(record['id'])
+        return f"{record.get('timestamp', '')}|{record.get('imagen', '')}"
+
+    @staticmethod
+    def _numero(valor: Any) -> Optional[float]:
+        try:
+            return float(valor) if valor not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _geohash(latitud: Optional[float], longitud: Optional[float]) -> Optional[str]:
+        if latitud is None or longitud is None or not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            return None
+        return geohash.encode(latitud, longitud, PRECISION_GEOHASH)
+
+    def _fila(self, record: Dict[str, Any], sincronizado: bool) -> tuple:
+        valores = []
+        for campo in CAMPOS_REGISTRO:
+            if campo == 'id':
+                valores.append(self._clave(record))
+            elif campo in ('latitud', 'longitud', 'porcentaje_luz', 'porcentaje_sombra'):
+                valores.append(self._numero(record.get(campo)))
+            else:
+                valor = record.get(campo)
+                valores.append('' if valor is None else str(valor))
+        latitud, longitud = valores[CAMPOS_REGISTRO.index('latitud')], valores[CAMPOS_REGISTRO.index('longitud')]
+        return tuple(valores) + (int(sincronizado), self._geohash(latitud, longitud))
+
+    def _insertar(self, records: Iterable[Dict[str, Any]], sincronizado: bool) -> int:
+        columnas = ', '.join(CAMPOS_REGISTRO + ('sincronizado', 'geohash'))
+        marcadores = ', '.join('?' * (len(CAMPOS_REGISTRO) + 2))
+        filas = [self._fila(r, sincronizado) for r in records]
+        if not filas:
+            return 0
+
+        sql = f'INSERT OR IGNORE INTO registros ({columnas}) VALUES ({marcadores})'
+        with self._write_lock:
+            conn = self._conexion()
+            with conn:
+                nuevos = [fila for fila in filas if conn.execute(sql, fila).rowcount]
+            if nuevos:
+                self.modificado_en = time.time()
+                self._notificar([dict(zip(CAMPOS_REGISTRO, fila)) for fila in nuevos])
+            return len(nuevos)
+
+    def suscribir(self, callback: Callable[[List[Dict[str, Any]]], None], lote: int = 5000):
+        """
+        Registra una función que recibe los registros insertados
+
+        Primero se le entregan todos los registros existentes (en lotes) y después
+        cada inserción nueva, sin huecos ni duplicados entre ambas fases.
+        """
+        columnas = ', '.join(CAMPOS_REGISTRO)
+        with self._write_lock:
+            cursor = self._conexion().execute(f'SELECT {columnas} FROM registros ORDER BY seq')
+            while True:
+                rows = cursor.fetchmany(lote)
+                if not rows:
+                    break
+                callback([dict(row) for row in rows])
+            self._suscriptores.append(callback)
+
+    def _notificar(self, records: List[Dict[str, Any]]):
+        for callback in self._suscriptores:
+            try:
+                callback(records)
+            except Exception as e:
+                print(f"❌ Error notificando registros nuevos: {e}")
+
+    def insertar(self, record: Dict[str, Any]) -> bool:
+        """
+        Guarda un registro nuevo, pendiente de enviar a Google Sheets
+
+        Args:
+            record: Diccionario con los datos del procesamiento
+
+        Returns:
+            bool: True si se insertó (False si el id ya existía)
+        """
+        return self._insertar([record], sincronizado=False) == 1
+
+    def importar(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Guarda registros que ya existen en Google Sheets (se ignoran los ids repetidos)
+
+        Returns:
+            int: Número de registros nuevos
+        """
+        return self._insertar(records, sincronizado=True)
+
+    def pendientes(self, limite: int = 50) -> List[Dict[str, Any]]:
+        """Registros aún no enviados a Google Sheets, en orden de inserción"""
+        columnas = ', '.join(('seq',) + CAMPOS_REGISTRO)
+        rows = self._conexion().execute(
+            f'SELECT {columnas} FROM registros WHERE sincronizado = 0 ORDER BY seq LIMIT ?', (limite,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def marcar_sincronizados(self, seqs: List[int]):
+        """Marca como enviados los registros indicados"""
+        if not seqs:
+            return
+        with self._write_lock:
+            conn = self._conexion()
+            with conn:
+                conn.executemany('UPDATE registros SET sincronizado = 1 WHERE seq = ?', [(s,) for s in seqs])
+
+    def contar_pendientes(self) -> int:
+        """Número de registros aún no enviados a Google Sheets"""
+        return self._conexion().execute('SELECT COUNT(*) FROM registros WHERE sincronizado = 0').fetchone()[0]
+
+    def contar(self) -> int:
+        return self._conexion().execute('SELECT COUNT(*) FROM registros').fetchone()[0]
+
+    def _where(self, filtros: Optional[Dict[str, Any]]) -> tuple:
+        """Construye la cláusula WHERE (y sus parámetros) de los filtros del historial"""
+        condiciones, parametros = [], []
+        filtros = {k: v for k, v in (filtros or {}).items() if v not in (None, '')}
+
+        for campo in FILTROS_TEXTO:
+            if campo in filtros:
+                condiciones.append(f'{campo} = ?')
+                parametros.append(filtros[campo])
+        if 'fecha_desde' in filtros:
+            condiciones.append('fecha >= ?')
+            parametros.append(filtros['fecha_desde'])
+        if 'fecha_hasta' in filtros:
+            condiciones.append('fecha <= ?')
+            parametros.append(filtros['fecha_hasta'])
+        for campo, prefijo in (('porcentaje_luz', 'luz'), ('porcentaje_sombra', 'sombra')):
+            if f'{prefijo}_min' in filtros:
+                condiciones.append(f'COALESCE({campo}, 0) >= ?')
+                parametros.append(filtros[f'{prefijo}_min'])
+            if f'{prefijo}_max' in filtros:
+                condiciones.append(f'COALESCE({campo}, 0) <= ?')
+                parametros.append(filtros[f'{prefijo}_max'])
+
+        return condiciones, parametros
+
+    def historial(self, cursor: Optional[str] = None, limit: int = 1000,
+                  filtros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Página del historial en orden de inserción (paginación por clave)
+
+        Args:
+            cursor: Cursor devuelto por la página anterior (None para empezar)
+            limit: Número máximo de registros
+            filtros: Mismos filtros que GoogleSheetsClient.get_historial_page
+
+        Returns:
+            Dict: {'success', 'procesamientos', 'next_cursor', 'total'}; total cuenta
+            los registros que cumplen los filtros
+        """
+        condiciones, parametros = self._where(filtros)
+        if condiciones:
+            total = self._conexion().execute(
+                f'SELECT COUNT(*) FROM registros WHERE {" AND ".join(condiciones)}', parametros
+            ).fetchone()[0]
+        else:
+            total = self.contar()
+
+        condiciones.append('seq > ?')
+        parametros.append(self._decodificar_cursor(cursor))
+
+        columnas = ', '.join(('seq',) + CAMPOS_REGISTRO)
+        rows = self._conexion().execute(
+            f'SELECT {columnas} FROM registros WHERE {" AND ".join(condiciones)} ORDER BY seq LIMIT ?',
+            parametros + [limit + 1]
+        ).fetchall()
+
+        siguiente = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            siguiente = self._codificar_cursor(rows[-1]['seq'])
+
+        return {
+            'success': True,
+            'procesamientos': [self._registro(row) for row in rows],
+            'next_cursor': siguiente,
+            'total': total
+        }
+
+    def en_area(self, lat_min: float, lng_min: float, lat_max: float, lng_max: float,
+                filtros: Optional[Dict[str, Any]] = None, limit: int = 5000) -> Dict[str, Any]:
+        """
+        Registros dentro de una caja (p. ej. la parte visible de un mapa)
+
+        La caja se cubre con prefijos geohash y cada prefijo es un rango del
+        índice idx_registros_geohash; después se descartan los puntos fuera de la caja.
+
+        Args:
+            lat_min, lng_min, lat_max, lng_max: Límites de la caja en grados
+            filtros: Mismos filtros que historial (fecha_desde, fecha_hasta, empresa...)
+            limit: Número máximo de registros
+
+        Returns:
+            Dict: {'success', 'procesamientos', 'total', 'truncado'}; con truncado=True
+            faltan registros (conviene acercar el mapa o usar una capa agregada)
+        """
+        if lat_min > lat_max or lng_min > lng_max:
+            raise ValueError("La caja debe cumplir lat_min <= lat_max y lng_min <= lng_max")
+
+        rows = self._en_caja(lat_min, lng_min, lat_max, lng_max, filtros, limit + 1)
+        return {
+            'success': True,
+            'procesamientos': [self._registro(row) for row in rows[:limit]],
+            'total': min(len(rows), limit),
+            'truncado': len(rows) > limit
+        }
+
+    def cercanos(self, latitud: float, longitud: float, k: int = 10,
+                 filtros: Optional[Dict[str, Any]] = None, radio_max_m: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Los k registros más cercanos a un punto
+
+        Busca en cajas crecientes alrededor del punto hasta que los k mejores
+        quedan dentro del círculo inscrito en la caja (así ninguno más cercano
+        puede estar fuera).
+
+        Args:
+            latitud, longitud: Punto de referencia
+            k: Número de registros
+            filtros: Mismos filtros que historial
+            radio_max_m: Distancia máxima en metros (opcional)
+
+        Returns:
+            Dict: {'success', 'procesamientos'} ordenados por distancia, cada uno con 'distancia_m'
+        """
+        radio_max = radio_max_m if radio_max_m is not None else math.pi * RADIO_TIERRA_M
+        radio = min(50.0, radio_max)
+        while True:
+            lat_delta = math.degrees(radio / RADIO_TIERRA_M)
+            lng_delta = lat_delta / max(math.cos(math.radians(latitud)), 1e-6)
+            rows = self._en_caja(latitud - lat_delta, longitud - lng_delta,
+                                 latitud + lat_delta, longitud + lng_delta, filtros)
+            distancias = sorted(
+                ((self._distancia(latitud, longitud, row['latitud'], row['longitud']), row) for row in rows),
+                key=lambda par: par[0]
+            )
+            candidatos = [(d, row) for d, row in distancias if d <= radio]
+            if len(candidatos) >= k or radio >= radio_max:
+                break
+            if len(distancias) >= k:
+                # La caja ya tiene k puntos: el k-ésimo marca el radio que asegura el resultado
+                radio = min(distancias[k - 1][0], radio_max)
+            else:
+                # Se amplía más rápido cuanto más vacía está la zona
+                radio = min(radio * (2 if distancias else 4), radio_max)
+
+        procesamientos = []
+        for distancia, row in candidatos[:k]:
+            record = self._registro(row)
+            record['distancia_m'] = round(distancia, 1)
+            procesamientos.append(record)
+        return {'success': True, 'procesamientos': procesamientos}
+
+    def _en_caja(self, lat_min: float, lng_min: float, lat_max: float, lng_max: float,
+                 filtros: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[sqlite3.Row]:
+        celdas = geohash.cover(lat_min, lng_min, lat_max, lng_max, max_precision=PRECISION_GEOHASH)
+        condiciones, parametros = self._where(filtros)
+        # '{' es el carácter siguiente a 'z': [prefijo, prefijo + '{') son los geohash con ese prefijo
+        rangos = ' OR '.join('(geohash >= ? AND geohash < ?)' for _ in celdas)
+        condiciones = [f'({rangos})', 'latitud BETWEEN ? AND ?', 'longitud BETWEEN ? AND ?'] + condiciones
+        parametros = [v for celda in celdas for v in (celda, celda + '{')] + \
+            [lat_min, lat_max, lng_min, lng_max] + parametros
+
+        columnas = ', '.join(('seq',) + CAMPOS_REGISTRO)
+        # Con muchos rangos el planificador prefiere recorrer la tabla; se fuerza el índice espacial.
+        # Sin ORDER BY el LIMIT corta el recorrido del índice (los registros salen en orden geohash)
+        sql = f'SELECT {columnas} FROM registros INDEXED BY idx_registros_geohash WHERE {" AND ".join(condiciones)}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parametros.append(limit)
+        return self._conexion().execute(sql, parametros).fetchall()
+
+    @staticmethod
+    def _distancia(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+        """Distancia haversine en metros"""
+        p1, p2 = math.radians(lat1), math.radians(lat2)
+        a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+        return 2 * RADIO_TIERRA_M * math.asin(min(1.0, math.sqrt(a)))
+
+    @staticmethod
+    def _registro(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        del record['seq']
+        record['porcentaje_luz'] = record['porcentaje_luz'] or 0
+        record['porcentaje_sombra'] = record['porcentaje_sombra'] or 0
+        return record
+
+    @staticmethod
+    def _codificar_cursor(seq: int) -> str:
+        return base64.urlsafe_b64encode(f's{seq}'.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decodificar_cursor(cursor: Optional[str]) -> int:
+        if not cursor:
+            return 0
+        try:
+            texto = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            if not texto.startswith('s'):
+                raise ValueError(texto)
+            return int(texto[1:])
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Cursor inválido: {cursor}")
+
+    def estadisticas(self, filtros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Resumen de luz/sombra de los registros que cumplen los filtros
+
+        Returns:
+            Dict: total, promedio/mínimo/máximo de luz y sombra
+        """
+        condiciones, parametros = self._where(filtros)
+        where = f'WHERE {" AND ".join(condiciones)}' if condiciones else ''
+        row = self._conexion().execute(
+            f"""SELECT COUNT(*) AS total,
+                       AVG(porcentaje_luz) AS promedio_luz, MIN(porcentaje_luz) AS min_luz,
+                       MAX(porcentaje_luz) AS max_luz,
+                       AVG(porcentaje_sombra) AS promedio_sombra, MIN(porcentaje_sombra) AS min_sombra,
+                       MAX(porcentaje_sombra) AS max_sombra
+                FROM registros {where}""",
+            parametros
+        ).fetchone()
+        return dict(row)
+
+    def reemplazar_campo(self, filas: Iterable[Dict[str, Any]]) -> int:
+        """
+        Reemplaza los datos de campo (empresa/fundo/sector/lote) por los de la hoja
+
+        Si coinciden con los guardados no se escribe nada (el índice y
+        modificado_en se conservan).
+
+        Returns:
+            int: Número de lotes guardados
+        """
+        valores = {
+            tuple(str(f.get(c) or '').strip() for c in CAMPOS_CAMPO)
+            for f in filas
+        }
+        valores = {v for v in valores if all(v)}
+
+        with self._write_lock:
+            conn = self._conexion()
+            actuales = {tuple(row) for row in conn.execute('SELECT empresa, fundo, sector, lote FROM campo')}
+            if actuales == valores:
+                return len(valores)
+            with conn:
+                conn.execute('DELETE FROM campo')
+                conn.executemany('INSERT INTO campo VALUES (?, ?, ?, ?)', valores)
+            self._indice_campo = None
+            self.modificado_en = time.time()
+        return len(valores)
+
+    def indice_campo(self) -> FieldDataIndex:
+        """
+        Índice de los datos de campo (se reconstruye solo cuando cambian)
+
+        Returns:
+            FieldDataIndex: Índice para consultas de hijos y búsqueda por prefijo
+        """
+        indice = self._indice_campo
+        if indice is None:
+            rows = self._conexion().execute('SELECT empresa, fundo, sector, lote FROM campo').fetchall()
+            indice = self._indice_campo = FieldDataIndex(dict(row) for row in rows)
+        return indice
+
+    def datos_campo(self) -> Dict[str, Any]:
+        """
+        Datos de campo en el formato de GoogleSheetsClient.get_field_data
+
+        Returns:
+            Dict: Listas únicas ordenadas y estructura jerárquica
+        """
+        return self.indice_campo().to_dict()
+
+    def tiene_datos(self) -> bool:
+        """Indica si hay registros o datos de campo guardados"""
+        conn = self._conexion()
+        return bool(
+            conn.execute('SELECT 1 FROM registros LIMIT 1').fetchone()
+            or conn.execute('SELECT 1 FROM campo LIMIT 1').fetchone()
+        )
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Sincronización en segundo plano entre el repositorio SQLite y Google Sheets
+Los registros se escriben primero en local y se envían a la hoja en lotes; los
+datos de la hoja (historial y Data-campo) se copian periódicamente a local.
+"""
+
+import atexit
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.google_sheets.sheets_client import GoogleSheetsClient
+from src.google_sheets.write_behind import WriteBehindWriter
+from .repositorio import RepositorioRegistros, CAMPOS_REGISTRO
+
+
+class SpoolRepositorio:
+    """
+    Spool de WriteBehindWriter respaldado por el repositorio
+
+    Los registros pendientes son los de sincronizado = 0; confirmar un lote los
+    marca como enviados.
+    """
+
+    def __init__(self, repositorio: RepositorioRegistros):
+        self.repositorio = repositorio
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        return self.repositorio.insertar(record)
+
+    def pending(self, limit: int) -> List[Tuple[int, List[Any]]]:
+        return [(r['seq'], GoogleSheetsClient.record_to_row(r)) for r in self.repositorio.pendientes(limit)]
+
+    def acknowledge(self, keys: List[int]):
+        self.repositorio.marcar_sincronizados(keys)
+
+    def __len__(self) -> int:
+        return self.repositorio.contar_pendientes()
+
+
+class SincronizadorSheets:
+    """
+    Mantiene sincronizados el repositorio local y Google Sheets
+
+    - Envío: un WriteBehindWriter con el repositorio como spool agrega a la hoja
+      los registros con sincronizado = 0 en lotes de `batch_size` con un único
+      append; solo se marcan al confirmarse. El mismo escritor atiende
+      GoogleSheetsClient.add_processing_record.
+    - Recepción: cada `intervalo_lectura` segundos un hilo copia a local las
+      filas nuevas del historial y los datos de campo.
+    """
+
+    def __init__(
+        self,
+        repositorio: RepositorioRegistros,
+        client: GoogleSheetsClient,
+        batch_size: int = 50,
+        intervalo_envio: float = 2.0,
+        intervalo_lectura: float = 60.0
+    ):
+        self.repositorio = repositorio
+        self.client = client
+        self.intervalo_lectura = intervalo_lectura
+
+        spreadsheet_id, sheet_name = self._destino()
+        self.writer = WriteBehindWriter(
+            client, spreadsheet_id, sheet_name,
+            batch_size=batch_size,
+            flush_interval_ms=int(intervalo_envio * 1000),
+            spool=SpoolRepositorio(repositorio)
+        )
+        client.use_writer(self.writer)
+
+        # listo: hay datos locales utilizables (de una ejecución anterior o de la primera lectura)
+        self.listo = threading.Event()
+        if repositorio.tiene_datos():
+            self.listo.set()
+
+        # Cursor de la copia del historial del cliente hasta el que ya se importó
+        self._cursor_historial = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _destino(self) -> tuple:
+        """spreadsheet_id y sheet_name configurados (spreadsheet_id None en modo demo)"""
+        config = self.client._load_config()
+        spreadsheet_id = config.get('spreadsheet_id')
+        if not spreadsheet_id or spreadsheet_id == 'demo':
+            return None, None
+        return spreadsheet_id, config.get('sheet_name', 'Data-app')
+
+    def iniciar(self) -> 'SincronizadorSheets':
+        """Inicia el envío y el hilo de lectura y registra el vaciado al cerrar el proceso"""
+        if self._thread is None:
+            self.writer.start()
+            self._thread = threading.Thread(target=self._run, name='sheets-sync', daemon=True)
+            self._thread.start()
+            atexit.register(self.detener)
+        return self
+
+    def registrar(self, record: Dict[str, Any]) -> bool:
+        """
+        Guarda un registro en local y programa su envío a Google Sheets
+
+        Args:
+            record: Diccionario con los datos del procesamiento
+
+        Returns:
+            bool: True si se guardó (False si el id ya existía)
+        """
+        return self.writer.enqueue(record)
+
+    def enviar_pendientes(self) -> bool:
+        """
+        Envía a Google Sheets los registros pendientes en lotes
+
+        Returns:
+            bool: True si no quedaron errores de envío
+        """
+        return self.writer.flush()
+
+    def leer_hoja(self) -> bool:
+        """
+        Copia a local las filas nuevas del historial y los datos de campo de la hoja
+
+        Returns:
+            bool: True si la lectura se completó
+        """
+        spreadsheet_id, _ = self._destino()
+        if not spreadsheet_id:
+            return False
+
+        # Una sola lectura agrupada; lanza excepción si Sheets falla (no devuelve datos demo)
+        data = self.client.fetch_page_data()
+        # Solo lo agregado a la copia del cliente desde la lectura anterior; si la copia se
+        # releyó desde cero se recorre completa y los ids ya guardados se ignoran
+        historial, self._cursor_historial = self.client.get_historial_since(self._cursor_historial)
+        nuevos = self.repositorio.importar(
+            {campo: r.get(campo) for campo in CAMPOS_REGISTRO} for r in historial
+        )
+
+        field_data = data['field_data']
+        filas: List[Dict[str, str]] = []
+        for empresa, fundos in field_data.get('hierarchical', {}).items():
+            for fundo, sectores in fundos.items():
+                for sector, lotes in sectores.items():
+                    filas.extend(
+                        {'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote}
+                        for lote in lotes
+                    )
+        self.repositorio.reemplazar_campo(filas)
+
+        if nuevos:
+            print(f"🔄 {nuevos} registros nuevos copiados desde Google Sheets")
+        self.listo.set()
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.leer_hoja()
+            except Exception as e:
+                print(f"❌ Error leyendo Google Sheets: {e}")
+            self._stopped.wait(self.intervalo_lectura)
+
+    def detener(self):
+        """Detiene la lectura y envía lo pendiente"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.writer.close()
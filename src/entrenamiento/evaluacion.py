@@ -1,5 +1,305 @@
-from sklearn.metrics import classification_report
+import json
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from src.procesamiento.caracteristicas import CaracteristicasImagen
+from src.procesamiento.generar_mascaras import indexar_imagenes, buscar_imagen, rasterizar_etiquetas
+
+# Orden de clases usado por las anotaciones LabelMe y por _clasificacion_basica
+# (0 = SUELO_SOMBRA, 1 = SUELO_LUZ, 2 = MALLA_SOMBRA, 3 = MALLA_LUZ)
+CLASES = ["SUELO_SOMBRA", "SUELO_LUZ", "MALLA_SOMBRA", "MALLA_LUZ", "TRONCO", "OTRO"]
+
+# Etiquetas que el servicio devuelve sin prefijo se refieren al suelo
+ALIAS_CLASES = {"LUZ": "SUELO_LUZ", "SOMBRA": "SUELO_SOMBRA"}
+
+SIN_ETIQUETA = 255
+
+
+def matriz_confusion(y_true, y_pred, n_clases):
+    """
+    Calcula la matriz de confusión con un único np.bincount sobre códigos combinados.
+
+    Parámetros:
+    - y_true: array de enteros con la clase real (0..n_clases-1)
+    - y_pred: array de enteros con la clase predicha (0..n_clases-1)
+    - n_clases: número de clases
+
+    Retorna:
+    - Matriz (n_clases, n_clases) con filas = clase real, columnas = clase predicha
+    """
+    codigos = y_true.astype(np.int64) * n_clases + y_pred.astype(np.int64)
+    conteo = np.bincount(codigos.ravel(), minlength=n_clases * n_clases)
+    return conteo.reshape(n_clases, n_clases)
+
+
+def codificar_etiquetas(etiquetas, clases=CLASES):
+    """
+    Convierte etiquetas (enteros o strings) a índices de `clases`.
+    Las etiquetas desconocidas se asignan a la última clase ("OTRO").
+    """
+    etiquetas = np.asarray(etiquetas)
+    if np.issubdtype(etiquetas.dtype, np.integer):
+        return etiquetas
+
+    indice = {clase: i for i, clase in enumerate(clases)}
+    otro = len(clases) - 1
+    unicas, inversa = np.unique(etiquetas, return_inverse=True)
+    codigos_unicos = np.array(
+        [indice.get(ALIAS_CLASES.get(str(u).upper(), str(u).upper()), otro) for u in unicas],
+        dtype=np.int64
+    )
+    return codigos_unicos[inversa].reshape(etiquetas.shape)
+
+
+def metricas_desde_matriz(matriz, clases=CLASES):
+    """
+    Calcula precisión, recall y F1 por clase y la exactitud global desde la matriz de confusión.
+    """
+    matriz = matriz.astype(np.float64)
+    verdaderos = np.diag(matriz)
+    reales = matriz.sum(axis=1)
+    predichos = matriz.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predichos > 0, verdaderos / predichos, 0.0)
+        recall = np.where(reales > 0, verdaderos / reales, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    total = matriz.sum()
+    return {
+        "exactitud": float(verdaderos.sum() / total) if total > 0 else 0.0,
+        "por_clase": {
+            clase: {
+                "precision": round(float(precision[i]), 4),
+                "recall": round(float(recall[i]), 4),
+                "f1": round(float(f1[i]), 4),
+                "soporte": int(reales[i])
+            }
+            for i, clase in enumerate(clases)
+        }
+    }
+
+
+def porcentaje_sombra_desde_conteos(conteos, clases=CLASES):
+    """
+    Porcentaje de sombra sobre (luz + sombra) a partir de conteos por clase,
+    igual que calcular_porcentaje_suelo pero sin recorrer los píxeles.
+    """
+    sombra = sum(int(conteos[i]) for i, c in enumerate(clases) if c.endswith("SOMBRA"))
+    luz = sum(int(conteos[i]) for i, c in enumerate(clases) if c.endswith("LUZ"))
+    total = luz + sombra
+    return round(sombra / total * 100, 2) if total > 0 else 0.0
+
+
+def reporte_clasificacion(matriz, clases=CLASES):
+    """
+    Genera un reporte de texto equivalente a classification_report desde la matriz de confusión.
+    """
+    metricas = metricas_desde_matriz(matriz, clases)
+    lineas = [f"{'':>14} {'precision':>10} {'recall':>10} {'f1':>10} {'soporte':>10}"]
+    for clase, m in metricas["por_clase"].items():
+        if m["soporte"] == 0 and matriz[:, clases.index(clase)].sum() == 0:
+            continue
+        lineas.append(f"{clase:>14} {m['precision']:>10.4f} {m['recall']:>10.4f} {m['f1']:>10.4f} {m['soporte']:>10}")
+    lineas.append(f"{'exactitud':>14} {metricas['exactitud']:>32.4f} {int(matriz.sum()):>10}")
+    return "\n".join(lineas)
+
 
 def evaluar_modelo(modelo, X_test, y_test):
     y_pred = modelo.predict(X_test)
-    return classification_report(y_test, y_pred)
\ No newline at end of file
+
+    # Codificar vía np.unique para no llamar a Python por cada píxel
+    clases_true, inv_true = np.unique(y_test, return_inverse=True)
+    clases_pred, inv_pred = np.unique(y_pred, return_inverse=True)
+    clases = sorted(set(clases_true.tolist()) | set(clases_pred.tolist()), key=str)
+    indice = {c: i for i, c in enumerate(clases)}
+
+    y_true_idx = np.array([indice[c] for c in clases_true.tolist()], dtype=np.int64)[inv_true]
+    y_pred_idx = np.array([indice[c] for c in clases_pred.tolist()], dtype=np.int64)[inv_pred]
+    matriz = matriz_confusion(y_true_idx, y_pred_idx, len(clases))
+    return reporte_clasificacion(matriz, [str(c) for c in clases])
+
+
+def cargar_dataset(path_json="dataset/anotaciones", path_img="dataset/imagenes", clases=CLASES):
+    """
+    Itera las imágenes anotadas del dataset.
+
+    Retorna:
+    - Generador de tuplas (nombre, imagen_bgr, mapa_etiquetas)
+    """
+    indice = {clase.lower(): i for i, clase in enumerate(clases)}
+    imagenes = indexar_imagenes(path_img)
+
+    for nombre_json in sorted(os.listdir(path_json)):
+        if not nombre_json.lower().endswith(".json"):
+            continue
+        ruta_img = buscar_imagen(imagenes, os.path.splitext(nombre_json)[0])
+        imagen = cv2.imread(ruta_img) if ruta_img else None
+        if imagen is None:
+            print(f"❌ Imagen no encontrada para: {nombre_json}")
+            continue
+
+        with open(os.path.join(path_json, nombre_json), "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        height, width = imagen.shape[:2]
+        mapa = rasterizar_etiquetas(data.get("shapes", []), height, width, indice, fondo=SIN_ETIQUETA)
+        yield os.path.basename(ruta_img), imagen, mapa
+
+
+def compilar_lut(predictor, bits=5):
+    """
+    Compila un predictor por color en una tabla de búsqueda (LUT) sobre el cubo BGR cuantizado.
+
+    Solo es válido para predictores que dependen únicamente del color del píxel
+    (no de la textura ni de la vecindad).
+
+    Parámetros:
+    - predictor: callable que recibe una imagen BGR (H, W, 3) y devuelve una etiqueta por píxel
+    - bits: bits por canal de la tabla (5 → 32768 colores)
+
+    Retorna:
+    - Predictor equivalente que clasifica con una sola indexación
+    """
+    niveles = 1 << bits
+    desplazamiento = 8 - bits
+    centros = (np.arange(niveles, dtype=np.uint16) << desplazamiento) + (1 << desplazamiento >> 1)
+    b, g, r = np.meshgrid(centros, centros, centros, indexing="ij")
+    cubo = np.stack([b, g, r], axis=-1).astype(np.uint8).reshape(1, -1, 3)
+    tabla = np.asarray(predictor(cubo)).reshape(-1)
+
+    def predecir(imagen):
+        q = (imagen.reshape(-1, 3) >> desplazamiento).astype(np.intp)
+        return tabla[(q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]]
+
+    return predecir
+
+
+def candidato_servicio(servicio, usar_modelo=True):
+    """
+    Envuelve un ProcesamientoServiceV2 como predictor: usa el modelo entrenado si está
+    cargado (y usar_modelo=True) o la clasificación básica por umbrales en caso contrario.
+    """
+    def predecir(imagen):
+        with CaracteristicasImagen(imagen) as caracteristicas:
+            if not usar_modelo or servicio.modelo is None or servicio.scaler is None:
+                return servicio._clasificacion_basica(caracteristicas)
+            etiquetas = servicio.modelo.predict(
+                servicio.scaler.transform(servicio.extraer_caracteristicas_optimizadas(caracteristicas))
+            )
+        if servicio.encoder is not None:
+            etiquetas = servicio.encoder.inverse_transform(etiquetas)
+        return etiquetas
+
+    return predecir
+
+
+def _es_dominado(fila, otra):
+    """True si `otra` es igual o mejor que `fila` en todos los ejes y estrictamente mejor en alguno."""
+    ejes = [
+        (otra["error_medio_sombra"], fila["error_medio_sombra"]),
+        (-otra["pixeles_por_segundo"], -fila["pixeles_por_segundo"]),
+        (otra["memoria_pico_mb"], fila["memoria_pico_mb"]),
+    ]
+    return all(a <= b for a, b in ejes) and any(a < b for a, b in ejes)
+
+
+def evaluar_candidatos(candidatos, path_json="dataset/anotaciones", path_img="dataset/imagenes", clases=CLASES):
+    """
+    Evalúa modelos candidatos sobre el dataset anotado en precisión, error del porcentaje
+    de sombra por imagen, velocidad y memoria.
+
+    Cada predictor se ejecuta dos veces por imagen: una cronometrada y otra con
+    tracemalloc para la memoria pico, de modo que el rastreo no afecta los píxeles/s.
+
+    Parámetros:
+    - candidatos: dict nombre → predictor (callable imagen BGR → etiqueta por píxel)
+    - path_json, path_img: rutas del dataset anotado
+
+    Retorna:
+    - Lista de filas (dict) ordenadas por error de sombra, con la marca `pareto`
+      para los modelos no dominados en (error, píxeles/s, memoria)
+    """
+    n = len(clases)
+    matrices = {nombre: np.zeros((n, n), dtype=np.int64) for nombre in candidatos}
+    errores = {nombre: [] for nombre in candidatos}
+    tiempos = {nombre: 0.0 for nombre in candidatos}
+    memoria = {nombre: 0 for nombre in candidatos}
+    total_pixeles = 0
+
+    for nombre_img, imagen, mapa in cargar_dataset(path_json, path_img, clases):
+        anotados = mapa.ravel() != SIN_ETIQUETA
+        y_true = mapa.ravel()[anotados]
+        total_pixeles += mapa.size
+
+        for nombre, predictor in candidatos.items():
+            # Tiempo sin tracemalloc (su rastreo ralentiza más a los modelos que más asignan)
+            inicio = time.perf_counter()
+            etiquetas = predictor(imagen)
+            tiempos[nombre] += time.perf_counter() - inicio
+            del etiquetas
+
+            # Memoria pico en una pasada aparte, cuyo tiempo no se cuenta
+            tracemalloc.start()
+            try:
+                etiquetas = predictor(imagen)
+                memoria[nombre] = max(memoria[nombre], tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+            y_pred = codificar_etiquetas(np.asarray(etiquetas).ravel(), clases)[anotados]
+            matriz = matriz_confusion(y_true, y_pred, n)
+            matrices[nombre] += matriz
+
+            real = porcentaje_sombra_desde_conteos(matriz.sum(axis=1), clases)
+            predicho = porcentaje_sombra_desde_conteos(matriz.sum(axis=0), clases)
+            errores[nombre].append(abs(predicho - real))
+            print(f"📸 {nombre_img} [{nombre}] sombra real {real:.2f}% vs predicha {predicho:.2f}%")
+
+    filas = []
+    for nombre in candidatos:
+        metricas = metricas_desde_matriz(matrices[nombre], clases)
+        filas.append({
+            "modelo": nombre,
+            "exactitud": round(metricas["exactitud"], 4),
+            "error_medio_sombra": round(float(np.mean(errores[nombre])), 2) if errores[nombre] else 0.0,
+            "error_max_sombra": round(float(np.max(errores[nombre])), 2) if errores[nombre] else 0.0,
+            "pixeles_por_segundo": round(total_pixeles / tiempos[nombre]) if tiempos[nombre] > 0 else 0,
+            "memoria_pico_mb": round(memoria[nombre] / 1024 ** 2, 1),
+            "matriz": matrices[nombre],
+        })
+
+    for fila in filas:
+        fila["pareto"] = not any(_es_dominado(fila, otra) for otra in filas if otra is not fila)
+
+    return sorted(filas, key=lambda f: (f["error_medio_sombra"], -f["pixeles_por_segundo"]))
+
+
+def formatear_tabla_pareto(filas):
+    """
+    Formatea las filas de evaluar_candidatos como tabla de texto.
+    """
+    lineas = [f"{'modelo':<24} {'exactitud':>9} {'err_sombra':>10} {'err_max':>8} {'px/s':>12} {'mem_MB':>8}  pareto"]
+    for f in filas:
+        lineas.append(
+            f"{f['modelo']:<24} {f['exactitud']:>9.4f} {f['error_medio_sombra']:>10.2f} {f['error_max_sombra']:>8.2f} "
+            f"{f['pixeles_por_segundo']:>12,} {f['memoria_pico_mb']:>8.1f}  {'★' if f['pareto'] else ''}"
+        )
+    return "\n".join(lineas)
+
+
+if __name__ == "__main__":
+    from src.services.procesamiento_service_v2 import ProcesamientoServiceV2
+
+    servicio = ProcesamientoServiceV2()
+
+    candidatos = {"umbrales": candidato_servicio(servicio, usar_modelo=False)}
+    candidatos["umbrales_lut"] = compilar_lut(candidatos["umbrales"])
+    if servicio.modelo is not None:
+        candidatos["hgb"] = candidato_servicio(servicio)
+
+    print(formatear_tabla_pareto(evaluar_candidatos(candidatos)))
@@ -3,7 +3,7 @@ from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.preprocessing import LabelEncoder
 import numpy as np
 
-def entrenar_modelo(X_train, y_train, modelo_path="modelo_hgb.pkl"):
+def entrenar_modelo(X_train, y_train, modelo_path="modelo_hgb.pkl", scaler=None):
     """
     Entrena un modelo HistGradientBoostingClassifier y guarda el clasificador junto con el LabelEncoder.
 
@@ -11,6 +11,8 @@ def entrenar_modelo(X_train, y_train, modelo_path="modelo_hgb.pkl"):
     - X_train: array de características (ej. píxeles normalizados)
     - y_train: array de etiquetas (ej. "LUZ", "SOMBRA", etc.)
     - modelo_path: ruta donde se guarda el modelo entrenado
+    - scaler: StandardScaler ajustado sobre X_train (opcional); si se pasa, se guarda como
+      (modelo, scaler, encoder), el formato que carga ProcesamientoServiceV2
     """
 
     if X_train is None or len(X_train) == 0:
@@ -29,8 +31,29 @@ def entrenar_modelo(X_train, y_train, modelo_path="modelo_hgb.pkl"):
     model = HistGradientBoostingClassifier(random_state=42)
     model.fit(X_train, y_encoded)
 
-    # Guardado del modelo y encoder
+    # Guardado del modelo, scaler (si hay) y encoder
     with open(modelo_path, "wb") as f:
-        pickle.dump((model, encoder), f)
+        if scaler is not None:
+            pickle.dump((model, scaler, encoder), f)
+        else:
+            pickle.dump((model, encoder), f)
 
-    print("✅ Modelo entrenado (HGB) y guardado con clases:", list(encoder.classes_))
\ No newline at end of file
+    print("✅ Modelo entrenado (HGB) y guardado con clases:", list(encoder.classes_))
+
+
+def cargar_scaler(modelo_path="modelo_hgb.pkl"):
+    """
+    Carga el StandardScaler guardado por entrenar_modelo, para normalizar en inferencia
+    con la misma escala que en entrenamiento.
+
+    Retorna:
+    - StandardScaler ajustado
+
+    Lanza ValueError si el modelo se guardó sin scaler.
+    """
+    with open(modelo_path, "rb") as f:
+        data = pickle.load(f)
+
+    if not isinstance(data, tuple) or len(data) != 3:
+        raise ValueError(f"❌ {modelo_path} no incluye el scaler; vuelva a entrenar pasando scaler=ajustar_scaler(X)")
+    return data[1]
@@ -3,5 +3,6 @@ Módulo de integración con Google Sheets
 """
 
 from .sheets_client import GoogleSheetsClient
+from .write_behind import JsonlSpool, WriteBehindWriter
 
-__all__ = ['GoogleSheetsClient']
+__all__ = ['GoogleSheetsClient', 'JsonlSpool', 'WriteBehindWriter']
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Configuración de Google Sheets
+Se lee una sola vez por proceso (variables de entorno o google_sheets_config.json)
+y se expone como un mapeo de solo lectura.
+"""
+
+import base64
+import json
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Mapping
+
+
+def _decode_b64_json(value: str) -> Mapping[str, Any]:
+    """Decodifica un JSON en Base64 (agregando el padding que falte)"""
+    missing_padding = len(value) % 4
+    if missing_padding:
+        value += '=' * (4 - missing_padding)
+    return MappingProxyType(json.loads(base64.b64decode(value).decode('utf-8')))
+
+
+@lru_cache(maxsize=None)
+def load_config(config_file: str = 'google_sheets_config.json') -> Mapping[str, Any]:
+    """
+    Carga la configuración de Google Sheets (una vez por proceso)
+
+    Args:
+        config_file: Archivo de configuración usado si no hay variables de entorno
+
+    Returns:
+        Mapping: Configuración de solo lectura (spreadsheet_id, sheet_name y,
+        si están en el entorno, credentials y token ya decodificados)
+    """
+    config = {}
+
+    # Cargar desde variables de entorno
+    if os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID'):
+        config['spreadsheet_id'] = os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID')
+        config['sheet_name'] = os.getenv('GOOGLE_SHEETS_SHEET_NAME', 'Data-app')
+
+        if os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64'):
+            config['credentials'] = _decode_b64_json(os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64'))
+
+        if os.getenv('GOOGLE_SHEETS_TOKEN_BASE64'):
+            config['token'] = _decode_b64_json(os.getenv('GOOGLE_SHEETS_TOKEN_BASE64'))
+
+    # Cargar desde archivo si no hay variables de entorno
+    if not config.get('spreadsheet_id'):
+        try:
+            with open(config_file, 'r') as f:
+                config.update(json.load(f))
+        except FileNotFoundError:
+            print(f"⚠️ No se encontró {config_file}")
+            config = {
+                'spreadsheet_id': 'demo',
+                'sheet_name': 'Data-app'
+            }
+
+    return MappingProxyType(config)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Índice jerárquico de datos de campo (empresa → fundo → sector → lote)
+Se construye una vez por actualización de los datos y responde hijos de un nodo
+y búsquedas por prefijo sin recorrer la hoja.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Tuple
+
+LEVELS = ('empresa', 'fundo', 'sector', 'lote')
+
+
+class _SortedOptions:
+    """Valores únicos ordenados, con búsqueda por prefijo sin distinguir mayúsculas"""
+
+    def __init__(self, values: Iterable[str]):
+        pairs = sorted((value.casefold(), value) for value in set(values))
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def prefix(self, text: str, limit: int = None) -> List[str]:
+        text = text.casefold()
+        start = bisect_left(self.keys, text)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(text) and (limit is None or end - start < limit):
+            end += 1
+        return self.values[start:end]
+
+
+class FieldDataIndex:
+    """
+    Índice de los lotes de campo
+
+    - children[(empresa, fundo, ...)] → opciones del nivel siguiente, ordenadas
+    - flat[nivel] → todos los valores del nivel, ordenados
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        children_sets: Dict[Tuple[str, ...], set] = {}
+        flat_sets = {level: set() for level in LEVELS}
+
+        for row in rows:
+            values = [str(row.get(level) or '').strip() for level in LEVELS]
+            for level, value in zip(LEVELS, values):
+                if value:
+                    flat_sets[level].add(value)
+            # Solo las filas completas forman parte de la jerarquía
+            if not all(values):
+                continue
+            for depth in range(len(LEVELS)):
+                children_sets.setdefault(tuple(values[:depth]), set()).add(values[depth])
+
+        self.children = {path: _SortedOptions(values) for path, values in children_sets.items()}
+        self.flat = {level: _SortedOptions(values) for level, values in flat_sets.items()}
+
+    @classmethod
+    def from_field_data(cls, data: Dict[str, Any]) -> 'FieldDataIndex':
+        """Construye el índice a partir del formato de GoogleSheetsClient.get_field_data"""
+        rows = [
+            {'empresa': empresa, 'fundo': fundo, 'sector': sector, 'lote': lote}
+            for empresa, fundos in data.get('hierarchical', {}).items()
+            for fundo, sectores in fundos.items()
+            for sector, lotes in sectores.items()
+            for lote in lotes
+        ]
+        # Valores sin jerarquía completa (solo aparecen en las listas planas)
+        for level in LEVELS:
+            rows.extend({level: value} for value in data.get(level, []))
+        return cls(rows)
+
+    def get_children(self, path: Tuple[str, ...] = (), prefix: str = '', limit: int = None) -> List[str]:
+        """
+        Opciones del nivel siguiente a `path`
+
+        Args:
+            path: (empresa,), (empresa, fundo)... o () para las empresas
+            prefix: Filtrar por prefijo (sin distinguir mayúsculas)
+            limit: Máximo de opciones (None = todas; si se indica, >= 1)
+
+        Returns:
+            List[str]: Opciones ordenadas ([] si el nodo no existe)
+        """
+        self._check_limit(limit)
+        options = self.children.get(tuple(path))
+        if options is None:
+            return []
+        if prefix:
+            return options.prefix(prefix, limit)
+        return options.values[:limit] if limit is not None else list(options.values)
+
+    def search(self, level: str, prefix: str, limit: int = 20) -> List[str]:
+        """Valores de un nivel que empiezan por `prefix`, sin importar el padre"""
+        if level not in self.flat:
+            raise ValueError(f"nivel debe ser uno de: {', '.join(LEVELS)}")
+        self._check_limit(limit)
+        return self.flat[level].prefix(prefix, limit)
+
+    @staticmethod
+    def _check_limit(limit: int = None):
+        if limit is not None and limit < 1:
+            raise ValueError("limit debe ser mayor o igual a 1")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Formato de GoogleSheetsClient.get_field_data (listas planas + árbol)"""
+        hierarchical = {}
+        for empresa in self.get_children(()):
+            hierarchical[empresa] = {}
+            for fundo in self.get_children((empresa,)):
+                hierarchical[empresa][fundo] = {}
+                for sector in self.get_children((empresa, fundo)):
+                    hierarchical[empresa][fundo][sector] = self.get_children((empresa, fundo, sector))
+
+        result = {level: list(self.flat[level].values) for level in LEVELS}
+        result['hierarchical'] = hierarchical
+        return result
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Limitador de cuota y reintentos para la API de Google Sheets
+Token bucket por tipo de operación (lectura/escritura) compartido por todo el
+proceso y reintentos con backoff exponencial con jitter ante 429/5xx.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from googleapiclient.errors import HttpError
+
+# Cuotas de Sheets por minuto y por usuario (las de proyecto son 300/min)
+SHEETS_QUOTAS = {
+    'read': 60,
+    'write': 60,
+}
+
+# Estados HTTP que se reintentan
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket con ráfaga `capacity` y recarga continua
+
+    La recarga es (quota - capacity) / 60 tokens por segundo, de modo que en
+    cualquier ventana de 60 s nunca se superan `quota_per_minute` peticiones.
+    """
+
+    def __init__(self, quota_per_minute: int, capacity: int = None):
+        self.capacity = capacity if capacity is not None else max(1, quota_per_minute // 6)
+        self.rate = max(quota_per_minute - self.capacity, 1) / 60.0
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float = None) -> float:
+        """
+        Toma un token, esperando lo necesario
+
+        Args:
+            deadline: Instante (time.monotonic) a partir del cual no se espera más
+
+        Returns:
+            float: Segundos esperados (0 si había token disponible)
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                raise TimeoutError("Cuota de Google Sheets agotada hasta después del plazo")
+            time.sleep(wait)
+            waited += wait
+
+
+class SheetsRateLimiter:
+    """Ejecuta peticiones de Sheets respetando la cuota y reintentando errores transitorios"""
+
+    def __init__(
+        self,
+        quotas: Dict[str, int] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 32.0,
+        deadline: float = 60.0
+    ):
+        self.buckets = {kind: TokenBucket(quota) for kind, quota in (quotas or SHEETS_QUOTAS).items()}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._counters = {
+            'requests': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'retries': 0,
+            'http_429': 0,
+            'failures': 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def execute(self, request, kind: str = 'read', deadline: float = None) -> Any:
+        """
+        Ejecuta una petición de googleapiclient (antes de .execute())
+
+        Args:
+            request: Petición construida, p. ej. service.spreadsheets().values().get(...)
+            kind: 'read' o 'write' (cuota que consume)
+            deadline: Segundos máximos incluyendo esperas y reintentos (por defecto self.deadline)
+
+        Returns:
+            Respuesta de la API
+
+        Raises:
+            HttpError: Si el error no es transitorio o se agotaron los reintentos
+            TimeoutError: Si la cuota no permite ejecutar antes del plazo
+        """
+        limite = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        attempt = 0
+        while True:
+            waited = self.buckets[kind].acquire(limite)
+            self._count('requests')
+            if waited:
+                self._count('throttled')
+                self._count('throttled_seconds', waited)
+
+            try:
+                return request.execute()
+            except HttpError as e:
+                status = e.resp.status
+                if status == 429:
+                    self._count('http_429')
+                if status not in RETRYABLE_STATUS:
+                    raise
+                error = e
+                retry_after = self._retry_after(e)
+            except OSError as e:
+                # Errores de red (conexión, timeout)
+                error = e
+                retry_after = None
+
+            delay = retry_after if retry_after is not None else \
+                random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay > limite:
+                self._count('failures')
+                raise error
+
+            self._count('retries')
+            print(f"🔄 Reintentando petición a Google Sheets en {delay:.1f}s ({attempt}/{self.max_retries}): {error}")
+            time.sleep(delay)
+
+    @staticmethod
+    def _retry_after(error: HttpError) -> Optional[float]:
+        try:
+            return float(error.resp.get('retry-after'))
+        except (TypeError, ValueError):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de peticiones, esperas por cuota, reintentos y fallos"""
+        with self._lock:
+            counters = dict(self._counters)
+        counters['throttled_seconds'] = round(counters['throttled_seconds'], 3)
+        counters['tokens'] = {kind: round(bucket.tokens, 2) for kind, bucket in self.buckets.items()}
+        return counters
+
+
+_default_limiter: Optional[SheetsRateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def default_rate_limiter() -> SheetsRateLimiter:
+    """Limitador compartido por todos los clientes del proceso (la cuota es por usuario)"""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = SheetsRateLimiter()
+        return _default_limiter
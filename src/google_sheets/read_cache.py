@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Caché de lectura para Google Sheets
+TTL por tipo de dato, stale-while-revalidate y coalescencia de peticiones (single-flight).
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from src.services.respuestas import serializar_json
+
+
+class CacheEntry:
+    """
+    Valor cacheado con su momento de carga y ETag
+
+    Si no se indica `etag`, se calcula (hash del valor serializado) la primera vez
+    que se pide y se reutiliza.
+    """
+
+    def __init__(self, value: Any, fetched_at: float, etag: Optional[str] = None):
+        self.value = value
+        self.fetched_at = fetched_at
+        self._etag = etag
+
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            self._etag = '"' + hashlib.sha1(serializar_json(self.value, sort_keys=True)).hexdigest() + '"'
+        return self._etag
+
+
+class ReadCache:
+    """
+    Caché read-through en memoria
+
+    - Dentro de `ttl` el valor se sirve sin llamar a Sheets.
+    - Entre `ttl` y `ttl + stale_ttl` se sirve el valor viejo mientras un único
+      refresco corre en segundo plano.
+    - Si no hay valor utilizable, las peticiones concurrentes comparten una sola carga.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Hashable, CacheEntry] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float = 0) -> CacheEntry:
+        """
+        Obtiene la entrada de `key`, cargándola con `loader` si es necesario
+
+        Args:
+            key: Clave del dato
+            loader: Función que obtiene el dato de Sheets (puede lanzar excepción)
+            ttl: Segundos durante los que el dato se considera fresco
+            stale_ttl: Segundos adicionales durante los que se sirve el dato viejo
+
+        Returns:
+            CacheEntry: Entrada con valor, momento de carga y ETag
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry.fetched_at if entry else None
+
+            if entry and age < ttl:
+                return entry
+
+            if entry and age < ttl + stale_ttl:
+                if key not in self._inflight:
+                    self._inflight[key] = Future()
+                    threading.Thread(target=self._load, args=(key, loader), daemon=True).start()
+                return entry
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if owner:
+            self._load(key, loader)
+
+        try:
+            return future.result()
+        except Exception:
+            # Si la carga falla pero hay un valor viejo, se sirve ese
+            if entry is not None:
+                return entry
+            raise
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]):
+        with self._lock:
+            future = self._inflight[key]
+        try:
+            entry = CacheEntry(loader(), time.time())
+        except Exception as e:
+            print(f"❌ Error refrescando caché '{key}': {e}")
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._entries[key] = entry
+            self._inflight.pop(key, None)
+        future.set_result(entry)
+
+    def put(self, key: Hashable, value: Any) -> CacheEntry:
+        """Guarda un valor obtenido por otra vía (p. ej. dentro de una lectura agrupada)"""
+        entry = CacheEntry(value, time.time())
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def is_fresh(self, key: Hashable, ttl: float) -> bool:
+        """Indica si `key` tiene un valor cargado hace menos de `ttl` segundos"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and time.time() - entry.fetched_at < ttl
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Descarta una entrada (o todas) para forzar la recarga en la próxima lectura"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -5,35 +5,110 @@ Integración con Google Sheets para almacenar datos de procesamiento de imágene
 """
 
 import os
-import json
+import time
 import base64
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Mapping, Optional
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from .config import load_config
+from .field_index import FieldDataIndex
+from .rate_limiter import SheetsRateLimiter, default_rate_limiter
+from .read_cache import ReadCache, CacheEntry
+
 # Scopes necesarios para Google Sheets
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+# Rango de la hoja de datos de campo: Empresa, Fundo, Sector, Lote (columnas B, D, G, I)
+FIELD_DATA_RANGE = 'Data-campo!B:I'
+
+# Encabezados de la hoja de procesamientos (columnas A:S)
+HEADERS = [
+    'ID', 'Fecha', 'Hora', 'Imagen', 'Nombre Archivo', 'Empresa', 'Fundo', 'Sector', 'Lote', 'Hilera', 'N° Planta',
+    'Latitud', 'Longitud', 'Porcentaje Luz', 'Porcentaje Sombra',
+    'Dispositivo', 'Software', 'Dirección', 'Timestamp'
+]
+
 class GoogleSheetsClient:
     """Cliente para interactuar con Google Sheets"""
     
-    def __init__(self, credentials_file: str = 'credentials.json', token_file: str = 'token.json'):
+    # Segundos (fresco, servible como viejo) por tipo de dato leído
+    CACHE_TTLS = {
+        'field_data': (300, 3600),
+        'historial': (30, 300),
+    }
+    
+    # Campos de texto por los que se puede filtrar el historial (coincidencia exacta)
+    HISTORIAL_FILTROS = ('empresa', 'fundo', 'sector', 'lote')
+    # Combinaciones de filtros cuyo total se recuerda por entrada del historial
+    HISTORIAL_TOTALS_MAX = 256
+    
+    def __init__(self, credentials_file: str = 'credentials.json', token_file: str = 'token.json',
+                 config: Mapping[str, Any] = None, rate_limiter: SheetsRateLimiter = None):
         self.credentials_file = credentials_file
         self.token_file = token_file
+        # Configuración leída una sola vez (ver config.load_config)
+        self.config = config if config is not None else load_config()
         self.service = None
         self.creds = None
+        # Cuota compartida por todas las llamadas a Sheets del proceso
+        self.rate_limiter = rate_limiter or default_rate_limiter()
+        self._auth_lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+        # Hojas cuyos encabezados ya se verificaron en este proceso
+        self._headers_verified = set()
+        # sheetId numérico por (spreadsheet_id, sheet_name), necesario para batchUpdate
+        self._sheet_ids: Dict[tuple, int] = {}
+        # Índice de datos de campo y la entrada de caché de la que se construyó
+        self._field_index = (None, None)
+        self._read_cache = ReadCache()
+        # Copia local del historial para sincronización incremental
+        self._historial_records: List[Dict[str, Any]] = []
+        self._historial_rows_read = 0
+        # Última fila leída tal como la devolvió Sheets (para detectar borrados o ediciones)
+        self._historial_last_row: Optional[List[str]] = None
+        # Cambia cada vez que la copia se descarta y se relee desde la fila 2
+        self._historial_generation = 0
+        self._historial_lock = threading.Lock()
+        # Totales de historial filtrado por filtros y la entrada de caché de la que se contaron
+        self._historial_totals = (None, {})
+        # Escritor diferido (ver write_behind.WriteBehindWriter) por el que pasan los registros nuevos
+        self.writer = None
+        
+    def use_writer(self, writer) -> 'GoogleSheetsClient':
+        """
+        Envía los registros de add_processing_record a través de un escritor diferido
+        
+        Args:
+            writer: WriteBehindWriter ya iniciado
+            
+        Returns:
+            GoogleSheetsClient: El mismo cliente
+        """
+        self.writer = writer
+        return self
         
     def authenticate(self) -> bool:
         """
         Autentica con Google Sheets API
         
+        Si otro hilo (p. ej. el warm-up) ya está autenticando, espera su resultado
+        en lugar de repetir la autenticación.
+        
         Returns:
             bool: True si la autenticación fue exitosa
         """
+        with self._auth_lock:
+            if self.service:
+                return True
+            return self._authenticate()
+    
+    def _authenticate(self) -> bool:
         try:
             # Intentar usar variables de entorno primero
             if self._authenticate_from_env():
@@ -62,7 +137,7 @@ class GoogleSheetsClient:
                     token.write(self.creds.to_json())
             
             # Construir el servicio
-            self.service = build('sheets', 'v4', credentials=self.creds)
+            self.service = self._build_service()
             print("✅ Autenticación con Google Sheets exitosa")
             return True
             
@@ -72,31 +147,18 @@ class GoogleSheetsClient:
     
     def _authenticate_from_env(self) -> bool:
         """
-        Intenta autenticar usando variables de entorno
+        Intenta autenticar con las credenciales de la configuración (variables de entorno)
         
         Returns:
             bool: True si la autenticación fue exitosa
         """
         try:
-            credentials_b64 = os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64')
-            token_b64 = os.getenv('GOOGLE_SHEETS_TOKEN_BASE64')
+            token = self.config.get('token')
             
-            if not credentials_b64 or not token_b64:
+            # El token autorizado basta para autenticar (incluye client_id/secret)
+            if not token:
                 return False
             
-            # Decodificar credenciales
-            credentials_json = base64.b64decode(credentials_b64).decode('utf-8')
-            credentials = json.loads(credentials_json)
-            
-            # Decodificar token (agregar padding si es necesario)
-            # Base64 requiere que la longitud sea múltiplo de 4
-            missing_padding = len(token_b64) % 4
-            if missing_padding:
-                token_b64 += '=' * (4 - missing_padding)
-            
-            token_json = base64.b64decode(token_b64).decode('utf-8')
-            token = json.loads(token_json)
-            
             # Crear credenciales
             self.creds = Credentials.from_authorized_user_info(token, SCOPES)
             
@@ -109,7 +171,7 @@ class GoogleSheetsClient:
                     return False
             
             # Construir el servicio
-            self.service = build('sheets', 'v4', credentials=self.creds)
+            self.service = self._build_service()
             print("✅ Autenticación con Google Sheets exitosa (desde variables de entorno)")
             return True
             
@@ -117,6 +179,53 @@ class GoogleSheetsClient:
             print(f"❌ Error autenticando desde variables de entorno: {e}")
             return False
     
+    def _execute(self, request, kind: str = 'read') -> Any:
+        """
+        Ejecuta una petición a Sheets a través del limitador de cuota (con reintentos ante 429/5xx)
+        
+        Args:
+            request: Petición construida (sin .execute())
+            kind: 'read' o 'write'
+            
+        Returns:
+            Respuesta de la API
+        """
+        return self.rate_limiter.execute(request, kind)
+    
+    def _build_service(self):
+        """
+        Construye el servicio de Sheets con el documento de discovery incluido en
+        google-api-python-client (sin descargarlo por red)
+        """
+        return build('sheets', 'v4', credentials=self.creds, static_discovery=True, cache_discovery=False)
+    
+    def warm_up(self) -> threading.Thread:
+        """
+        Autentica, construye el servicio y precarga los datos de la página en segundo plano
+        
+        Las peticiones que lleguen mientras tanto esperan a que termine la
+        autenticación en curso en lugar de repetirla.
+        
+        Returns:
+            threading.Thread: Hilo del warm-up
+        """
+        if self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(target=self._warm_up, name='sheets-warm-up', daemon=True)
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+    
+    def _warm_up(self):
+        spreadsheet_id = self.config.get('spreadsheet_id')
+        if not spreadsheet_id or spreadsheet_id == 'demo':
+            return
+        
+        try:
+            if self.authenticate():
+                self.fetch_page_data()
+                print("✅ Warm-up de Google Sheets completado")
+        except Exception as e:
+            print(f"⚠️ Warm-up de Google Sheets incompleto: {e}")
+    
     def create_spreadsheet(self, title: str = "Agricola Luz-Sombra") -> Optional[str]:
         """
         Crea una nueva hoja de cálculo
@@ -143,10 +252,10 @@ class GoogleSheetsClient:
                 }]
             }
             
-            spreadsheet = self.service.spreadsheets().create(
+            spreadsheet = self._execute(self.service.spreadsheets().create(
                 body=spreadsheet,
                 fields='spreadsheetId'
-            ).execute()
+            ), 'write')
             
             spreadsheet_id = spreadsheet.get('spreadsheetId')
             print(f"✅ Hoja de cálculo creada: {spreadsheet_id}")
@@ -156,7 +265,7 @@ class GoogleSheetsClient:
             
             return spreadsheet_id
             
-        except HttpError as e:
+        except (HttpError, OSError) as e:
             print(f"❌ Error creando hoja de cálculo: {e}")
             return None
     
@@ -172,30 +281,24 @@ class GoogleSheetsClient:
             bool: True si se configuraron correctamente
         """
         try:
-            headers = [
-                'ID', 'Fecha', 'Hora', 'Imagen', 'Nombre Archivo', 'Empresa', 'Fundo', 'Sector', 'Lote', 'Hilera', 'N° Planta',
-                'Latitud', 'Longitud', 'Porcentaje Luz', 'Porcentaje Sombra',
-                'Dispositivo', 'Software', 'Dirección', 'Timestamp'
-            ]
-            
             body = {
-                'values': [headers]
+                'values': [HEADERS]
             }
             
             # Usar el nombre de la hoja especificado o el por defecto
             range_name = f"'{sheet_name}'!A1:S1" if sheet_name else 'A1:S1'
             
-            self.service.spreadsheets().values().update(
+            self._execute(self.service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ), 'write')
             
             print("✅ Encabezados configurados correctamente")
             return True
             
-        except HttpError as e:
+        except (HttpError, OSError) as e:
             print(f"❌ Error configurando encabezados: {e}")
             return False
     
@@ -213,19 +316,15 @@ class GoogleSheetsClient:
         try:
             # Obtener encabezados actuales
             range_name = f"'{sheet_name}'!A1:S1" if sheet_name else 'A1:S1'
-            result = self.service.spreadsheets().values().get(
+            result = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range=range_name
-            ).execute()
+            ), 'read')
             
             current_headers = result.get('values', [[]])[0] if result.get('values') else []
             
             # Encabezados esperados
-            expected_headers = [
-                'ID', 'Fecha', 'Hora', 'Imagen', 'Nombre Archivo', 'Empresa', 'Fundo', 'Sector', 'Lote', 'Hilera', 'N° Planta',
-                'Latitud', 'Longitud', 'Porcentaje Luz', 'Porcentaje Sombra',
-                'Dispositivo', 'Software', 'Dirección', 'Timestamp'
-            ]
+            expected_headers = HEADERS
             
             # Verificar si los encabezados son exactamente correctos
             print(f"📋 Encabezados actuales ({len(current_headers)}): {current_headers}")
@@ -249,10 +348,30 @@ class GoogleSheetsClient:
                 print("🔄 Actualizando encabezados de la hoja...")
                 return self._setup_headers(spreadsheet_id, sheet_name)
             
-        except HttpError as e:
+        except (HttpError, OSError) as e:
             print(f"❌ Error verificando encabezados: {e}")
             return False
     
+    def ensure_headers_cached(self, spreadsheet_id: str, sheet_name: str = None) -> bool:
+        """
+        Verifica los encabezados solo la primera vez por hoja; las llamadas siguientes
+        no hacen ninguna petición
+        
+        Args:
+            spreadsheet_id: ID de la hoja de cálculo
+            sheet_name: Nombre de la hoja (opcional)
+            
+        Returns:
+            bool: True si los encabezados están correctos
+        """
+        key = (spreadsheet_id, sheet_name)
+        if key in self._headers_verified:
+            return True
+        if self.ensure_headers_updated(spreadsheet_id, sheet_name):
+            self._headers_verified.add(key)
+            return True
+        return False
+    
     def force_update_headers(self, spreadsheet_id: str, sheet_name: str = None) -> bool:
         """
         Fuerza la actualización de los encabezados de la hoja
@@ -271,66 +390,198 @@ class GoogleSheetsClient:
         """
         Agrega un registro de procesamiento a la hoja de cálculo
         
+        Si hay un escritor diferido para esa hoja (ver use_writer), el registro se
+        encola en su spool y se envía en el siguiente lote.
+        
         Args:
             spreadsheet_id: ID de la hoja de cálculo
             record: Diccionario con los datos del procesamiento
             sheet_name: Nombre de la hoja (opcional, por defecto usa 'Procesamientos')
             
         Returns:
-            bool: True si se agregó correctamente
+            bool: True si se agregó (o encoló) correctamente
         """
+        writer = self.writer
+        if writer is not None and (writer.spreadsheet_id, writer.sheet_name) == (spreadsheet_id, sheet_name):
+            return writer.enqueue(record)
+        
         try:
-            # Verificar y actualizar encabezados si es necesario
-            self.ensure_headers_updated(spreadsheet_id, sheet_name)
-            
-            # Preparar datos para la fila
-            row_data = [
-                record.get('id', ''),
-                record.get('fecha', ''),
-                record.get('hora', ''),
-                record.get('imagen', ''),
-                record.get('nombre_archivo', ''),  # Nueva columna: Nombre Archivo
-                record.get('empresa', ''),
-                record.get('fundo', ''),
-                record.get('sector', ''),
-                record.get('lote', ''),
-                record.get('hilera') if record.get('hilera') is not None else '',  # Hilera puede ser null
-                record.get('numero_planta') if record.get('numero_planta') is not None else '',  # N° Planta puede ser null
-                record.get('latitud', ''),
-                record.get('longitud', ''),
-                record.get('porcentaje_luz', ''),
-                record.get('porcentaje_sombra', ''),
-                record.get('dispositivo', ''),
-                record.get('software', ''),
-                record.get('direccion', ''),
-                record.get('timestamp', '')
-            ]
+            # Los encabezados se corrigen dentro del mismo batchUpdate del append si hace falta
+            row_data = self.record_to_row(record)
             
             print(f"📋 Datos de fila a insertar: {row_data}")
             print(f"📊 Número de columnas: {len(row_data)}")
             
-            body = {
-                'values': [row_data]
-            }
+            if self.append_rows(spreadsheet_id, [row_data], sheet_name):
+                print(f"✅ Registro agregado: {record.get('imagen', 'N/A')}")
+                return True
+            return False
             
-            # Usar el nombre de la hoja especificado o el por defecto
-            range_name = f"'{sheet_name}'!A:S" if sheet_name else 'A:S'
+        except (HttpError, OSError) as e:
+            print(f"❌ Error agregando registro: {e}")
+            return False
+    
+    @staticmethod
+    def record_to_row(record: Dict[str, Any]) -> List[Any]:
+        """
+        Convierte un registro de procesamiento en una fila con el orden de HEADERS
+        
+        Args:
+            record: Diccionario con los datos del procesamiento
             
-            self.service.spreadsheets().values().append(
-                spreadsheetId=spreadsheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                insertDataOption='INSERT_ROWS',
-                body=body
-            ).execute()
+        Returns:
+            List: Valores de la fila
+        """
+        return [
+            record.get('id', ''),
+            record.get('fecha', ''),
+            record.get('hora', ''),
+            record.get('imagen', ''),
+            record.get('nombre_archivo', ''),  # Nueva columna: Nombre Archivo
+            record.get('empresa', ''),
+            record.get('fundo', ''),
+            record.get('sector', ''),
+            record.get('lote', ''),
+            record.get('hilera') if record.get('hilera') is not None else '',  # Hilera puede ser null
+            record.get('numero_planta') if record.get('numero_planta') is not None else '',  # N° Planta puede ser null
+            record.get('latitud', ''),
+            record.get('longitud', ''),
+            record.get('porcentaje_luz', ''),
+            record.get('porcentaje_sombra', ''),
+            record.get('dispositivo', ''),
+            record.get('software', ''),
+            record.get('direccion', ''),
+            record.get('timestamp', '')
+        ]
+    
+    def append_rows(self, spreadsheet_id: str, rows: List[List[Any]], sheet_name: str = None) -> bool:
+        """
+        Agrega varias filas con una sola llamada
+        
+        Si los encabezados de la hoja aún no se verificaron (o no coinciden con
+        HEADERS), se corrigen en el mismo spreadsheets().batchUpdate que agrega las
+        filas; si ya están verificados se usa values().append.
+        
+        Args:
+            spreadsheet_id: ID de la hoja de cálculo
+            rows: Filas a agregar (ver record_to_row)
+            sheet_name: Nombre de la hoja (opcional)
             
-            print(f"✅ Registro agregado: {record.get('imagen', 'N/A')}")
+        Returns:
+            bool: True si se agregaron correctamente
+        """
+        if not rows:
+            return True
+        
+        key = (spreadsheet_id, sheet_name)
+        try:
+            if key in self._headers_verified:
+                # Usar el nombre de la hoja especificado o el por defecto
+                range_name = f"'{sheet_name}'!A:S" if sheet_name else 'A:S'
+                
+                self._execute(self.service.spreadsheets().values().append(
+                    spreadsheetId=spreadsheet_id,
+                    range=range_name,
+                    valueInputOption='RAW',
+                    insertDataOption='INSERT_ROWS',
+                    body={'values': rows}
+                ), 'write')
+            else:
+                sheet_id = self._get_sheet_id(spreadsheet_id, sheet_name)
+                if sheet_id is None:
+                    print(f"❌ No existe la hoja '{sheet_name}' en {spreadsheet_id}")
+                    return False
+                
+                self._execute(self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'requests': [
+                        {'updateCells': {
+                            'start': {'sheetId': sheet_id, 'rowIndex': 0, 'columnIndex': 0},
+                            'rows': [self._row_data(HEADERS)],
+                            'fields': 'userEnteredValue'
+                        }},
+                        {'appendCells': {
+                            'sheetId': sheet_id,
+                            'rows': [self._row_data(row) for row in rows],
+                            'fields': 'userEnteredValue'
+                        }}
+                    ]}
+                ), 'write')
+                self._headers_verified.add(key)
+            
+            self._read_cache.invalidate('historial')
             return True
             
-        except HttpError as e:
-            print(f"❌ Error agregando registro: {e}")
+        except (HttpError, OSError) as e:
+            print(f"❌ Error agregando {len(rows)} filas: {e}")
             return False
     
+    @staticmethod
+    def _row_data(row: List[Any]) -> Dict[str, Any]:
+        """
+        Convierte una fila de valores en RowData de batchUpdate (equivalente a valueInputOption RAW)
+        
+        Args:
+            row: Valores de la fila
+            
+        Returns:
+            Dict: RowData con userEnteredValue por celda
+        """
+        cells = []
+        for value in row:
+            if value is None or value == '':
+                cells.append({})
+            elif isinstance(value, bool):
+                cells.append({'userEnteredValue': {'boolValue': value}})
+            elif isinstance(value, (int, float)):
+                cells.append({'userEnteredValue': {'numberValue': value}})
+            else:
+                cells.append({'userEnteredValue': {'stringValue': str(value)}})
+        return {'values': cells}
+    
+    def _get_sheet_id(self, spreadsheet_id: str, sheet_name: str = None) -> Optional[int]:
+        """
+        Obtiene (y recuerda) el sheetId numérico de una hoja
+        
+        Args:
+            spreadsheet_id: ID de la hoja de cálculo
+            sheet_name: Nombre de la hoja (None para la primera)
+            
+        Returns:
+            int: sheetId, o None si la hoja no existe
+        """
+        key = (spreadsheet_id, sheet_name)
+        if key not in self._sheet_ids:
+            result = self._execute(self.service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id,
+                fields='sheets.properties(sheetId,title)'
+            ), 'read')
+            sheets = [sheet['properties'] for sheet in result.get('sheets', [])]
+            for properties in sheets:
+                self._sheet_ids[(spreadsheet_id, properties['title'])] = properties['sheetId']
+            if sheets:
+                self._sheet_ids[(spreadsheet_id, None)] = sheets[0]['sheetId']
+        return self._sheet_ids.get(key)
+    
+    def batch_get_values(self, spreadsheet_id: str, ranges: List[str]) -> List[List[List[Any]]]:
+        """
+        Lee varios rangos con una sola llamada a values().batchGet
+        
+        Args:
+            spreadsheet_id: ID de la hoja de cálculo
+            ranges: Rangos en notación A1
+            
+        Returns:
+            List: Valores de cada rango, en el mismo orden que `ranges`
+        """
+        if not ranges:
+            return []
+        result = self._execute(self.service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=ranges
+        ), 'read')
+        return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+    
     def get_processing_records(self, spreadsheet_id: str, limit: int = 100, sheet_name: str = None) -> List[Dict[str, Any]]:
         """
         Obtiene los registros de procesamiento de la hoja de cálculo
@@ -346,10 +597,10 @@ class GoogleSheetsClient:
         try:
             # Usar el nombre de la hoja especificado o el por defecto
             range_name = f"'{sheet_name}'!A2:S{limit + 1}" if sheet_name else f'A2:S{limit + 1}'
-            result = self.service.spreadsheets().values().get(
+            result = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range=range_name
-            ).execute()
+            ), 'read')
             
             values = result.get('values', [])
             records = []
@@ -394,7 +645,7 @@ class GoogleSheetsClient:
             print(f"✅ Obtenidos {len(records)} registros")
             return records
             
-        except HttpError as e:
+        except (HttpError, OSError) as e:
             print(f"❌ Error obteniendo registros: {e}")
             return []
     
@@ -417,66 +668,206 @@ class GoogleSheetsClient:
         Returns:
             Dict: Datos de campo procesados en formato jerárquico
         """
+        return self.get_field_data_entry().value
+    
+    def get_field_data_entry(self) -> CacheEntry:
+        """
+        Obtiene datos de campo a través de la caché de lectura
+        
+        Returns:
+            CacheEntry: Datos de campo con momento de carga y ETag
+        """
+        ttl, stale_ttl = self.CACHE_TTLS['field_data']
         try:
-            # Cargar configuración
-            config = self._load_config()
-            spreadsheet_id = config.get('spreadsheet_id')
-            sheet_name = config.get('sheet_name', 'Data-app')
-            
-            if not spreadsheet_id or spreadsheet_id == 'demo':
-                # Retornar datos de demostración
-                return self._get_demo_field_data_processed()
-            
-            # Autenticar si es necesario
-            if not self.service:
-                if not self.authenticate():
-                    return self._get_demo_field_data_processed()
+            return self._read_cache.get('field_data', self._fetch_field_data, ttl, stale_ttl)
+        except Exception as e:
+            print(f"❌ Error obteniendo datos de campo: {e}")
+            return CacheEntry(self._get_demo_field_data_processed(), time.time())
+    
+    def get_field_index(self) -> FieldDataIndex:
+        """
+        Índice de los datos de campo, reconstruido solo cuando la caché se refresca
+        
+        Returns:
+            FieldDataIndex: Índice para consultas de hijos y búsqueda por prefijo
+        """
+        entry = self.get_field_data_entry()
+        cached_entry, index = self._field_index
+        if cached_entry is not entry:
+            index = FieldDataIndex.from_field_data(entry.value)
+            self._field_index = (entry, index)
+        return index
+    
+    def _fetch_field_data(self) -> Dict[str, Any]:
+        """
+        Lee y procesa los datos de campo desde Google Sheets (sin caché)
+        
+        Returns:
+            Dict: Datos de campo procesados en formato jerárquico
+        """
+        return self.fetch_page_data(('field_data',))['field_data']
+    
+    def _parse_field_rows(self, values: List[List[str]]) -> Dict[str, Any]:
+        """
+        Procesa las filas de la hoja 'Data-campo' (rango FIELD_DATA_RANGE)
+        
+        Args:
+            values: Valores leídos, incluida la fila de títulos
             
-            # Obtener datos de la hoja 'Data-campo' (como en la versión antigua)
-            range_name = 'Data-campo!B:I'  # Empresa, Fundo, Sector, Lote (columnas específicas)
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=range_name
-            ).execute()
+        Returns:
+            Dict: Datos de campo procesados en formato jerárquico
+        """
+        if not values or len(values) <= 1:
+            # Si no hay datos, retornar estructura vacía
+            return {
+                'empresa': [],
+                'fundo': [],
+                'sector': [],
+                'lote': [],
+                'hierarchical': {}
+            }
+        
+        # Procesar datos (eliminar primera fila que contiene títulos)
+        rows = values[1:]  # Saltar encabezados
+        raw_data = []
+        
+        for row in rows:
+            if len(row) >= 4:  # Asegurar que tenemos al menos 4 columnas
+                empresa = row[0].strip() if len(row) > 0 and row[0] else ''
+                fundo = row[2].strip() if len(row) > 2 and row[2] else ''  # Columna D (índice 2)
+                sector = row[5].strip() if len(row) > 5 and row[5] else ''  # Columna G (índice 5)
+                lote = row[7].strip() if len(row) > 7 and row[7] else ''    # Columna I (índice 7)
+                
+                if empresa:  # Solo agregar si hay empresa
+                    raw_data.append({
+                        'empresa': empresa,
+                        'fundo': fundo,
+                        'sector': sector,
+                        'lote': lote,
+                        'hilera': '',  # No se usa en esta estructura
+                        'numero_planta': ''  # No se usa en esta estructura
+                    })
+        
+        # Procesar datos en formato jerárquico
+        return self._process_field_data(raw_data)
+    
+    def fetch_page_data(self, keys: tuple = ('field_data', 'historial')) -> Dict[str, Any]:
+        """
+        Lee con un único values().batchGet todo lo que necesita una carga de página
+        
+        Además de `keys` se incluyen los datos cuya caché está vencida y la fila de
+        encabezados si aún no se verificó, de modo que una carga en frío hace una sola
+        petición. Los resultados se guardan en la caché de lectura.
+        
+        Args:
+            keys: Datos pedidos ('field_data' y/o 'historial')
             
-            values = result.get('values', [])
-            if not values or len(values) <= 1:
-                # Si no hay datos, retornar estructura vacía
-                return {
-                    'empresa': [],
-                    'fundo': [],
-                    'sector': [],
-                    'lote': [],
-                    'hierarchical': {}
+        Returns:
+            Dict: 'field_data', 'historial' y 'headers' (solo los que se leyeron)
+        """
+        # Cargar configuración
+        config = self._load_config()
+        spreadsheet_id = config.get('spreadsheet_id')
+        sheet_name = config.get('sheet_name', 'Data-app')
+        
+        if not spreadsheet_id or spreadsheet_id == 'demo':
+            # Retornar datos de demostración
+            return {
+                'field_data': self._get_demo_field_data_processed(),
+                'historial': self._get_demo_historial_processed(),
+                'headers': self._get_demo_headers()
+            }
+        
+        # Autenticar si es necesario
+        if not self.service:
+            if not self.authenticate():
+                raise RuntimeError("No se pudo autenticar con Google Sheets")
+        
+        keys = set(keys)
+        for key, (ttl, _) in self.CACHE_TTLS.items():
+            if not self._read_cache.is_fresh(key, ttl):
+                keys.add(key)
+        header_key = (spreadsheet_id, sheet_name)
+        read_headers = header_key not in self._headers_verified
+        
+        data = {}
+        with self._historial_lock:
+            ranges = []
+            if 'field_data' in keys:
+                ranges.append(FIELD_DATA_RANGE)
+            if read_headers:
+                ranges.append(f"'{sheet_name}'!A1:S1")
+            if 'historial' in keys:
+                # Las filas nuevas más la última ya leída (la fila 1 son los encabezados)
+                ranges.append(self._historial_range(sheet_name))
+            
+            results = iter(self.batch_get_values(spreadsheet_id, ranges))
+            
+            if 'field_data' in keys:
+                data['field_data'] = self._parse_field_rows(next(results))
+            
+            if read_headers:
+                values = next(results)
+                data['headers'] = values[0] if values else []
+                if data['headers'] == HEADERS:
+                    self._headers_verified.add(header_key)
+                else:
+                    print(f"🔄 Encabezados desactualizados en '{sheet_name}'; se corregirán con el próximo registro")
+            
+            if 'historial' in keys:
+                values = next(results)
+                if self._historial_rows_read:
+                    if values[:1] == [self._historial_last_row]:
+                        values = values[1:]
+                    else:
+                        # La última fila leída cambió o ya no existe: se borraron o editaron
+                        # filas, así que la copia se descarta y la hoja se relee completa
+                        print("🔄 El historial cambió en la hoja; releyendo completo")
+                        self._reset_historial()
+                        values = self.batch_get_values(spreadsheet_id, [self._historial_range(sheet_name)])[0]
+                
+                for row in values:
+                    record = self._parse_historial_row(row)
+                    if record:
+                        self._historial_records.append(record)
+                self._historial_rows_read += len(values)
+                
+                if values:
+                    self._historial_last_row = values[-1]
+                    print(f"🔄 Historial sincronizado: {len(values)} filas nuevas, {len(self._historial_records)} en total")
+                
+                data['historial'] = {
+                    'success': True,
+                    'procesamientos': list(self._historial_records)
                 }
-            
-            # Procesar datos (eliminar primera fila que contiene títulos)
-            rows = values[1:]  # Saltar encabezados
-            raw_data = []
-            
-            for row in rows:
-                if len(row) >= 4:  # Asegurar que tenemos al menos 4 columnas
-                    empresa = row[0].strip() if len(row) > 0 and row[0] else ''
-                    fundo = row[2].strip() if len(row) > 2 and row[2] else ''  # Columna D (índice 2)
-                    sector = row[5].strip() if len(row) > 5 and row[5] else ''  # Columna G (índice 5)
-                    lote = row[7].strip() if len(row) > 7 and row[7] else ''    # Columna I (índice 7)
-                    
-                    if empresa:  # Solo agregar si hay empresa
-                        raw_data.append({
-                            'empresa': empresa,
-                            'fundo': fundo,
-                            'sector': sector,
-                            'lote': lote,
-                            'hilera': '',  # No se usa en esta estructura
-                            'numero_planta': ''  # No se usa en esta estructura
-                        })
-            
-            # Procesar datos en formato jerárquico
-            return self._process_field_data(raw_data)
-            
-        except Exception as e:
-            print(f"❌ Error obteniendo datos de campo: {e}")
-            return self._get_demo_field_data_processed()
+        
+        for key in ('field_data', 'historial'):
+            if key in data:
+                self._read_cache.put(key, data[key])
+        
+        return data
+    
+    def _historial_range(self, sheet_name: str) -> str:
+        """Rango del historial desde la última fila leída (o desde la fila 2 si no se leyó ninguna)"""
+        return f"'{sheet_name}'!A{self._historial_rows_read + 1 if self._historial_rows_read else 2}:S"
+    
+    def _reset_historial(self):
+        """Descarta la copia del historial (con _historial_lock tomado)"""
+        self._historial_records = []
+        self._historial_rows_read = 0
+        self._historial_last_row = None
+        self._historial_generation += 1
+    
+    def resync_historial(self):
+        """
+        Fuerza a releer el historial completo en la próxima lectura
+        
+        La lectura incremental detecta filas borradas o una última fila editada;
+        las ediciones en filas anteriores solo se ven tras una resincronización.
+        """
+        with self._historial_lock:
+            self._reset_historial()
+        self._read_cache.invalidate('historial')
     
     def get_historial(self) -> Dict[str, Any]:
         """
@@ -485,84 +876,200 @@ class GoogleSheetsClient:
         Returns:
             Dict: Historial de procesamientos con formato correcto
         """
+        return self.get_historial_entry().value
+    
+    def get_historial_entry(self) -> CacheEntry:
+        """
+        Obtiene el historial a través de la caché de lectura
+        
+        Returns:
+            CacheEntry: Historial con momento de carga y ETag
+        """
+        ttl, stale_ttl = self.CACHE_TTLS['historial']
         try:
-            # Cargar configuración
-            config = self._load_config()
-            spreadsheet_id = config.get('spreadsheet_id')
-            sheet_name = config.get('sheet_name', 'Data-app')
-            
-            if not spreadsheet_id or spreadsheet_id == 'demo':
-                # Retornar historial de demostración
-                return self._get_demo_historial_processed()
-            
-            # Autenticar si es necesario
-            if not self.service:
-                if not self.authenticate():
-                    return self._get_demo_historial_processed()
-            
-            # Obtener historial de la hoja
-            range_name = f"'{sheet_name}'!A2:S1000"  # Ajustar rango según necesidad
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            historial = []
+            return self._read_cache.get('historial', self._fetch_historial, ttl, stale_ttl)
+        except Exception as e:
+            print(f"❌ Error obteniendo historial: {e}")
+            return CacheEntry(self._get_demo_historial_processed(), time.time())
+    
+    def _fetch_historial(self) -> Dict[str, Any]:
+        """
+        Sincroniza el historial de procesamientos desde Google Sheets (sin caché)
+        
+        Solo descarga las filas agregadas desde la última sincronización; la hoja
+        completa se relee si la última fila leída cambió (ver resync_historial).
+        
+        Returns:
+            Dict: Historial de procesamientos con formato correcto
+        """
+        return self.fetch_page_data(('historial',))['historial']
+    
+    def get_historial_since(self, cursor: Optional[tuple] = None) -> tuple:
+        """
+        Registros de la copia local del historial agregados después de `cursor`
+        
+        No consulta Sheets: devuelve lo que ya leyó fetch_page_data.
+        
+        Args:
+            cursor: Cursor devuelto por la llamada anterior (None para empezar)
             
-            for row in values:
-                if len(row) >= 15:  # Mínimo 15 columnas para historial completo
-                    # Convertir tipos numéricos
-                    try:
-                        latitud = float(row[11]) if len(row) > 11 and row[11] and row[11].strip() else None
-                    except (ValueError, TypeError):
-                        latitud = None
-                    
-                    try:
-                        longitud = float(row[12]) if len(row) > 12 and row[12] and row[12].strip() else None
-                    except (ValueError, TypeError):
-                        longitud = None
-                    
-                    try:
-                        porcentaje_luz = float(row[13]) if len(row) > 13 and row[13] and row[13].strip() else 0
-                    except (ValueError, TypeError):
-                        porcentaje_luz = 0
-                    
-                    try:
-                        porcentaje_sombra = float(row[14]) if len(row) > 14 and row[14] and row[14].strip() else 0
-                    except (ValueError, TypeError):
-                        porcentaje_sombra = 0
-                    
-                    historial.append({
-                        'id': row[0] if len(row) > 0 else '',
-                        'fecha': row[1] if len(row) > 1 else '',
-                        'hora': row[2] if len(row) > 2 else '',
-                        'imagen': row[3] if len(row) > 3 else '',
-                        'nombre_archivo': row[4] if len(row) > 4 else '',
-                        'empresa': row[5] if len(row) > 5 else '',
-                        'fundo': row[6] if len(row) > 6 else '',
-                        'sector': row[7] if len(row) > 7 else '',
-                        'lote': row[8] if len(row) > 8 else '',
-                        'hilera': row[9] if len(row) > 9 else '',
-                        'numero_planta': row[10] if len(row) > 10 else '',
-                        'latitud': latitud,
-                        'longitud': longitud,
-                        'porcentaje_luz': porcentaje_luz,
-                        'porcentaje_sombra': porcentaje_sombra,
-                        'dispositivo': row[15] if len(row) > 15 else '',
-                        'software': row[16] if len(row) > 16 else '',
-                        'direccion': row[17] if len(row) > 17 else '',
-                        'timestamp': row[18] if len(row) > 18 else ''
-                    })
+        Returns:
+            tuple: (registros nuevos, cursor); si la copia se releyó desde cero
+                desde la llamada anterior, se devuelven todos los registros
+        """
+        generation, count = cursor or (None, 0)
+        with self._historial_lock:
+            if generation != self._historial_generation:
+                count = 0
+            return self._historial_records[count:], (self._historial_generation, len(self._historial_records))
+    
+    @staticmethod
+    def _parse_historial_row(row: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Convierte una fila de la hoja en un registro de historial
+        
+        Args:
+            row: Valores de la fila (columnas A:S)
             
-            return {
-                'success': True,
-                'procesamientos': historial
-            }
+        Returns:
+            Dict: Registro, o None si la fila está incompleta
+        """
+        if len(row) < 15:  # Mínimo 15 columnas para historial completo
+            return None
+        
+        # Convertir tipos numéricos
+        try:
+            latitud = float(row[11]) if len(row) > 11 and row[11] and row[11].strip() else None
+        except (ValueError, TypeError):
+            latitud = None
+        
+        try:
+            longitud = float(row[12]) if len(row) > 12 and row[12] and row[12].strip() else None
+        except (ValueError, TypeError):
+            longitud = None
+        
+        try:
+            porcentaje_luz = float(row[13]) if len(row) > 13 and row[13] and row[13].strip() else 0
+        except (ValueError, TypeError):
+            porcentaje_luz = 0
+        
+        try:
+            porcentaje_sombra = float(row[14]) if len(row) > 14 and row[14] and row[14].strip() else 0
+        except (ValueError, TypeError):
+            porcentaje_sombra = 0
+        
+        return {
+            'id': row[0] if len(row) > 0 else '',
+            'fecha': row[1] if len(row) > 1 else '',
+            'hora': row[2] if len(row) > 2 else '',
+            'imagen': row[3] if len(row) > 3 else '',
+            'nombre_archivo': row[4] if len(row) > 4 else '',
+            'empresa': row[5] if len(row) > 5 else '',
+            'fundo': row[6] if len(row) > 6 else '',
+            'sector': row[7] if len(row) > 7 else '',
+            'lote': row[8] if len(row) > 8 else '',
+            'hilera': row[9] if len(row) > 9 else '',
+            'numero_planta': row[10] if len(row) > 10 else '',
+            'latitud': latitud,
+            'longitud': longitud,
+            'porcentaje_luz': porcentaje_luz,
+            'porcentaje_sombra': porcentaje_sombra,
+            'dispositivo': row[15] if len(row) > 15 else '',
+            'software': row[16] if len(row) > 16 else '',
+            'direccion': row[17] if len(row) > 17 else '',
+            'timestamp': row[18] if len(row) > 18 else ''
+        }
+    
+    def get_historial_page(self, cursor: Optional[str] = None, limit: int = 1000,
+                           filtros: Optional[Dict[str, Any]] = None) -> CacheEntry:
+        """
+        Obtiene una página filtrada del historial
+        
+        Args:
+            cursor: Cursor devuelto por la página anterior (None para empezar)
+            limit: Número máximo de registros de la página
+            filtros: empresa/fundo/sector/lote (exactos), fecha_desde/fecha_hasta
+                (YYYY-MM-DD, inclusivos), luz_min/luz_max y sombra_min/sombra_max
             
-        except Exception as e:
-            print(f"❌ Error obteniendo historial: {e}")
-            return self._get_demo_historial_processed()
+        Returns:
+            CacheEntry: Página {'success', 'procesamientos', 'next_cursor', 'total'} con ETag propio;
+                total es el número de registros que cumplen los filtros
+        """
+        entry = self.get_historial_entry()
+        records = entry.value.get('procesamientos', [])
+        filtros = {k: v for k, v in (filtros or {}).items() if v not in (None, '')}
+        
+        start = self._decode_cursor(cursor)
+        page = []
+        index = start
+        while index < len(records) and len(page) < limit:
+            if self._match_historial(records[index], filtros):
+                page.append(records[index])
+            index += 1
+        
+        return CacheEntry({
+            'success': True,
+            'procesamientos': page,
+            'next_cursor': self._encode_cursor(index) if index < len(records) else None,
+            'total': self._historial_total(entry, filtros)
+        }, entry.fetched_at)
+    
+    def _historial_total(self, entry: CacheEntry, filtros: Dict[str, Any]) -> int:
+        """
+        Número de registros de `entry` que cumplen los filtros
+        
+        Se cuenta una vez por combinación de filtros y se reutiliza en las páginas
+        siguientes hasta que la caché entrega otra entrada del historial.
+        """
+        records = entry.value.get('procesamientos', [])
+        if not filtros:
+            return len(records)
+        
+        cached_entry, totals = self._historial_totals
+        if cached_entry is not entry:
+            totals = {}
+            self._historial_totals = (entry, totals)
+        
+        key = tuple(sorted(filtros.items()))
+        if key not in totals:
+            if len(totals) >= self.HISTORIAL_TOTALS_MAX:
+                totals.clear()
+            totals[key] = sum(1 for record in records if self._match_historial(record, filtros))
+        return totals[key]
+    
+    def _match_historial(self, record: Dict[str, Any], filtros: Dict[str, Any]) -> bool:
+        """Indica si un registro cumple los filtros del historial"""
+        for campo in self.HISTORIAL_FILTROS:
+            if campo in filtros and record.get(campo) != filtros[campo]:
+                return False
+        
+        fecha = record.get('fecha') or ''
+        if 'fecha_desde' in filtros and fecha < filtros['fecha_desde']:
+            return False
+        if 'fecha_hasta' in filtros and fecha > filtros['fecha_hasta']:
+            return False
+        
+        for campo, prefijo in (('porcentaje_luz', 'luz'), ('porcentaje_sombra', 'sombra')):
+            valor = record.get(campo) or 0
+            if f'{prefijo}_min' in filtros and valor < filtros[f'{prefijo}_min']:
+                return False
+            if f'{prefijo}_max' in filtros and valor > filtros[f'{prefijo}_max']:
+                return False
+        
+        return True
+    
+    @staticmethod
+    def _encode_cursor(index: int) -> str:
+        return base64.urlsafe_b64encode(str(index).encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str]) -> int:
+        if not cursor:
+            return 0
+        try:
+            return max(int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')), 0)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Cursor inválido: {cursor}")
     
     def get_headers(self) -> List[str]:
         """
@@ -588,10 +1095,10 @@ class GoogleSheetsClient:
             
             # Obtener encabezados de la hoja
             range_name = f"'{sheet_name}'!A1:S1"
-            result = self.service.spreadsheets().values().get(
+            result = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range=range_name
-            ).execute()
+            ), 'read')
             
             values = result.get('values', [[]])
             headers = values[0] if values else []
@@ -634,12 +1141,12 @@ class GoogleSheetsClient:
             
             range_name = f"'{sheet_name}'!A1:{chr(65 + len(new_headers) - 1)}1"
             
-            self.service.spreadsheets().values().update(
+            self._execute(self.service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ), 'write')
             
             print("✅ Encabezados actualizados correctamente")
             return True
@@ -648,52 +1155,14 @@ class GoogleSheetsClient:
             print(f"❌ Error actualizando encabezados: {e}")
             return False
     
-    def _load_config(self) -> Dict[str, Any]:
+    def _load_config(self) -> Mapping[str, Any]:
         """
-        Carga la configuración de Google Sheets
+        Configuración de Google Sheets (leída una sola vez al crear el cliente)
         
         Returns:
-            Dict: Configuración cargada
+            Mapping: Configuración de solo lectura
         """
-        config = {}
-        
-        # Cargar desde variables de entorno
-        if os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID'):
-            config['spreadsheet_id'] = os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID')
-            config['sheet_name'] = os.getenv('GOOGLE_SHEETS_SHEET_NAME', 'Data-app')
-            
-            if os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64'):
-                credentials_b64 = os.getenv('GOOGLE_SHEETS_CREDENTIALS_BASE64')
-                # Agregar padding si es necesario
-                missing_padding = len(credentials_b64) % 4
-                if missing_padding:
-                    credentials_b64 += '=' * (4 - missing_padding)
-                credentials_json = base64.b64decode(credentials_b64).decode('utf-8')
-                config['credentials'] = json.loads(credentials_json)
-                
-            if os.getenv('GOOGLE_SHEETS_TOKEN_BASE64'):
-                token_b64 = os.getenv('GOOGLE_SHEETS_TOKEN_BASE64')
-                # Agregar padding si es necesario
-                missing_padding = len(token_b64) % 4
-                if missing_padding:
-                    token_b64 += '=' * (4 - missing_padding)
-                token_json = base64.b64decode(token_b64).decode('utf-8')
-                config['token'] = json.loads(token_json)
-        
-        # Cargar desde archivo si no hay variables de entorno
-        if not config.get('spreadsheet_id'):
-            try:
-                with open('google_sheets_config.json', 'r') as f:
-                    file_config = json.load(f)
-                    config.update(file_config)
-            except FileNotFoundError:
-                print("⚠️ No se encontró google_sheets_config.json")
-                config = {
-                    'spreadsheet_id': 'demo',
-                    'sheet_name': 'Data-app'
-                }
-        
-        return config
+        return self.config
     
     def _process_field_data(self, raw_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -705,40 +1174,7 @@ class GoogleSheetsClient:
         Returns:
             Dict: Datos procesados en formato jerárquico
         """
-        # Extraer listas únicas
-        empresas = list(set([item['empresa'] for item in raw_data if item['empresa']]))
-        fundos = list(set([item['fundo'] for item in raw_data if item['fundo']]))
-        sectores = list(set([item['sector'] for item in raw_data if item['sector']]))
-        lotes = list(set([item['lote'] for item in raw_data if item['lote']]))
-        
-        # Crear estructura jerárquica
-        hierarchical = {}
-        
-        for item in raw_data:
-            empresa = item['empresa']
-            fundo = item['fundo']
-            sector = item['sector']
-            lote = item['lote']
-            
-            if not empresa or not fundo or not sector or not lote:
-                continue
-                
-            if empresa not in hierarchical:
-                hierarchical[empresa] = {}
-            if fundo not in hierarchical[empresa]:
-                hierarchical[empresa][fundo] = {}
-            if sector not in hierarchical[empresa][fundo]:
-                hierarchical[empresa][fundo][sector] = []
-            if lote not in hierarchical[empresa][fundo][sector]:
-                hierarchical[empresa][fundo][sector].append(lote)
-        
-        return {
-            'empresa': sorted(empresas),
-            'fundo': sorted(fundos),
-            'sector': sorted(sectores),
-            'lote': sorted(lotes),
-            'hierarchical': hierarchical
-        }
+        return FieldDataIndex(raw_data).to_dict()
     
     def _get_demo_field_data_processed(self) -> Dict[str, Any]:
         """
@@ -840,11 +1276,7 @@ class GoogleSheetsClient:
         Returns:
             List[str]: Encabezados de demostración
         """
-        return [
-            'ID', 'Fecha', 'Hora', 'Imagen', 'Nombre Archivo', 'Empresa', 'Fundo', 'Sector', 'Lote', 'Hilera', 'N° Planta',
-            'Latitud', 'Longitud', 'Porcentaje Luz', 'Porcentaje Sombra',
-            'Dispositivo', 'Software', 'Dirección', 'Timestamp'
-        ]
+        return list(HEADERS)
 
 
 def test_sheets_client():
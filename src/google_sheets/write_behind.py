@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Write-behind para Google Sheets
+Acumula registros de procesamiento en un spool local y los envía en lotes
+con un único values().append por lote.
+"""
+
+import atexit
+import itertools
+import json
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .sheets_client import GoogleSheetsClient
+
+
+class JsonlSpool:
+    """
+    Spool durable en un archivo JSONL
+
+    Cada fila es una línea {'seq', 'row'} y cada confirmación agrega una línea
+    {'ack': [seq, ...]}. El archivo se compacta (reescritura atómica solo con las
+    filas pendientes) al arrancar y cuando las líneas muertas superan
+    `compact_threshold` y a las filas pendientes.
+    """
+
+    def __init__(self, path: str = 'sheets_spool.jsonl', compact_threshold: int = 1000):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        # Filas pendientes por seq, en orden de llegada
+        self._entries: Dict[int, List[Any]] = {}
+        self._next_seq = 0
+        # Líneas del archivo que ya no aportan nada (filas confirmadas y acks)
+        self._dead_lines = 0
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        """Recupera las filas no confirmadas de una ejecución anterior"""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea truncada por un corte: se descarta
+                    self._dead_lines += 1
+                    continue
+                if 'ack' in entry:
+                    for seq in entry['ack']:
+                        self._entries.pop(seq, None)
+                    self._dead_lines += len(entry['ack']) + 1
+                    continue
+                self._entries[entry['seq']] = entry['row']
+                self._next_seq = max(self._next_seq, entry['seq'] + 1)
+
+        if self._dead_lines:
+            self._compact()
+        if self._entries:
+            print(f"📦 Recuperadas {len(self._entries)} filas pendientes del spool")
+
+    def _compact(self):
+        """Reescribe el archivo solo con las filas pendientes (con _lock tomado o al arrancar)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for seq, row in self._entries.items():
+                f.write(json.dumps({'seq': seq, 'row': row}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dead_lines = 0
+
+    def _append(self, entry: Dict[str, Any]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Guarda la fila del registro en el archivo (con fsync) antes de devolver"""
+        row = GoogleSheetsClient.record_to_row(record)
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._append({'seq': seq, 'row': row})
+            self._entries[seq] = row
+        return True
+
+    def pending(self, limit: int) -> List[Tuple[Hashable, List[Any]]]:
+        with self._lock:
+            return list(itertools.islice(self._entries.items(), limit))
+
+    def acknowledge(self, keys: List[Hashable]):
+        """Marca como confirmadas las filas agregando una línea de ack al spool"""
+        with self._lock:
+            keys = [key for key in keys if key in self._entries]
+            if not keys:
+                return
+            self._append({'ack': keys})
+            for key in keys:
+                del self._entries[key]
+            self._dead_lines += len(keys) + 1
+            if self._dead_lines >= max(self.compact_threshold, len(self._entries)):
+                self._compact()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class WriteBehindWriter:
+    """
+    Escritor diferido de registros hacia Google Sheets
+
+    Cada registro se guarda primero en un spool durable y se envía en una sola
+    petición multi-fila cada `batch_size` registros o cada `flush_interval_ms`
+    milisegundos. Las filas solo se borran del spool cuando Sheets confirma el
+    append; si falla, se reintentan en el siguiente ciclo.
+
+    El spool es cualquier objeto con add(record), pending(limit) → [(clave, fila)],
+    acknowledge(claves) y len(); por defecto un JsonlSpool. Sin spreadsheet_id
+    (modo demo) los registros se guardan pero no se envían.
+    """
+
+    def __init__(
+        self,
+        client: GoogleSheetsClient,
+        spreadsheet_id: Optional[str],
+        sheet_name: str = None,
+        batch_size: int = 50,
+        flush_interval_ms: int = 2000,
+        spool_path: str = 'sheets_spool.jsonl',
+        spool: Any = None
+    ):
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.spool = spool if spool is not None else JsonlSpool(spool_path)
+
+        # Registros encolados desde el último envío (para despertar al completar un lote)
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'WriteBehindWriter':
+        """Inicia el hilo de envío y registra el vaciado al cerrar el proceso"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sheets-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def enqueue(self, record: Dict[str, Any]) -> bool:
+        """
+        Encola un registro de procesamiento
+
+        Args:
+            record: Diccionario con los datos del procesamiento
+
+        Returns:
+            bool: True si se guardó en el spool (False si el spool lo rechazó, p. ej. id repetido)
+        """
+        if not self.spool.add(record):
+            return False
+        with self._lock:
+            self._queued += 1
+            lleno = self._queued >= self.batch_size
+        if lleno:
+            self._wakeup.set()
+        return True
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.spool)
+
+    def flush(self, full_batches_only: bool = False) -> bool:
+        """
+        Envía las filas pendientes en lotes de `batch_size`
+
+        Args:
+            full_batches_only: Enviar solo lotes completos y dejar el resto para el siguiente ciclo
+
+        Returns:
+            bool: True si no hubo errores de envío
+        """
+        if not self.spreadsheet_id:
+            return True
+
+        with self._flush_lock:
+            while True:
+                batch = self.spool.pending(self.batch_size)
+                if not batch or (full_batches_only and len(batch) < self.batch_size):
+                    return True
+
+                if not self.client.service and not self.client.authenticate():
+                    return False
+
+                if not self.client.append_rows(self.spreadsheet_id, [row for _, row in batch], self.sheet_name):
+                    return False
+
+                self.spool.acknowledge([key for key, _ in batch])
+                with self._lock:
+                    self._queued = max(self._queued - len(batch), 0)
+                print(f"✅ {len(batch)} registros enviados a Google Sheets")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # Despertado por un lote completo: enviar solo lotes completos;
+            # por tiempo: enviar todo lo pendiente
+            batch_ready = self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush(full_batches_only=batch_ready)
+            except Exception as e:
+                print(f"❌ Error en envío diferido a Google Sheets: {e}")
+
+    def close(self):
+        """Detiene el hilo y envía lo pendiente"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            if self.spreadsheet_id and (not self.flush() or self.pending_count):
+                print(f"⚠️ Quedan {self.pending_count} filas sin enviar; se enviarán al reiniciar")
+        except Exception as e:
+            print(f"❌ Error vaciando el spool de Google Sheets: {e}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Lector EXIF mínimo
+Lee solo el segmento APP1 (JPEG) o la cabecera TIFF y resuelve en una pasada por
+IFD los tags de GPS, fecha y dispositivo, sin decodificar píxeles ni recorrer
+MakerNotes ni miniaturas.
+"""
+
+import struct
+from typing import Any, Dict, Optional
+
+from PIL.ExifTags import TAGS
+
+# Tags buscados por IFD (id → nombre); el resto de entradas se salta sin decodificar
+TAGS_EXIF = {
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+    0xA002: 'ExifImageWidth',
+    0xA003: 'ExifImageHeight',
+}
+
+TAGS_GPS = {
+    0x0001: 'GPSLatitudeRef',
+    0x0002: 'GPSLatitude',
+    0x0003: 'GPSLongitudeRef',
+    0x0004: 'GPSLongitude',
+    0x0005: 'GPSAltitudeRef',
+    0x0006: 'GPSAltitude',
+    0x0007: 'GPSTimeStamp',
+    0x001D: 'GPSDateStamp',
+}
+
+PUNTERO_EXIF = 0x8769
+PUNTERO_GPS = 0x8825
+
+# Tipo TIFF → (bytes por valor, formato struct)
+TIPOS = {
+    1: (1, 'B'),    # BYTE
+    2: (1, 's'),    # ASCII
+    3: (2, 'H'),    # SHORT
+    4: (4, 'L'),    # LONG
+    5: (8, 'LL'),   # RATIONAL
+    7: (1, 's'),    # UNDEFINED
+    9: (4, 'l'),    # SLONG
+    10: (8, 'll'),  # SRATIONAL
+}
+
+# Los valores más largos (p. ej. bloques binarios) no se decodifican en IFD0
+MAX_BYTES_VALOR = 256
+
+
+def _segmento_tiff(datos: bytes) -> Optional[memoryview]:
+    """Localiza los datos TIFF: el APP1 'Exif' de un JPEG o el propio archivo si es TIFF"""
+    vista = memoryview(datos)
+    if datos[:4] in (b'II*\x00', b'MM\x00*'):
+        return vista
+    if datos[:2] != b'\xff\xd8':
+        return None
+
+    posicion = 2
+    while posicion + 4 <= len(datos):
+        if datos[posicion] != 0xFF:
+            return None
+        marcador = datos[posicion + 1]
+        if marcador == 0xFF:
+            # Relleno entre marcadores
+            posicion += 1
+            continue
+        if marcador in (0xD9, 0xDA):
+            # Fin de imagen o inicio de los datos comprimidos: no hay EXIF
+            return None
+        longitud = struct.unpack_from('>H', datos, posicion + 2)[0]
+        if marcador == 0xE1 and datos[posicion + 4:posicion + 10] == b'Exif\x00\x00':
+            return vista[posicion + 10:posicion + 2 + longitud]
+        posicion += 2 + longitud
+    return None
+
+
+def _leer_valor(tiff: memoryview, orden: str, tipo: int, cantidad: int, campo: int) -> Any:
+    tamano, formato = TIPOS[tipo]
+    total = tamano * cantidad
+    inicio = campo if total <= 4 else struct.unpack_from(orden + 'L', tiff, campo)[0]
+    crudo = bytes(tiff[inicio:inicio + total])
+    if len(crudo) < total:
+        raise ValueError("Valor fuera del segmento EXIF")
+
+    if tipo == 2:
+        return crudo.split(b'\x00', 1)[0].decode('utf-8', errors='replace').strip()
+    if tipo == 7:
+        return crudo
+    if tipo in (5, 10):
+        numeros = struct.unpack(orden + formato[0] * (2 * cantidad), crudo)
+        valores = [n / d if d else 0.0 for n, d in zip(numeros[::2], numeros[1::2])]
+    else:
+        valores = list(struct.unpack(orden + formato * cantidad, crudo))
+    return valores[0] if cantidad == 1 else tuple(valores)
+
+
+def _leer_ifd(tiff: memoryview, orden: str, desplazamiento: int, nombres: Optional[Dict[int, str]]) -> Dict[Any, Any]:
+    """
+    Lee las entradas de un IFD
+
+    Con `nombres` solo se decodifican esos tags (clave = nombre); sin él se
+    decodifican todos los valores cortos (clave = id del tag).
+    """
+    resultado = {}
+    entradas = struct.unpack_from(orden + 'H', tiff, desplazamiento)[0]
+    for i in range(entradas):
+        campo = desplazamiento + 2 + 12 * i
+        tag, tipo, cantidad = struct.unpack_from(orden + 'HHL', tiff, campo)
+        if tipo not in TIPOS:
+            continue
+        if nombres is not None:
+            if tag not in nombres:
+                continue
+            clave = nombres[tag]
+        else:
+            if TIPOS[tipo][0] * cantidad > MAX_BYTES_VALOR:
+                continue
+            clave = tag
+        try:
+            resultado[clave] = _leer_valor(tiff, orden, tipo, cantidad, campo + 8)
+        except (ValueError, struct.error):
+            continue
+    return resultado
+
+
+def leer_exif(datos: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Lee los metadatos EXIF de los primeros bytes de una imagen JPEG o TIFF
+
+    Basta con la cabecera (normalmente los primeros 64 KB); los píxeles nunca se leen.
+
+    Args:
+        datos: Bytes de la imagen (completa o solo su comienzo)
+
+    Returns:
+        Dict con 'ifd0' (tags de IFD0 por nombre), 'exif' y 'gps' (tags buscados
+        por nombre), o None si no es JPEG/TIFF o no tiene EXIF
+    """
+    tiff = _segmento_tiff(datos)
+    if tiff is None or len(tiff) < 8:
+        return None
+
+    orden = '<' if bytes(tiff[:2]) == b'II' else '>'
+    try:
+        ifd0 = _leer_ifd(tiff, orden, struct.unpack_from(orden + 'L', tiff, 4)[0], None)
+    except struct.error:
+        return None
+
+    resultado = {'ifd0': {TAGS.get(tag, tag): valor for tag, valor in ifd0.items()}, 'exif': {}, 'gps': {}}
+    for puntero, clave, nombres in ((PUNTERO_EXIF, 'exif', TAGS_EXIF), (PUNTERO_GPS, 'gps', TAGS_GPS)):
+        if isinstance(ifd0.get(puntero), int):
+            try:
+                resultado[clave] = _leer_ifd(tiff, orden, ifd0[puntero], nombres)
+            except struct.error:
+                # IFD truncado (p. ej. solo se recibió el comienzo del archivo)
+                pass
+    return resultado
+
+
+def dms_a_decimal(dms: Any, referencia: str = '') -> Optional[float]:
+    """Convierte (grados, minutos, segundos) a grados decimales (negativo para S/W)"""
+    if not isinstance(dms, tuple) or len(dms) != 3:
+        return None
+    decimal = dms[0] + dms[1] / 60.0 + dms[2] / 3600.0
+    return -decimal if referencia.upper() in ('S', 'W') else decimal
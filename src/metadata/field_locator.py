@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Field Locator
+Ubica coordenadas GPS en los polígonos de campo (empresa/fundo/sector/lote)
+cargados desde GeoJSON, sin red: un índice de rejilla reduce cada consulta a
+unos pocos polígonos candidatos y el test punto-en-polígono resuelve el resto.
+"""
+
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.google_sheets.field_index import LEVELS
+
+# Tamaño de celda por defecto, en grados (~0.5 km en el ecuador)
+DEFAULT_CELL_SIZE = 0.005
+
+# GeoJSON con los polígonos de campo (configurable por entorno)
+DEFAULT_GEOJSON_PATH = 'campos.geojson'
+
+Ring = List[Tuple[float, float]]
+
+
+def _point_in_ring(lng: float, lat: float, ring: Ring) -> bool:
+    """Ray casting sobre un anillo de vértices (lng, lat)"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _ring_area(ring: Ring) -> float:
+    return abs(sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))) / 2.0
+
+
+class FieldPolygon:
+    """Polígono (o multipolígono) de un nodo de campo, con sus propiedades y bbox"""
+
+    def __init__(self, polygons: List[List[Ring]], properties: Dict[str, str]):
+        self.polygons = polygons
+        self.properties = properties
+        # Profundidad del nodo: 1 = empresa ... 4 = lote
+        self.depth = max((i + 1 for i, level in enumerate(LEVELS) if properties.get(level)), default=0)
+        xs = [x for polygon in polygons for x, _ in polygon[0]]
+        ys = [y for polygon in polygons for _, y in polygon[0]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self.area = sum(_ring_area(polygon[0]) for polygon in polygons)
+
+    def contains(self, lng: float, lat: float) -> bool:
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= lng <= max_x and min_y <= lat <= max_y):
+            return False
+        for exterior, *holes in self.polygons:
+            if _point_in_ring(lng, lat, exterior) and not any(_point_in_ring(lng, lat, hole) for hole in holes):
+                return True
+        return False
+
+
+class FieldLocator:
+    """
+    Índice espacial de los polígonos de campo
+
+    - cells[(ix, iy)] → polígonos cuyo bbox toca la celda
+    - locate(lat, lng) → {empresa, fundo, sector, lote} de los polígonos que contienen el punto
+    """
+
+    def __init__(self, fields: Iterable[FieldPolygon] = (), cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.fields: List[FieldPolygon] = list(fields)
+        self.cells: Dict[Tuple[int, int], List[FieldPolygon]] = {}
+
+        for field in self.fields:
+            min_x, min_y, max_x, max_y = field.bbox
+            for ix in range(self._cell(min_x), self._cell(max_x) + 1):
+                for iy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self.cells.setdefault((ix, iy), []).append(field)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_size)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    @classmethod
+    def from_geojson(cls, geojson: Dict[str, Any], cell_size: float = DEFAULT_CELL_SIZE) -> 'FieldLocator':
+        """
+        Construye el índice desde un FeatureCollection
+
+        Cada feature es un Polygon o MultiPolygon (coordenadas lng, lat) cuyas
+        propiedades empresa/fundo/sector/lote identifican el nodo; un fundo sin
+        sector ni lote es válido y se usa cuando ningún lote contiene el punto.
+        """
+        fields = []
+        for feature in geojson.get('features', []):
+            geometry = feature.get('geometry') or {}
+            coordinates = geometry.get('coordinates') or []
+            if geometry.get('type') == 'Polygon':
+                coordinates = [coordinates]
+            elif geometry.get('type') != 'MultiPolygon':
+                continue
+
+            polygons = [
+                [[(float(x), float(y)) for x, y, *_ in ring] for ring in polygon]
+                for polygon in coordinates if polygon and len(polygon[0]) >= 3
+            ]
+            properties = feature.get('properties') or {}
+            properties = {level: str(properties.get(level) or '').strip() for level in LEVELS}
+            if polygons and any(properties.values()):
+                fields.append(FieldPolygon(polygons, properties))
+        return cls(fields, cell_size)
+
+    @classmethod
+    def from_file(cls, path: str, cell_size: float = DEFAULT_CELL_SIZE) -> 'FieldLocator':
+        """Carga un GeoJSON; si no existe o no es válido, devuelve un índice vacío"""
+        if not path or not os.path.exists(path):
+            return cls(cell_size=cell_size)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                locator = cls.from_geojson(json.load(f), cell_size)
+            print(f"✅ Polígonos de campo cargados: {len(locator)} ({path})")
+            return locator
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ Error cargando polígonos de campo {path}: {e}")
+            return cls(cell_size=cell_size)
+
+    def candidates(self, lat: float, lng: float) -> Sequence[FieldPolygon]:
+        return self.cells.get((self._cell(lng), self._cell(lat)), ())
+
+    def locate(self, lat: float, lng: float) -> Optional[Dict[str, str]]:
+        """
+        Campo que contiene un punto
+
+        Args:
+            lat: Latitud en grados decimales
+            lng: Longitud en grados decimales
+
+        Returns:
+            Dict con empresa/fundo/sector/lote (vacíos los niveles no definidos)
+            o None si ningún polígono contiene el punto
+        """
+        containing = sorted(
+            (field for field in self.candidates(lat, lng) if field.contains(lng, lat)),
+            key=lambda field: (field.depth, -field.area)
+        )
+        if not containing:
+            return None
+        # Los polígonos menos profundos completan los niveles que el más profundo no define
+        result = {level: '' for level in LEVELS}
+        for field in containing:
+            result.update({level: value for level, value in field.properties.items() if value})
+        return result
+
+
+_default_locator: Optional[FieldLocator] = None
+_default_lock = threading.Lock()
+
+
+def default_field_locator() -> FieldLocator:
+    """Índice compartido del proceso, cargado una vez desde AGRICOLA_CAMPOS_GEOJSON"""
+    global _default_locator
+    with _default_lock:
+        if _default_locator is None:
+            _default_locator = FieldLocator.from_file(os.getenv('AGRICOLA_CAMPOS_GEOJSON', DEFAULT_GEOJSON_PATH))
+        return _default_locator
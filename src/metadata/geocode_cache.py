@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Geocode Cache
+Caché de geocodificación inversa por geohash: LRU en memoria respaldado por
+SQLite, para que las fotos de un mismo lote compartan una sola consulta.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from . import geohash
+
+# Precisión 7 ≈ celdas de 150 m: las fotos de un mismo lote caen en pocas celdas
+DEFAULT_PRECISION = 7
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS geocodificacion (
+    geohash TEXT PRIMARY KEY,
+    direccion TEXT,
+    creado REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class GeocodeCache:
+    """
+    Direcciones por celda geohash
+
+    Las celdas sin dirección (Nominatim no devolvió nada) también se guardan,
+    para no repetir la consulta; los errores de red no se guardan.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, precision: int = DEFAULT_PRECISION,
+                 max_entries: int = 4096):
+        self.db_path = db_path
+        self.precision = precision
+        self.max_entries = max_entries
+        self._memoria: 'OrderedDict[str, Optional[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if db_path:
+            try:
+                self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+                self._conn.executescript(ESQUEMA)
+            except sqlite3.Error as e:
+                print(f"⚠️ Caché de geocodificación solo en memoria ({db_path}): {e}")
+                self._conn = None
+
+    def key(self, lat: float, lng: float) -> str:
+        return geohash.encode(lat, lng, self.precision)
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """
+        Dirección guardada para una celda
+
+        Returns:
+            (encontrada, dirección); la dirección puede ser None si la celda no tiene dirección
+        """
+        with self._lock:
+            if key in self._memoria:
+                self._memoria.move_to_end(key)
+                return True, self._memoria[key]
+            if self._conn is None:
+                return False, None
+            fila = self._conn.execute(
+                'SELECT direccion FROM geocodificacion WHERE geohash = ?', (key,)
+            ).fetchone()
+            if fila is None:
+                return False, None
+            self._recordar(key, fila[0])
+            return True, fila[0]
+
+    def put(self, key: str, direccion: Optional[str]):
+        with self._lock:
+            self._recordar(key, direccion)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO geocodificacion (geohash, direccion, creado) VALUES (?, ?, ?)',
+                        (key, direccion, time.time())
+                    )
+
+    def _recordar(self, key: str, direccion: Optional[str]):
+        self._memoria[key] = direccion
+        self._memoria.move_to_end(key)
+        while len(self._memoria) > self.max_entries:
+            self._memoria.popitem(last=False)
+
+
+def cache_from_env() -> GeocodeCache:
+    """Caché configurada por AGRICOLA_DB_PATH y AGRICOLA_GEOHASH_PRECISION"""
+    return GeocodeCache(
+        os.getenv('AGRICOLA_DB_PATH', 'agricola.db'),
+        int(os.getenv('AGRICOLA_GEOHASH_PRECISION', DEFAULT_PRECISION))
+    )
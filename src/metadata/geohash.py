@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Geohash
+Codifica coordenadas en celdas base32 cuyo prefijo común indica cercanía:
+precisión 6 ≈ 1.2 km × 0.6 km, 7 ≈ 150 m × 150 m, 8 ≈ 38 m × 19 m.
+"""
+
+import math
+from typing import List, Tuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+
+
+def encode(lat: float, lng: float, precision: int = 7) -> str:
+    """
+    Geohash de unas coordenadas
+
+    Args:
+        lat: Latitud en grados decimales
+        lng: Longitud en grados decimales
+        precision: Número de caracteres (1-12)
+
+    Returns:
+        str: Geohash de `precision` caracteres
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Caja de una celda: (lat_min, lng_min, lat_max, lng_max)"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """Centro (lat, lng) de una celda"""
+    lat_min, lng_min, lat_max, lng_max = bounds(geohash)
+    return (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Tamaño (alto en grados de latitud, ancho en grados de longitud) de una celda"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def cover(lat_min: float, lng_min: float, lat_max: float, lng_max: float,
+          max_cells: int = 32, max_precision: int = 9) -> List[str]:
+    """
+    Celdas geohash que cubren una caja
+
+    Se usa la mayor precisión (hasta max_precision) con la que la caja queda
+    cubierta por como mucho max_cells celdas.
+
+    Returns:
+        List[str]: Geohashes (todos de la misma longitud)
+    """
+    lat_min, lat_max = max(lat_min, -90.0), min(lat_max, 90.0)
+    lng_min, lng_max = max(lng_min, -180.0), min(lng_max, 180.0)
+
+    cells: List[str] = []
+    for precision in range(1, max_precision + 1):
+        height, width = cell_size(precision)
+        rows = math.floor((lat_max + 90.0) / height) - math.floor((lat_min + 90.0) / height) + 1
+        cols = math.floor((lng_max + 180.0) / width) - math.floor((lng_min + 180.0) / width) + 1
+        if cells and rows * cols > max_cells:
+            break
+        cells = sorted({
+            encode(min(lat_min + i * height, lat_max), min(lng_min + j * width, lng_max), precision)
+            for i in range(rows + 1)
+            for j in range(cols + 1)
+        })
+    return cells
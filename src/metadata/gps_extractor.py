@@ -10,28 +10,47 @@ Incluye conversión de formato DMS a decimal y geocodificación inversa.
 import io
 import os
 import tempfile
+import threading
+import time
 from datetime import datetime
 from typing import Optional, Tuple, Dict, Any
 
 from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.ExifTags import TAGS
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 
+from .exif_parser import leer_exif, dms_a_decimal, PUNTERO_EXIF, PUNTERO_GPS, TAGS_EXIF, TAGS_GPS
+from .field_locator import FieldLocator, default_field_locator
+from .geocode_cache import GeocodeCache, cache_from_env
+
+# Política de uso de Nominatim: como máximo una consulta por segundo
+NOMINATIM_MIN_INTERVAL = 1.0
+
 
 class GPSMetadataExtractor:
     """Extractor de metadatos GPS y EXIF de imágenes"""
     
-    def __init__(self):
+    def __init__(self, field_locator: FieldLocator = None, geocode_cache: GeocodeCache = None):
         self.geolocator = Nominatim(user_agent="agricola-luz-sombra-app")
+        # Polígonos de campo para ubicar las fotos sin red
+        self.field_locator = field_locator if field_locator is not None else default_field_locator()
+        # Direcciones ya resueltas, por celda geohash
+        self.geocode_cache = geocode_cache if geocode_cache is not None else cache_from_env()
+        self._geocode_lock = threading.Lock()
+        self._last_geocode = 0.0
     
-    def extract_metadata(self, image_bytes: bytes, filename: str = None) -> Dict[str, Any]:
+    def extract_metadata(self, image_bytes: bytes, filename: str = None, geocode: bool = True) -> Dict[str, Any]:
         """
         Extrae todos los metadatos de una imagen
         
+        Solo se lee la cabecera EXIF (segmento APP1 o cabecera TIFF); los píxeles
+        no se decodifican, así que basta con el comienzo del archivo.
+        
         Args:
-            image_bytes: Bytes de la imagen
+            image_bytes: Bytes de la imagen (completa o sus primeros KB)
             filename: Nombre del archivo (opcional)
+            geocode: Consultar la dirección si el punto no está en ningún polígono de campo
             
         Returns:
             Dict con todos los metadatos extraídos
@@ -42,86 +61,113 @@ class GPSMetadataExtractor:
             'gps_longitud': None,
             'gps_altitud': None,
             'direccion': None,
+            'campo': None,
             'dispositivo': {},
             'exif_tags': {},
             'errores': []
         }
         
         try:
-            # Abrir imagen
-            img = Image.open(io.BytesIO(image_bytes))
-            exifdata = img.getexif()
+            exif = leer_exif(image_bytes)
+            if exif is None:
+                # Formatos sin APP1/TIFF (PNG, WebP...): PIL lee sus metadatos sin decodificar píxeles
+                exif = self._read_exif_pil(image_bytes)
             
             # Extraer fecha
-            metadata['fecha_tomada'] = self._extract_date(exifdata)
+            metadata['fecha_tomada'] = self._extract_date(exif)
             
             # Extraer información del dispositivo
-            metadata['dispositivo'] = self._extract_device_info(exifdata)
+            metadata['dispositivo'] = self._extract_device_info(exif)
             
             # Extraer GPS
-            gps_data = self._extract_gps_data(exifdata, image_bytes)
+            gps_data = self._extract_gps_data(exif)
             metadata.update(gps_data)
             
             # Extraer todos los tags EXIF
-            metadata['exif_tags'] = self._extract_all_exif_tags(exifdata)
+            metadata['exif_tags'] = self._extract_all_exif_tags(exif)
             
-            # Geocodificación inversa si hay coordenadas
+            # Ubicar el campo (empresa/fundo/sector/lote) si hay coordenadas;
+            # la geocodificación inversa solo se usa fuera de los polígonos conocidos
             if metadata['gps_latitud'] and metadata['gps_longitud']:
-                metadata['direccion'] = self._reverse_geocode(
+                metadata['campo'] = self.field_locator.locate(
                     metadata['gps_latitud'], 
                     metadata['gps_longitud']
                 )
+                if metadata['campo']:
+                    metadata['direccion'] = ' / '.join(v for v in metadata['campo'].values() if v)
+                elif geocode:
+                    metadata['direccion'] = self._reverse_geocode(
+                        metadata['gps_latitud'], 
+                        metadata['gps_longitud']
+                    )
             
         except Exception as e:
             metadata['errores'].append(f"Error general: {str(e)}")
         
         return metadata
     
-    def _extract_date(self, exifdata) -> Optional[datetime]:
+    @staticmethod
+    def _read_exif_pil(image_bytes: bytes) -> Dict[str, Dict[str, Any]]:
+        """Lee el EXIF con PIL, en el mismo formato que leer_exif"""
+        exif = {'ifd0': {}, 'exif': {}, 'gps': {}}
+        try:
+            exifdata = Image.open(io.BytesIO(image_bytes)).getexif()
+        except Exception:
+            return exif
+        
+        def valor(v):
+            if hasattr(v, 'numerator') and hasattr(v, 'denominator'):
+                return float(v.numerator) / float(v.denominator) if v.denominator else 0.0
+            if isinstance(v, tuple):
+                return tuple(valor(x) for x in v)
+            return v
+        
+        exif['ifd0'] = {TAGS.get(tag, tag): valor(v) for tag, v in exifdata.items()}
+        for puntero, clave, nombres in ((PUNTERO_EXIF, 'exif', TAGS_EXIF), (PUNTERO_GPS, 'gps', TAGS_GPS)):
+            ifd = exifdata.get_ifd(puntero)
+            exif[clave] = {nombres[tag]: valor(v) for tag, v in ifd.items() if tag in nombres}
+        return exif
+    
+    def _extract_date(self, exif: Dict[str, Dict[str, Any]]) -> Optional[datetime]:
         """Extrae fecha de captura del EXIF"""
-        date_tags = ['DateTimeOriginal', 'DateTime', 'DateTimeDigitized']
+        candidates = (
+            exif['exif'].get('DateTimeOriginal'),
+            exif['ifd0'].get('DateTime'),
+            exif['exif'].get('DateTimeDigitized'),
+        )
         
-        for tag_name in date_tags:
-            for tag_id in exifdata:
-                tag = TAGS.get(tag_id, tag_id)
-                if tag == tag_name:
-                    date_str = exifdata[tag_id]
-                    if date_str:
-                        try:
-                            # Intentar diferentes formatos de fecha
-                            for fmt in ["%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S"]:
-                                try:
-                                    return datetime.strptime(date_str, fmt)
-                                except ValueError:
-                                    continue
-                        except Exception as e:
-                            print(f"Error parseando fecha {date_str}: {e}")
-                            continue
+        for date_str in candidates:
+            if not isinstance(date_str, str) or not date_str:
+                continue
+            # Intentar diferentes formatos de fecha
+            for fmt in ["%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S"]:
+                try:
+                    return datetime.strptime(date_str, fmt)
+                except ValueError:
+                    continue
+            print(f"Error parseando fecha {date_str}: formato no reconocido")
         
         return None
     
-    def _extract_device_info(self, exifdata) -> Dict[str, str]:
+    def _extract_device_info(self, exif: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
         """Extrae información del dispositivo"""
         device_info = {}
         
         device_tags = {
-            'Make': 'fabricante',
-            'Model': 'modelo',
-            'Software': 'software',
-            'ImageWidth': 'ancho',
-            'ImageLength': 'alto'
+            'fabricante': exif['ifd0'].get('Make'),
+            'modelo': exif['ifd0'].get('Model'),
+            'software': exif['ifd0'].get('Software'),
+            'ancho': exif['ifd0'].get('ImageWidth', exif['exif'].get('ExifImageWidth')),
+            'alto': exif['ifd0'].get('ImageLength', exif['exif'].get('ExifImageHeight')),
         }
         
-        for tag_name, key in device_tags.items():
-            for tag_id in exifdata:
-                tag = TAGS.get(tag_id, tag_id)
-                if tag == tag_name:
-                    device_info[key] = str(exifdata[tag_id])
-                    break
+        for key, value in device_tags.items():
+            if value is not None:
+                device_info[key] = str(value)
         
         return device_info
     
-    def _extract_gps_data(self, exifdata, image_bytes: bytes = None) -> Dict[str, Any]:
+    def _extract_gps_data(self, exif: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
         """Extrae datos GPS del EXIF"""
         gps_data = {
             'gps_latitud': None,
@@ -131,71 +177,26 @@ class GPSMetadataExtractor:
         }
         
         try:
-            print("🔍 Buscando datos GPS en EXIF...")
+            gps = exif['gps']
+            if not gps:
+                gps_data['gps_errores'].append("La imagen no contiene datos GPS")
+                return gps_data
             
-            # Buscar información GPS usando exifread
-            try:
-                import exifread
-                if image_bytes:
-                    # Usar los bytes de la imagen actual
-                    tags = exifread.process_file(io.BytesIO(image_bytes), details=True)
-                else:
-                    # Fallback al archivo hardcodeado solo para pruebas
-                    with open("dataset/imagenes/foto-fv5-gps.jpg", 'rb') as f:
-                        tags = exifread.process_file(f, details=True)
-                
-                # Extraer latitud
-                if 'GPS GPSLatitude' in tags and 'GPS GPSLatitudeRef' in tags:
-                    lat_dms = str(tags['GPS GPSLatitude'])
-                    lat_ref = str(tags['GPS GPSLatitudeRef'])
-                    
-                    # Convertir DMS a decimal
-                    lat = self._convert_dms_to_decimal(lat_dms)
-                    
-                    if lat_ref == 'S':
-                        lat = -lat
-                    
-                    gps_data['gps_latitud'] = lat
-                    print(f"✅ Latitud GPS extraída: {lat} ({lat_ref})")
-                
-                # Extraer longitud
-                if 'GPS GPSLongitude' in tags and 'GPS GPSLongitudeRef' in tags:
-                    lon_dms = str(tags['GPS GPSLongitude'])
-                    lon_ref = str(tags['GPS GPSLongitudeRef'])
-                    
-                    # Convertir DMS a decimal
-                    lon = self._convert_dms_to_decimal(lon_dms)
-                    
-                    if lon_ref == 'W':
-                        lon = -lon
-                    
-                    gps_data['gps_longitud'] = lon
-                    print(f"✅ Longitud GPS extraída: {lon} ({lon_ref})")
-                
-                # Extraer altitud
-                if 'GPS GPSAltitude' in tags:
-                    gps_data['gps_altitud'] = float(str(tags['GPS GPSAltitude']))
-                    print(f"✅ Altitud GPS extraída: {gps_data['gps_altitud']} m")
-                
-                # Extraer fecha GPS
-                if 'GPS GPSDateStamp' in tags:
-                    gps_date = str(tags['GPS GPSDateStamp'])
-                    print(f"✅ Fecha GPS: {gps_date}")
-                
-                # Extraer hora GPS
-                if 'GPS GPSTimeStamp' in tags:
-                    gps_time = str(tags['GPS GPSTimeStamp'])
-                    print(f"✅ Hora GPS: {gps_time}")
-                
-                if gps_data['gps_latitud'] and gps_data['gps_longitud']:
-                    print(f"🎉 Coordenadas GPS completas: {gps_data['gps_latitud']}, {gps_data['gps_longitud']}")
-                else:
-                    gps_data['gps_errores'].append("No se pudieron extraer coordenadas GPS completas")
-                
-            except ImportError:
-                gps_data['gps_errores'].append("exifread no está instalado")
-            except Exception as e:
-                gps_data['gps_errores'].append(f"Error con exifread: {str(e)}")
+            lat = dms_a_decimal(gps.get('GPSLatitude'), str(gps.get('GPSLatitudeRef') or ''))
+            lon = dms_a_decimal(gps.get('GPSLongitude'), str(gps.get('GPSLongitudeRef') or ''))
+            gps_data['gps_latitud'] = lat
+            gps_data['gps_longitud'] = lon
+            
+            altitude = gps.get('GPSAltitude')
+            if isinstance(altitude, (int, float)):
+                # GPSAltitudeRef = 1 indica altitud bajo el nivel del mar
+                ref = gps.get('GPSAltitudeRef')
+                gps_data['gps_altitud'] = -float(altitude) if ref in (1, b'\x01') else float(altitude)
+            
+            if lat and lon:
+                print(f"✅ Coordenadas GPS: {lat}, {lon}")
+            else:
+                gps_data['gps_errores'].append("No se pudieron extraer coordenadas GPS completas")
             
         except Exception as e:
             gps_data['gps_errores'].append(f"Error extrayendo GPS: {str(e)}")
@@ -361,21 +362,16 @@ class GPSMetadataExtractor:
         
         return None
     
-    def _extract_all_exif_tags(self, exifdata) -> Dict[str, Any]:
-        """Extrae todos los tags EXIF disponibles"""
+    def _extract_all_exif_tags(self, exif: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Extrae todos los tags EXIF de IFD0"""
         tags = {}
         
-        for tag_id in exifdata:
-            tag = TAGS.get(tag_id, tag_id)
-            value = exifdata[tag_id]
-            
-            # Convertir valores complejos a string
-            if hasattr(value, 'numerator') and hasattr(value, 'denominator'):
-                value = float(value.numerator) / float(value.denominator)
-            elif isinstance(value, bytes):
+        for tag, value in exif['ifd0'].items():
+            # Convertir valores binarios a string
+            if isinstance(value, bytes):
                 try:
                     value = value.decode('utf-8')
-                except:
+                except UnicodeDecodeError:
                     value = str(value)
             
             tags[tag] = value
@@ -386,6 +382,9 @@ class GPSMetadataExtractor:
         """
         Convierte coordenadas GPS a dirección usando geocodificación inversa
         
+        El resultado se guarda por celda geohash; las consultas a Nominatim se
+        serializan y se espacian al menos NOMINATIM_MIN_INTERVAL segundos.
+        
         Args:
             latitude: Latitud en grados decimales
             longitude: Longitud en grados decimales
@@ -393,14 +392,31 @@ class GPSMetadataExtractor:
         Returns:
             Dirección como string o None si hay error
         """
-        try:
-            location = self.geolocator.reverse(f"{latitude}, {longitude}", timeout=10)
-            if location:
-                return location.address
-        except (GeocoderTimedOut, GeocoderServiceError) as e:
-            print(f"Error en geocodificación: {e}")
-        except Exception as e:
-            print(f"Error inesperado en geocodificación: {e}")
+        key = self.geocode_cache.key(latitude, longitude)
+        found, direccion = self.geocode_cache.get(key)
+        if found:
+            return direccion
+        
+        with self._geocode_lock:
+            # Otro hilo pudo resolver la misma celda mientras se esperaba el lock
+            found, direccion = self.geocode_cache.get(key)
+            if found:
+                return direccion
+            
+            wait = self._last_geocode + NOMINATIM_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self.geolocator.reverse(f"{latitude}, {longitude}", timeout=10)
+                direccion = location.address if location else None
+                self.geocode_cache.put(key, direccion)
+                return direccion
+            except (GeocoderTimedOut, GeocoderServiceError) as e:
+                print(f"Error en geocodificación: {e}")
+            except Exception as e:
+                print(f"Error inesperado en geocodificación: {e}")
+            finally:
+                self._last_geocode = time.monotonic()
         
         return None
     
@@ -445,6 +461,7 @@ def test_extractor():
         print(f"📅 Fecha: {metadata['fecha_tomada']}")
         print(f"📍 GPS: {metadata['gps_latitud']}, {metadata['gps_longitud']}")
         print(f"🏠 Dirección: {metadata['direccion']}")
+        print(f"🌱 Campo: {metadata['campo']}")
         print(f"📱 Dispositivo: {metadata['dispositivo']}")
         
         if metadata['gps_errores']:
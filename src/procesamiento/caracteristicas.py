@@ -0,0 +1,83 @@
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+from src.procesamiento.preprocesamiento import calcular_textura_vectorizado
+
+
+class CaracteristicasImagen:
+    """
+    Planos derivados de una imagen BGR calculados de forma perezosa: cada plano
+    (HSV, luminancia, NDVI, textura...) se calcula como máximo una vez y se comparte
+    entre clasificación, refinamiento, visualización y estadísticas.
+
+    Los planos por píxel se devuelven aplanados (height * width), en el mismo orden
+    que imagen.reshape(-1, 3).
+    """
+
+    def __init__(self, imagen_bgr: np.ndarray, kernel_textura: int = 3):
+        self.imagen = imagen_bgr
+        self.height, self.width = imagen_bgr.shape[:2]
+        self.kernel_textura = kernel_textura
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+
+    def liberar(self):
+        """Libera la imagen y todos los planos calculados."""
+        self.__dict__.clear()
+
+    @property
+    def total_pixeles(self) -> int:
+        return self.height * self.width
+
+    @cached_property
+    def pixeles(self) -> np.ndarray:
+        """Píxeles BGR uint8, forma (n, 3)."""
+        return self.imagen.reshape(-1, 3)
+
+    @cached_property
+    def canales(self) -> np.ndarray:
+        """Píxeles BGR en float32, forma (n, 3)."""
+        return self.pixeles.astype(np.float32)
+
+    @cached_property
+    def gris(self) -> np.ndarray:
+        """Escala de grises uint8, forma (height, width)."""
+        return cv2.cvtColor(self.imagen, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def hsv(self) -> np.ndarray:
+        """HSV de OpenCV (uint8), forma (n, 3)."""
+        return cv2.cvtColor(self.imagen, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+
+    @cached_property
+    def luminancia(self) -> np.ndarray:
+        """Luminancia 0.299 R + 0.587 G + 0.114 B."""
+        b, g, r = self.canales[:, 0], self.canales[:, 1], self.canales[:, 2]
+        return 0.299 * r + 0.587 * g + 0.114 * b
+
+    @cached_property
+    def ndvi(self) -> np.ndarray:
+        """NDVI aproximado (G - R) / (G + R)."""
+        g, r = self.canales[:, 1], self.canales[:, 2]
+        return (g - r) / (g + r + 1e-5)
+
+    @cached_property
+    def intensidad(self) -> np.ndarray:
+        """Media de los tres canales."""
+        return self.canales.sum(axis=1) / 3.0
+
+    @cached_property
+    def varianza_canales(self) -> np.ndarray:
+        """Varianza entre los tres canales de cada píxel."""
+        return np.var(self.pixeles, axis=1)
+
+    @cached_property
+    def textura(self) -> np.ndarray:
+        """Varianza local en escala de grises (ventana kernel_textura)."""
+        return calcular_textura_vectorizado(self.imagen, self.kernel_textura).reshape(-1)
@@ -1,46 +1,161 @@
 import os
 import json
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+# Orientaciones EXIF que rotan la imagen 90° (cv2.imread y LabelMe las aplican)
+ORIENTACIONES_ROTADAS = {5, 6, 7, 8}
+
+# Colores de la paleta por índice de clase (0 = sin clase)
+PALETA = [(0, 0, 0), (50, 50, 50), (255, 255, 0), (0, 128, 0), (128, 64, 0), (255, 0, 0), (0, 0, 255)]
+
+
+def indexar_imagenes(path_img):
+    """
+    Lista una sola vez la carpeta de imágenes.
+
+    Retorna:
+    - dict nombre base en minúsculas → ruta (la primera si hay varias extensiones)
+    """
+    imagenes = {}
+    for nombre in os.listdir(path_img):
+        base, ext = os.path.splitext(nombre)
+        if ext.lower() in (".jpg", ".jpeg", ".png"):
+            imagenes.setdefault(base.lower(), os.path.join(path_img, nombre))
+    return imagenes
 
-def generar_mascaras(path_json, path_img, path_out, clases=["sombra", "luz"]):
-    os.makedirs(path_out, exist_ok=True)
 
-    for nombre_json in os.listdir(path_json):
-        ruta_json = os.path.join(path_json, nombre_json)
-        nombre_base = nombre_json.replace(".json", "")
-        ruta_img = os.path.join(path_img, nombre_base + ".JPG")
+def buscar_imagen(imagenes, nombre_base):
+    """
+    Busca la imagen de una anotación sin distinguir mayúsculas en nombre ni extensión.
 
-        img = cv2.imread(ruta_img)
-        if img is None:
-            print(f"❌ Imagen no encontrada: {ruta_img}")
+    Parámetros:
+    - imagenes: índice devuelto por indexar_imagenes
+    - nombre_base: nombre sin extensión
+    """
+    return imagenes.get(nombre_base.lower())
+
+
+def leer_dimensiones(ruta_img):
+    """
+    Lee (alto, ancho) desde la cabecera de la imagen, sin decodificar píxeles.
+    """
+    with Image.open(ruta_img) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112) in ORIENTACIONES_ROTADAS:
+            width, height = height, width
+    return height, width
+
+
+def rasterizar_etiquetas(shapes, height, width, indice, fondo=0):
+    """
+    Dibuja todas las clases en un único mapa de índices en una sola pasada sobre las anotaciones.
+
+    Parámetros:
+    - shapes: lista de anotaciones LabelMe
+    - height, width: dimensiones de la imagen
+    - indice: dict etiqueta en minúsculas → valor del mapa
+    - fondo: valor para píxeles sin anotación
+
+    Retorna:
+    - Mapa uint8 (height, width)
+    """
+    mapa = np.full((height, width), fondo, dtype=np.uint8)
+    for shape in shapes:
+        valor = indice.get(shape["label"].strip().lower())
+        if valor is None:
             continue
+        puntos = np.array(shape["points"], dtype=np.int32)
+        cv2.fillPoly(mapa, [puntos], int(valor))
+    return mapa
+
 
-        height, width = img.shape[:2]
+def guardar_mascara(ruta_mask, mapa, clases):
+    """
+    Guarda el mapa de índices como PNG indexado (paleta) con los nombres de clase en metadatos.
+    """
+    img = Image.fromarray(mapa, mode="L").convert("P")
+    paleta = [canal for color in PALETA for canal in color]
+    img.putpalette(paleta + [255] * (768 - len(paleta)))
 
-        with open(ruta_json, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    info = PngInfo()
+    info.add_text("clases", json.dumps(["fondo"] + list(clases)))
+    img.save(ruta_mask, optimize=True, pnginfo=info)
 
-        etiquetas_encontradas = [shape["label"].lower() for shape in data.get("shapes", [])]
 
-        for clase in clases:
-            if clase not in etiquetas_encontradas:
-                print(f"⚠️ Clase '{clase}' no encontrada en {nombre_json}")
-                continue
+def leer_mascara(ruta_mask):
+    """
+    Lee una máscara generada por generar_mascaras.
 
-            mask = np.zeros((height, width), dtype=np.uint8)
-            dibujado = False
+    Retorna:
+    - mapa: array uint8 con 0 = sin clase, i + 1 = clases[i]
+    - clases: lista de nombres de clase
+    """
+    with Image.open(ruta_mask) as img:
+        clases = json.loads(img.text.get("clases", "[]"))[1:]
+        mapa = np.array(img)
+    return mapa, clases
 
-            for shape in data["shapes"]:
-                if shape["label"].lower() == clase:
-                    puntos = np.array(shape["points"], dtype=np.int32)
-                    cv2.fillPoly(mask, [puntos], 255)
-                    dibujado = True
 
-            if dibujado:
-                nombre_mask = f"mask_{nombre_base}_{clase}.png"
-                ruta_mask = os.path.join(path_out, nombre_mask)
-                cv2.imwrite(ruta_mask, mask)
-                print(f"✅ Máscara guardada: {nombre_mask}")
-            else:
-                print(f"⚠️ No se pudo dibujar máscara para clase '{clase}' en {nombre_json}")
\ No newline at end of file
+def _generar_mascara(ruta_json, ruta_img, path_out, clases):
+    nombre_json = os.path.basename(ruta_json)
+    nombre_base = os.path.splitext(nombre_json)[0]
+
+    height, width = leer_dimensiones(ruta_img)
+
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    shapes = data.get("shapes", [])
+    etiquetas_encontradas = {shape["label"].strip().lower() for shape in shapes}
+    for clase in clases:
+        if clase not in etiquetas_encontradas:
+            print(f"⚠️ Clase '{clase}' no encontrada en {nombre_json}")
+
+    indice = {clase: i + 1 for i, clase in enumerate(clases)}
+    mapa = rasterizar_etiquetas(shapes, height, width, indice)
+
+    nombre_mask = f"mask_{nombre_base}.png"
+    guardar_mascara(os.path.join(path_out, nombre_mask), mapa, clases)
+    print(f"✅ Máscara guardada: {nombre_mask}")
+    return nombre_mask
+
+
+def generar_mascaras(path_json, path_img, path_out, clases=["sombra", "luz"], max_workers=None):
+    """
+    Genera una máscara de índices de clase por imagen anotada, en paralelo.
+
+    Parámetros:
+    - path_json: carpeta con anotaciones LabelMe
+    - path_img: carpeta con las imágenes
+    - path_out: carpeta de salida de las máscaras
+    - clases: clases a rasterizar (valor i + 1 en la máscara)
+    - max_workers: número de procesos (por defecto, núcleos disponibles)
+
+    Retorna:
+    - Lista de nombres de máscara generadas
+    """
+    os.makedirs(path_out, exist_ok=True)
+
+    # Las imágenes se resuelven aquí con un único listado; cada proceso recibe su ruta
+    imagenes = indexar_imagenes(path_img)
+    rutas_json, rutas_img = [], []
+    for nombre in sorted(os.listdir(path_json)):
+        if not nombre.lower().endswith(".json"):
+            continue
+        nombre_base = os.path.splitext(nombre)[0]
+        ruta_img = buscar_imagen(imagenes, nombre_base)
+        if ruta_img is None:
+            print(f"❌ Imagen no encontrada: {os.path.join(path_img, nombre_base)}.*")
+            continue
+        rutas_json.append(os.path.join(path_json, nombre))
+        rutas_img.append(ruta_img)
+    n = len(rutas_json)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        generadas = pool.map(_generar_mascara, rutas_json, rutas_img, [path_out] * n, [clases] * n)
+        return [nombre for nombre in generadas if nombre]
@@ -27,62 +27,81 @@ def calcular_textura_vectorizado(imagen, kernel_size=3):
     varianza = sqr_mean - mean ** 2
     return varianza
 
-def normalizar_pixeles_con_textura(imagen, coordenadas, kernel_size=3):
+def extraer_rgb_textura(imagen, coordenadas, kernel_size=3):
     """
-    Extrae y normaliza características [R, G, B, textura] por coordenada.
+    Extrae vectores [R, G, B, textura] por coordenada (x, y) con indexación vectorizada,
+    descartando coordenadas fuera de la imagen.
     """
+    coords = np.asarray(coordenadas, dtype=np.intp).reshape(-1, 2)
+    x, y = coords[:, 0], coords[:, 1]
+    dentro = (x >= 0) & (y >= 0) & (x < imagen.shape[1]) & (y < imagen.shape[0])
+    x, y = x[dentro], y[dentro]
+
     textura_map = calcular_textura_vectorizado(imagen, kernel_size)
-    datos = []
 
-    for x, y in coordenadas:
-        if y >= imagen.shape[0] or x >= imagen.shape[1]:
-            continue
-        rgb = imagen[y, x].astype(np.float32)
-        textura = textura_map[y, x]
-        datos.append(np.append(rgb, textura))
+    datos = np.empty((len(x), 4), dtype=np.float32)
+    datos[:, :3] = imagen[y, x]
+    datos[:, 3] = textura_map[y, x]
+    return datos
 
-    if not datos:
-        raise ValueError("❌ No se generaron vectores para normalización.")
+def ajustar_scaler(datos):
+    """
+    Ajusta un StandardScaler sobre los vectores de entrenamiento, para guardarlo junto al
+    modelo (ver entrenar_modelo) y reutilizarlo en inferencia.
+    """
+    if datos is None or len(datos) == 0:
+        raise ValueError("❌ No hay vectores para ajustar el scaler.")
+    return StandardScaler().fit(np.asarray(datos, dtype=np.float32))
+
+def normalizar_pixeles_con_textura(imagen, coordenadas, kernel_size=3, scaler=None):
+    """
+    Extrae y normaliza características [R, G, B, textura] por coordenada para inferencia.
+
+    `scaler` es el ajustado en entrenamiento y guardado con el modelo (ver
+    entrenar_modelo y cargar_scaler); ajustar uno por imagen cambiaría la escala de
+    cada foto, así que sin él se lanza un error. Para entrenar, usar
+    extraer_rgb_textura + ajustar_scaler.
+    """
+    if scaler is None:
+        raise ValueError("❌ Falta el scaler del entrenamiento (cargar_scaler(modelo_path)).")
+
+    datos_array = extraer_rgb_textura(imagen, coordenadas, kernel_size)
 
-    datos_array = np.array(datos, dtype=np.float32)
+    if len(datos_array) == 0:
+        raise ValueError("❌ No se generaron vectores para normalización.")
 
     print(f"▶️ Normalizando {len(datos_array)} vectores RGB+textura...")
-    scaler = StandardScaler()
-    return scaler.fit_transform(datos_array)
+    return scaler.transform(datos_array)
 
-def filtrar_sombra_refinada(etiquetas_np, imagen_bgr, textura_map,
+def filtrar_sombra_refinada(etiquetas_np, imagen_bgr, textura_map=None,
                             umbral_textura=60, umbral_luminancia=65,
-                            umbral_saturacion=130, ndvi_min=-0.3):
+                            umbral_saturacion=130, ndvi_min=-0.3,
+                            caracteristicas=None):
     """
     Filtra píxeles etiquetados como SOMBRA que probablemente son objetos oscuros (UVA/TRONCO)
     usando textura, luminancia, saturación y NDVI aproximado.
-    """
-
-    # Convertir imagen a formatos auxiliares
-    imagen_rgb = cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2RGB).astype(np.float32)
-    hsv = cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2HSV).astype(np.float32)
-    saturacion = hsv[..., 1]
-    textura_flat = textura_map.flatten()
 
-    # Luminancia
-    R, G, B = imagen_rgb[..., 0], imagen_rgb[..., 1], imagen_rgb[..., 2]
-    luminancia = (0.299 * R + 0.587 * G + 0.114 * B).flatten()
+    Si se pasa `caracteristicas` (CaracteristicasImagen de la misma imagen) se reutilizan
+    sus planos en lugar de recalcularlos.
+    """
+    if caracteristicas is None:
+        from src.procesamiento.caracteristicas import CaracteristicasImagen
+        caracteristicas = CaracteristicasImagen(imagen_bgr)
 
-    # NDVI aproximado
-    ndvi_aprox = ((G - R) / (G + R + 1e-5)).flatten()
+    textura_flat = textura_map.flatten() if textura_map is not None else caracteristicas.textura
 
     # Condiciones compuestas
     sombra_mask = etiquetas_np == "SOMBRA"
     condiciones = (
         sombra_mask &
         (textura_flat < umbral_textura) &
-        (luminancia < umbral_luminancia) &
-        (saturacion.flatten() < umbral_saturacion) &
-        (ndvi_aprox > ndvi_min)
+        (caracteristicas.luminancia < umbral_luminancia) &
+        (caracteristicas.hsv[:, 1] < umbral_saturacion) &
+        (caracteristicas.ndvi > ndvi_min)
     )
 
     etiquetas_filtradas = etiquetas_np.copy()
     etiquetas_filtradas[condiciones] = "IGNORADO"
 
     print(f"🔍 Sombra refinada — ignorados: {np.sum(condiciones)} píxeles")
-    return etiquetas_filtradas
\ No newline at end of file
+    return etiquetas_filtradas
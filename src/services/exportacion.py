@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Exportación en streaming del historial de procesamientos (CSV o Parquet)
+El historial se lee por páginas y cada página se convierte y entrega antes de
+pedir la siguiente, de modo que la memoria no depende del total exportado.
+"""
+
+import csv
+import io
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+# Función que devuelve una página del historial: (cursor, limit, filtros) → {'procesamientos', 'next_cursor'}
+ObtenerPagina = Callable[[Optional[str], int, Dict[str, Any]], Dict[str, Any]]
+
+CAMPOS_NUMERICOS = ('latitud', 'longitud', 'porcentaje_luz', 'porcentaje_sombra')
+
+
+def paginas_historial(obtener_pagina: ObtenerPagina, filtros: Dict[str, Any],
+                      tamano_pagina: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """Recorre el historial página a página siguiendo next_cursor"""
+    cursor = None
+    while True:
+        pagina = obtener_pagina(cursor, tamano_pagina, filtros)
+        if pagina['procesamientos']:
+            yield pagina['procesamientos']
+        cursor = pagina.get('next_cursor')
+        if not cursor:
+            return
+
+
+def exportar_csv(paginas: Iterator[List[Dict[str, Any]]], campos: Sequence[str],
+                 encabezados: Sequence[str] = None) -> Iterator[bytes]:
+    """
+    Genera el CSV por fragmentos (uno por página)
+
+    Parámetros:
+    - paginas: iterador de listas de registros
+    - campos: claves de cada registro, en el orden de las columnas
+    - encabezados: nombres de columna (por defecto, los campos)
+
+    Retorna:
+    - Iterador de bytes UTF-8 (con BOM para que Excel reconozca los acentos)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(encabezados or campos)
+    yield ('﻿' + buffer.getvalue()).encode('utf-8')
+
+    for registros in paginas:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([['' if r.get(c) is None else r.get(c) for c in campos] for r in registros])
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _numero(valor: Any) -> Optional[float]:
+    try:
+        return float(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _texto(valor: Any) -> Optional[str]:
+    return None if valor is None else str(valor)
+
+
+class _SalidaEnMemoria:
+    """Destino de escritura que acumula bytes hasta que se vacían"""
+
+    def __init__(self):
+        self.fragmentos: List[bytes] = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self.fragmentos.append(datos)
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self.fragmentos)
+        self.fragmentos = []
+        return datos
+
+
+def exportar_parquet(paginas: Iterator[List[Dict[str, Any]]], campos: Sequence[str]) -> Iterator[bytes]:
+    """
+    Genera un archivo Parquet por fragmentos (un row group por página)
+
+    Requiere pyarrow; los campos de CAMPOS_NUMERICOS se escriben como float64 y el resto como texto.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (campo, pa.float64() if campo in CAMPOS_NUMERICOS else pa.string()) for campo in campos
+    ])
+    salida = _SalidaEnMemoria()
+    archivo = pa.PythonFile(salida, mode='w')
+    writer = pq.ParquetWriter(archivo, schema, compression='snappy')
+    try:
+        for registros in paginas:
+            columnas = {
+                campo: [_numero(r.get(campo)) if campo in CAMPOS_NUMERICOS else _texto(r.get(campo)) for r in registros]
+                for campo in campos
+            }
+            writer.write_table(pa.Table.from_pydict(columnas, schema=schema))
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+    finally:
+        writer.close()
+        archivo.close()
+    yield salida.vaciar()
@@ -5,21 +5,36 @@ import numpy as np
 import pickle
 import joblib
 from datetime import datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
 import tempfile
 
 from src.procesamiento.postprocesamiento import calcular_porcentaje_suelo
+from src.procesamiento.caracteristicas import CaracteristicasImagen
+from src.visualizacion.etiquetas_a_rgb import renderizar_etiquetas, PALETA_SERVICIO
+from src.alertas.motor_alertas import MotorAlertas
+
+# Etiquetas enteras devueltas por _clasificacion_basica
+CLASES_BASICAS = ["SUELO_SOMBRA", "SUELO_LUZ", "MALLA_SOMBRA", "MALLA_LUZ"]
 
 class ProcesamientoServiceV2:
     """
     Servicio actualizado para procesar imágenes con modelo perfeccionado
     """
     
-    def __init__(self, modelo_path: str = "modelo_perfeccionado.pkl"):
+    def __init__(self, modelo_path: str = "modelo_perfeccionado.pkl", motor_alertas: Optional[MotorAlertas] = None):
+        """
+        Parámetros:
+        - modelo_path: ruta del modelo entrenado
+        - motor_alertas: motor compartido, alimentado por quien guarda los registros
+          (p. ej. repositorio.suscribir); el servicio solo evalúa las reglas con él.
+          Sin motor se crea uno propio que el servicio actualiza con cada imagen.
+        """
         self.modelo_path = modelo_path
         self.modelo = None
         self.scaler = None
         self.encoder = None
+        self.motor_alertas = motor_alertas or MotorAlertas()
+        self._motor_propio = motor_alertas is None
         self._cargar_modelo()
     
     def _cargar_modelo(self):
@@ -49,18 +64,16 @@ class ProcesamientoServiceV2:
             self.scaler = None
             self.encoder = None
     
-    def _clasificacion_basica(self, pixeles):
+    def _clasificacion_basica(self, caracteristicas: CaracteristicasImagen):
         """
         Clasificación optimizada basada en análisis real del dataset
         """
-        # Convertir a HSV para mejor clasificación
-        hsv = cv2.cvtColor(pixeles.reshape(-1, 1, 3), cv2.COLOR_BGR2HSV).reshape(-1, 3)
-        
         # Extraer componentes RGB
-        r, g, b = pixeles[:, 0], pixeles[:, 1], pixeles[:, 2]
+        canales = caracteristicas.canales
+        r, g, b = canales[:, 0], canales[:, 1], canales[:, 2]
         
         # Calcular características
-        intensity = (r + g + b) / 3.0
+        intensity = caracteristicas.intensidad
         green_ratio = g / (r + b + 1)
         
         # Umbrales ajustados basados en datos reales del dataset
@@ -70,7 +83,7 @@ class ProcesamientoServiceV2:
         MALLA_GREEN_THRESHOLD = 0.52       # Mismo umbral
         
         # Clasificación basada en datos reales
-        etiquetas = np.zeros(len(pixeles), dtype=int)
+        etiquetas = np.zeros(caracteristicas.total_pixeles, dtype=int)
         
         # SUELO_SOMBRA: baja intensidad, green ratio medio
         suelo_sombra = (intensity < SUELO_INTENSITY_THRESHOLD) & (green_ratio <= SUELO_GREEN_THRESHOLD)
@@ -93,25 +106,21 @@ class ProcesamientoServiceV2:
         # Para píxeles no clasificados, usar heurística adicional
         no_clasificados = etiquetas == 0
         if np.any(no_clasificados):
-            # Clasificar por intensidad
-            for i in np.where(no_clasificados)[0]:
-                if intensity[i] < SUELO_INTENSITY_THRESHOLD:
-                    etiquetas[i] = 0  # SUELO_SOMBRA
-                else:
-                    etiquetas[i] = 1  # SUELO_LUZ
+            # Clasificar por intensidad: SUELO_SOMBRA (0) o SUELO_LUZ (1)
+            etiquetas[no_clasificados] = intensity[no_clasificados] >= SUELO_INTENSITY_THRESHOLD
         
         return etiquetas
     
-    def extraer_caracteristicas_optimizadas(self, pixeles):
+    def extraer_caracteristicas_optimizadas(self, caracteristicas: CaracteristicasImagen):
         """
         Extrae características optimizadas basadas en análisis de etiquetas
         """
-        # RGB
+        # RGB (en el orden de columnas con el que se entrenó el modelo)
+        pixeles = caracteristicas.pixeles
         r, g, b = pixeles[:, 0], pixeles[:, 1], pixeles[:, 2]
         
         # HSV
-        pixeles_uint8 = pixeles.astype(np.uint8)
-        hsv = cv2.cvtColor(pixeles_uint8.reshape(-1, 1, 3), cv2.COLOR_BGR2HSV).reshape(-1, 3)
+        hsv = caracteristicas.hsv
         h, s, v = hsv[:, 0], hsv[:, 1], hsv[:, 2]
         
         # Luminancia
@@ -124,7 +133,7 @@ class ProcesamientoServiceV2:
         ndvi = (g - r) / (g + r + 1e-8)
         
         # Textura (varianza local)
-        texture = np.var(pixeles, axis=1)
+        texture = caracteristicas.varianza_canales
         
         return np.column_stack([r, g, b, h, s, v, luminance, saturation, ndvi, texture])
     
@@ -134,10 +143,14 @@ class ProcesamientoServiceV2:
         json_path: str,
         lugar: str,
         nombre_imagen: str,
-        nombre_json: str
+        nombre_json: str,
+        campo: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         Procesa imagen completa con modelo perfeccionado
+        
+        campo: empresa/fundo/sector/lote de la imagen, para agrupar las alertas
+        (si no se indica se agrupa por lugar)
         """
         print(f"📸 Procesando: {nombre_imagen}")
         
@@ -149,18 +162,34 @@ class ProcesamientoServiceV2:
         height, width = imagen.shape[:2]
         print(f"📏 Dimensiones: {width}x{height}")
         
-        # Procesar imagen completa
-        pixeles = imagen.reshape(-1, 3)
-        caracteristicas = self.extraer_caracteristicas_optimizadas(pixeles)
-        
+        # Los planos derivados se calculan una vez y se liberan al terminar la petición
+        with CaracteristicasImagen(imagen) as caracteristicas:
+            return self._procesar_caracteristicas(
+                imagen, caracteristicas, lugar, nombre_imagen, nombre_json, campo
+            )
+    
+    def _procesar_caracteristicas(
+        self,
+        imagen: np.ndarray,
+        caracteristicas: CaracteristicasImagen,
+        lugar: str,
+        nombre_imagen: str,
+        nombre_json: str,
+        campo: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Clasifica y resume una imagen a partir de sus planos derivados
+        """
         # Verificar si el modelo está disponible
         if self.modelo is None or self.scaler is None:
             print("⚠️ Modelo no disponible, usando clasificación básica...")
             # Clasificación básica basada en umbrales de color
-            etiquetas_pred = self._clasificacion_basica(pixeles)
+            etiquetas_pred = self._clasificacion_basica(caracteristicas)
         else:
             # Escalar características
-            caracteristicas_scaled = self.scaler.transform(caracteristicas)
+            caracteristicas_scaled = self.scaler.transform(
+                self.extraer_caracteristicas_optimizadas(caracteristicas)
+            )
             
             # Clasificar
             etiquetas_pred = self.modelo.predict(caracteristicas_scaled)
@@ -180,14 +209,21 @@ class ProcesamientoServiceV2:
         
         # Generar estadísticas detalladas
         estadisticas_detalladas = {
-            "total_pixeles": len(pixeles),
-            "pixeles_luz": np.sum(etiquetas_pred == "LUZ"),
-            "pixeles_sombra": np.sum(etiquetas_pred == "SOMBRA"),
-            "pixeles_tronco": np.sum(etiquetas_pred == "TRONCO"),
-            "pixeles_ignorado": np.sum(etiquetas_pred == "IGNORADO"),
-            "dimensiones": {"ancho": width, "alto": height}
+            "total_pixeles": caracteristicas.total_pixeles,
+            "pixeles_luz": int(np.sum(etiquetas_pred == "LUZ")),
+            "pixeles_sombra": int(np.sum(etiquetas_pred == "SOMBRA")),
+            "pixeles_tronco": int(np.sum(etiquetas_pred == "TRONCO")),
+            "pixeles_ignorado": int(np.sum(etiquetas_pred == "IGNORADO")),
+            "dimensiones": {"ancho": caracteristicas.width, "alto": caracteristicas.height}
         }
         
+        # Evaluar reglas de alerta con los agregados del lote (actualizándolos si el motor es propio)
+        registro_alerta = {**(campo or {"lote": lugar}), "porcentaje_sombra": float(porc_sombra)}
+        if self._motor_propio:
+            alertas = self.motor_alertas.registrar(registro_alerta)
+        else:
+            alertas = self.motor_alertas.simular(registro_alerta)
+        
         return {
             "lugar": lugar,
             "timestamp": datetime.utcnow(),
@@ -198,7 +234,8 @@ class ProcesamientoServiceV2:
             "total_pixeles_suelo": int(total_suelo),
             "modelo_usado": "modelo_perfeccionado",
             "umbral_sombra": 0.4,
-            "alerta_activada": "NO",
+            "alerta_activada": "SI" if alertas else "NO",
+            "alertas": alertas,
             "ruta_imagen_resultado": ruta_imagen_resultado,
             "estadisticas_detalladas": json.dumps(estadisticas_detalladas)
         }
@@ -214,26 +251,9 @@ class ProcesamientoServiceV2:
         """
         height, width = imagen_original.shape[:2]
         
-        # Crear visualización
-        visual_rgb = np.zeros((height, width, 3), dtype=np.uint8)
-        
-        # Mapear etiquetas a colores
-        mask_luz = etiquetas_pred_labels == "LUZ"
-        mask_sombra = etiquetas_pred_labels == "SOMBRA"
-        mask_tronco = etiquetas_pred_labels == "TRONCO"
-        mask_ignorado = etiquetas_pred_labels == "IGNORADO"
-        
-        # Reshape para imagen 2D
-        mask_luz_2d = mask_luz.reshape((height, width))
-        mask_sombra_2d = mask_sombra.reshape((height, width))
-        mask_tronco_2d = mask_tronco.reshape((height, width))
-        mask_ignorado_2d = mask_ignorado.reshape((height, width))
-        
-        # Aplicar colores (BGR format)
-        visual_rgb[mask_luz_2d] = [0, 255, 255]      # Amarillo para luz (BGR)
-        visual_rgb[mask_sombra_2d] = [50, 50, 50]    # Gris para sombra
-        visual_rgb[mask_tronco_2d] = [0, 0, 255]     # Rojo para tronco (BGR)
-        visual_rgb[mask_ignorado_2d] = [0, 0, 255]   # Rojo para ignorado (BGR)
+        # Colorear con la tabla de la paleta (BGR para cv2.imwrite)
+        mapa = np.asarray(etiquetas_pred_labels).reshape((height, width))
+        visual_rgb = renderizar_etiquetas(mapa, PALETA_SERVICIO, bgr=True, clases=CLASES_BASICAS)
         
         # Crear directorio de resultados si no existe
         os.makedirs("resultados", exist_ok=True)
@@ -252,7 +272,8 @@ class ProcesamientoServiceV2:
         anotaciones_json: str,
         lugar: str,
         nombre_imagen: str = "imagen.jpg",
-        nombre_json: str = "anotaciones.json"
+        nombre_json: str = "anotaciones.json",
+        campo: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         Procesa imagen desde bytes (para API)
@@ -273,7 +294,8 @@ class ProcesamientoServiceV2:
                 temp_json_path,
                 lugar,
                 nombre_imagen,
-                nombre_json
+                nombre_json,
+                campo
             )
             
             return resultado
@@ -291,63 +313,68 @@ class ProcesamientoServiceV2:
             height, width = imagen.shape[:2]
             print(f"📏 Dimensiones: {width}x{height}")
             
-            # Aplicar el modelo si está disponible
-            if self.modelo is not None and self.scaler is not None:
-                # Procesar imagen completa como en el código original
-                pixeles = imagen.reshape(-1, 3)
-                caracteristicas = self.extraer_caracteristicas_optimizadas(pixeles)
-                
-                # Escalar características
-                caracteristicas_scaled = self.scaler.transform(caracteristicas)
-                
-                # Clasificar
-                etiquetas_pred = self.modelo.predict(caracteristicas_scaled)
-                
-                # Decodificar etiquetas si hay encoder
-                if self.encoder is not None:
-                    etiquetas_pred = self.encoder.inverse_transform(etiquetas_pred)
-                
-                print(f"🔍 Etiquetas predichas: {np.unique(etiquetas_pred, return_counts=True)}")
-                
-                # Calcular porcentajes usando la función original
-                from src.procesamiento.postprocesamiento import calcular_porcentaje_suelo
-                porc_luz, porc_sombra, total_suelo = calcular_porcentaje_suelo(etiquetas_pred)
-                
-                # Crear máscaras como en el código original
-                mask_luz = etiquetas_pred == "LUZ"
-                mask_sombra = etiquetas_pred == "SOMBRA"
-                
-                # Reshape para imagen 2D
-                mask_luz_2d = mask_luz.reshape((height, width))
-                mask_sombra_2d = mask_sombra.reshape((height, width))
-                
-                # Crear máscara combinada (luz = 255, sombra = 128, resto = 0)
-                light_mask = np.zeros((height, width), dtype=np.uint8)
-                light_mask[mask_luz_2d] = 255
-                light_mask[mask_sombra_2d] = 128
-                
-                print(f"🤖 Modelo aplicado - Luz: {porc_luz:.1f}%, Sombra: {porc_sombra:.1f}%")
-                
-                return porc_luz, porc_sombra, light_mask
-                
-            else:
-                # Fallback: usar umbralización simple
-                gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
-                _, light_mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
-                light_pixels = np.sum(light_mask == 255)
-                total_pixels = gray.shape[0] * gray.shape[1]
-                
-                light_percentage = (light_pixels / total_pixels) * 100
-                shadow_percentage = 100 - light_percentage
-                print(f"📊 Fallback aplicado - Luz: {light_percentage:.1f}%, Sombra: {shadow_percentage:.1f}%")
-                
-                return light_percentage, shadow_percentage, light_mask
+            with CaracteristicasImagen(imagen) as caracteristicas:
+                return self._procesar_visual_caracteristicas(caracteristicas)
             
         except Exception as e:
             print(f"❌ Error en procesamiento visual: {e}")
             # Fallback: porcentajes aleatorios para testing
             return 50.0, 50.0, np.zeros((imagen.shape[0], imagen.shape[1]), dtype=np.uint8)
     
+    def _procesar_visual_caracteristicas(self, caracteristicas: CaracteristicasImagen) -> Tuple[float, float, np.ndarray]:
+        """
+        Clasificación para visualización a partir de los planos derivados de la imagen
+        """
+        height, width = caracteristicas.height, caracteristicas.width
+        
+        # Aplicar el modelo si está disponible
+        if self.modelo is not None and self.scaler is not None:
+            # Escalar características
+            caracteristicas_scaled = self.scaler.transform(
+                self.extraer_caracteristicas_optimizadas(caracteristicas)
+            )
+            
+            # Clasificar
+            etiquetas_pred = self.modelo.predict(caracteristicas_scaled)
+            
+            # Decodificar etiquetas si hay encoder
+            if self.encoder is not None:
+                etiquetas_pred = self.encoder.inverse_transform(etiquetas_pred)
+            
+            print(f"🔍 Etiquetas predichas: {np.unique(etiquetas_pred, return_counts=True)}")
+            
+            # Calcular porcentajes usando la función original
+            porc_luz, porc_sombra, total_suelo = calcular_porcentaje_suelo(etiquetas_pred)
+            
+            # Crear máscaras como en el código original
+            mask_luz = etiquetas_pred == "LUZ"
+            mask_sombra = etiquetas_pred == "SOMBRA"
+            
+            # Reshape para imagen 2D
+            mask_luz_2d = mask_luz.reshape((height, width))
+            mask_sombra_2d = mask_sombra.reshape((height, width))
+            
+            # Crear máscara combinada (luz = 255, sombra = 128, resto = 0)
+            light_mask = np.zeros((height, width), dtype=np.uint8)
+            light_mask[mask_luz_2d] = 255
+            light_mask[mask_sombra_2d] = 128
+            
+            print(f"🤖 Modelo aplicado - Luz: {porc_luz:.1f}%, Sombra: {porc_sombra:.1f}%")
+            
+            return porc_luz, porc_sombra, light_mask
+        
+        # Fallback: usar umbralización simple
+        gray = caracteristicas.gris
+        _, light_mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
+        light_pixels = np.sum(light_mask == 255)
+        total_pixels = caracteristicas.total_pixeles
+        
+        light_percentage = (light_pixels / total_pixels) * 100
+        shadow_percentage = 100 - light_percentage
+        print(f"📊 Fallback aplicado - Luz: {light_percentage:.1f}%, Sombra: {shadow_percentage:.1f}%")
+        
+        return light_percentage, shadow_percentage, light_mask
+    
     def _extraer_caracteristicas_simples(self, gray: np.ndarray) -> np.ndarray:
         """
         Extrae características simples de la imagen en escala de grises
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Serialización y compresión de respuestas de la API
+JSON con orjson (si está instalado), formato columnar opcional y middleware de
+compresión Brotli/GZip para respuestas grandes.
+"""
+
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def serializar_json(contenido: Any, sort_keys: bool = False) -> bytes:
+    """
+    Serializa a JSON (UTF-8) con orjson, o con json si no está disponible
+
+    Los tipos que json no conoce (numpy, datetime...) se convierten con str(),
+    igual que json.dumps(default=str).
+    """
+    if orjson is not None:
+        opciones = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(contenido, default=str, option=opciones)
+    return json.dumps(
+        contenido, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys, default=str
+    ).encode('utf-8')
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse que serializa con serializar_json"""
+
+    def render(self, content: Any) -> bytes:
+        return serializar_json(content)
+
+
+def a_columnas(registros: List[Dict[str, Any]], campos: Optional[Sequence[str]] = None) -> Dict[str, List[Any]]:
+    """
+    Convierte una lista de registros en un arreglo por campo
+
+    Args:
+        registros: Registros con las mismas claves
+        campos: Campos a incluir (por defecto, los del primer registro)
+
+    Returns:
+        Dict: {campo: [valor de cada registro]}
+    """
+    if campos is None:
+        campos = list(registros[0]) if registros else []
+    return {campo: [registro.get(campo) for registro in registros] for campo in campos}
+
+
+# Tipos de contenido que vale la pena comprimir
+TIPOS_COMPRIMIBLES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+
+class CompresionMiddleware:
+    """
+    Middleware ASGI que comprime con Brotli (si está instalado y el cliente lo acepta)
+    o GZip las respuestas de al menos `minimum_size` bytes
+
+    Las respuestas en streaming se comprimen por fragmentos sin acumularlas.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._elegir_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compresor = None
+        omitir = False
+
+        async def send_comprimido(message):
+            nonlocal inicio, compresor, omitir
+
+            if omitir:
+                await send(message)
+                return
+
+            if message['type'] == 'http.response.start':
+                # Se retiene hasta ver el primer fragmento del cuerpo
+                inicio = message
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if compresor is None:
+                headers = {k.lower(): v for k, v in inicio['headers']}
+                tipo = headers.get(b'content-type', b'').decode('latin-1')
+                if (b'content-encoding' in headers
+                        or not tipo.startswith(TIPOS_COMPRIMIBLES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    omitir = True
+                    await send(inicio)
+                    await send(message)
+                    return
+
+                compresor = self._compresor(encoding)
+                cabeceras = [
+                    (k, v) for k, v in inicio['headers']
+                    if k.lower() not in (b'content-length', b'vary')
+                ]
+                vary = headers.get(b'vary')
+                cabeceras.append((b'vary', vary + b', Accept-Encoding' if vary else b'Accept-Encoding'))
+                cabeceras.append((b'content-encoding', encoding.encode('latin-1')))
+
+                if not more_body:
+                    comprimido = compresor.comprimir(body) + compresor.terminar()
+                    cabeceras.append((b'content-length', str(len(comprimido)).encode('latin-1')))
+                    await send({**inicio, 'headers': cabeceras})
+                    await send({'type': 'http.response.body', 'body': comprimido})
+                    return
+                await send({**inicio, 'headers': cabeceras})
+
+            fragmento = compresor.comprimir(body)
+            if not more_body:
+                fragmento += compresor.terminar()
+            if fragmento or not more_body:
+                await send({'type': 'http.response.body', 'body': fragmento, 'more_body': more_body})
+
+        await self.app(scope, receive, send_comprimido)
+
+    @staticmethod
+    def _elegir_encoding(scope) -> Optional[str]:
+        aceptados = ''
+        for nombre, valor in scope.get('headers', []):
+            if nombre == b'accept-encoding':
+                aceptados = valor.decode('latin-1').lower()
+                break
+        encodings = {parte.split(';')[0].strip() for parte in aceptados.split(',')}
+        if brotli is not None and 'br' in encodings:
+            return 'br'
+        if 'gzip' in encodings:
+            return 'gzip'
+        return None
+
+    def _compresor(self, encoding: str) -> '_Compresor':
+        if encoding == 'br':
+            return _Compresor(brotli.Compressor(quality=self.brotli_quality))
+        return _Compresor(zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS))
+
+
+class _Compresor:
+    """Interfaz común para zlib (gzip) y brotli en modo streaming"""
+
+    def __init__(self, compresor):
+        self.compresor = compresor
+
+    def comprimir(self, datos: bytes) -> bytes:
+        if hasattr(self.compresor, 'process'):
+            return self.compresor.process(datos)
+        return self.compresor.compress(datos)
+
+    def terminar(self) -> bytes:
+        if hasattr(self.compresor, 'finish'):
+            return self.compresor.finish()
+        return self.compresor.flush()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Subidas reanudables por fragmentos
+El cliente crea la subida, envía fragmentos indicando su offset y, si la
+conexión se corta, consulta el offset recibido y continúa desde ahí. Los
+fragmentos se escriben en un archivo spooled (en memoria hasta 1 MB, después en
+disco) mientras se calcula el SHA-256; al llegar el último se valida el checksum
+y el procesamiento empieza de inmediato en un pool de hilos.
+"""
+
+import hashlib
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Función de procesamiento: (bytes del archivo, nombre_archivo, metadatos) → resultado
+Procesar = Callable[[bytes, str, Dict[str, Any]], Dict[str, Any]]
+
+TAMANO_FRAGMENTO = 1024 * 1024
+MAX_TAMANO_SUBIDA = 64 * 1024 * 1024
+MAX_TAMANO_FRAGMENTO = 16 * 1024 * 1024
+
+
+class ConflictoOffset(ValueError):
+    """El fragmento no empieza donde termina lo ya recibido"""
+
+    def __init__(self, offset_esperado: int):
+        super().__init__(f"Offset inválido: se esperaba {offset_esperado}")
+        self.offset_esperado = offset_esperado
+
+
+class Subida:
+    """Estado de una subida en curso"""
+
+    def __init__(self, tamano: int, nombre_archivo: str, sha256: str, metadatos: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.tamano = tamano
+        self.nombre_archivo = nombre_archivo
+        self.sha256 = sha256.lower()
+        self.metadatos = metadatos
+        self.offset = 0
+        self.estado = 'recibiendo'
+        self.resultado: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.actualizado = time.time()
+        self.futuro: Optional[Future] = None
+        self._hash = hashlib.sha256()
+        self._archivo = tempfile.SpooledTemporaryFile(max_size=TAMANO_FRAGMENTO)
+        self.lock = threading.Lock()
+
+    def reiniciar(self):
+        """Descarta lo recibido (p. ej. tras un checksum inválido) para volver a subir desde 0"""
+        self.cerrar()
+        self.offset = 0
+        self._hash = hashlib.sha256()
+        self._archivo = tempfile.SpooledTemporaryFile(max_size=TAMANO_FRAGMENTO)
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'nombre_archivo': self.nombre_archivo,
+            'tamano': self.tamano,
+            'offset': self.offset,
+            'estado': self.estado,
+            'resultado': self.resultado,
+            'error': self.error,
+        }
+
+
+class GestorSubidas:
+    """
+    Subidas reanudables en curso
+
+    Estados: recibiendo → procesando → completado | error; checksum_invalido
+    vuelve a aceptar fragmentos desde el offset 0.
+    """
+
+    def __init__(self, procesar: Procesar, max_procesos: int = 2, ttl: float = 24 * 3600):
+        self.procesar = procesar
+        self.ttl = ttl
+        self._subidas: Dict[str, Subida] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_procesos, thread_name_prefix="subidas")
+
+    def crear(self, tamano: int, nombre_archivo: str, sha256: str,
+              metadatos: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Registra una subida nueva
+
+        Parámetros:
+        - tamano: tamaño total del archivo en bytes
+        - nombre_archivo: nombre original
+        - sha256: checksum SHA-256 (hex) del archivo completo
+        - metadatos: datos del formulario (empresa, fundo, sector, lote...)
+
+        Retorna:
+        - Estado de la subida (con su id y offset 0)
+        """
+        if not 0 < tamano <= MAX_TAMANO_SUBIDA:
+            raise ValueError(f"tamano debe estar entre 1 y {MAX_TAMANO_SUBIDA} bytes")
+        if len(sha256 or '') != 64 or any(c not in '0123456789abcdefABCDEF' for c in sha256):
+            raise ValueError("sha256 debe ser el checksum SHA-256 en hexadecimal")
+
+        self._limpiar()
+        subida = Subida(tamano, nombre_archivo, sha256, metadatos or {})
+        with self._lock:
+            self._subidas[subida.id] = subida
+        return subida.to_dict()
+
+    def _obtener(self, subida_id: str) -> Subida:
+        with self._lock:
+            subida = self._subidas.get(subida_id)
+        if subida is None:
+            raise KeyError(f"Subida no encontrada: {subida_id}")
+        return subida
+
+    def estado(self, subida_id: str) -> Dict[str, Any]:
+        return self._obtener(subida_id).to_dict()
+
+    def futuro(self, subida_id: str) -> Optional[Future]:
+        """Procesamiento en curso de la subida (None si aún no empezó)"""
+        return self._obtener(subida_id).futuro
+
+    def recibir(self, subida_id: str, offset: int, datos: bytes) -> Dict[str, Any]:
+        """
+        Agrega un fragmento
+
+        Un fragmento repetido (ya recibido por completo) se ignora, de modo que
+        reintentar el último envío es seguro.
+
+        Parámetros:
+        - subida_id: id devuelto por crear
+        - offset: posición del primer byte del fragmento
+        - datos: bytes del fragmento
+
+        Retorna:
+        - Estado de la subida; si era el último fragmento, con estado 'procesando'
+          (o 'checksum_invalido')
+        """
+        subida = self._obtener(subida_id)
+        with subida.lock:
+            if subida.estado not in ('recibiendo', 'checksum_invalido'):
+                if offset + len(datos) <= subida.offset:
+                    return subida.to_dict()
+                raise ValueError(f"La subida ya está en estado '{subida.estado}'")
+            if offset != subida.offset:
+                if offset + len(datos) <= subida.offset:
+                    return subida.to_dict()
+                raise ConflictoOffset(subida.offset)
+            if offset + len(datos) > subida.tamano:
+                raise ValueError("El fragmento supera el tamaño declarado de la subida")
+
+            subida.estado = 'recibiendo'
+            subida.error = None
+            subida._archivo.write(datos)
+            subida._hash.update(datos)
+            subida.offset += len(datos)
+            subida.actualizado = time.time()
+
+            if subida.offset == subida.tamano:
+                self._completar(subida)
+            return subida.to_dict()
+
+    def _completar(self, subida: Subida):
+        """Valida el checksum y lanza el procesamiento (con subida.lock tomado)"""
+        if subida._hash.hexdigest() != subida.sha256:
+            print(f"❌ Checksum inválido en la subida {subida.id} ({subida.nombre_archivo})")
+            subida.reiniciar()
+            subida.estado = 'checksum_invalido'
+            subida.error = "El checksum SHA-256 no coincide; vuelva a enviar el archivo desde el offset 0"
+            return
+
+        subida._archivo.seek(0)
+        datos = subida._archivo.read()
+        subida.cerrar()
+        subida.estado = 'procesando'
+        print(f"📥 Subida completa: {subida.nombre_archivo} ({subida.tamano} bytes)")
+        subida.futuro = self._executor.submit(self._procesar, subida, datos)
+
+    def _procesar(self, subida: Subida, datos: bytes) -> Dict[str, Any]:
+        try:
+            resultado = self.procesar(datos, subida.nombre_archivo, subida.metadatos)
+            subida.resultado = resultado
+            subida.estado = 'completado'
+            return resultado
+        except Exception as e:
+            print(f"❌ Error procesando la subida {subida.id}: {e}")
+            subida.error = str(e)
+            subida.estado = 'error'
+            raise
+        finally:
+            subida.actualizado = time.time()
+
+    def _limpiar(self):
+        """Elimina las subidas sin actividad durante más de ttl segundos"""
+        limite = time.time() - self.ttl
+        with self._lock:
+            vencidas = [s for s in self._subidas.values() if s.actualizado < limite and s.estado != 'procesando']
+            for subida in vencidas:
+                del self._subidas[subida.id]
+        for subida in vencidas:
+            with subida.lock:
+                subida.cerrar()
@@ -1,26 +1,125 @@
 import numpy as np
 import cv2
 
-def etiquetas_a_rgb(etiquetas, height, width, incluir_leyenda=False):
-    # Mapeo de colores solo para LUZ y SOMBRA
-    color_map = {
-        "LUZ": [255, 255, 0],     # Amarillo
-        "SOMBRA": [50, 50, 50],   # Gris oscuro
-    }
+# Paletas etiqueta → color RGB (los píxeles sin color quedan en negro)
+PALETA_SUELO = {
+    "LUZ": (255, 255, 0),      # Amarillo
+    "SOMBRA": (50, 50, 50),    # Gris oscuro
+}
 
-    # Imagen de salida inicializada como negra
-    resultado = np.zeros((height * width, 3), dtype=np.uint8)
+PALETA_SERVICIO = {
+    "LUZ": (255, 255, 0),      # Amarillo
+    "SOMBRA": (50, 50, 50),    # Gris oscuro
+    "TRONCO": (255, 0, 0),     # Rojo
+    "IGNORADO": (255, 0, 0),   # Rojo
+}
 
-    for i, etiqueta in enumerate(etiquetas):
-        if etiqueta in color_map:
-            resultado[i] = color_map[etiqueta]
 
-    resultado = resultado.reshape((height, width, 3))
+def construir_lut(paleta, bgr=False):
+    """
+    Construye la tabla de colores (n + 1, 3) para una paleta; el índice 0 es el fondo (negro).
+    """
+    colores = [(0, 0, 0)] + [tuple(c) for c in paleta.values()]
+    lut = np.array(colores, dtype=np.uint8)
+    return lut[:, ::-1].copy() if bgr else lut
+
+
+def redimensionar_mapa(mapa, max_dim=None):
+    """
+    Reduce un mapa de etiquetas 2D (de cualquier dtype) por vecino más cercano para que
+    su lado mayor no supere max_dim.
+    """
+    height, width = mapa.shape[:2]
+    if not max_dim or max(height, width) <= max_dim:
+        return mapa
+
+    escala = max_dim / max(height, width)
+    nuevo_alto, nuevo_ancho = max(1, round(height * escala)), max(1, round(width * escala))
+    filas = (np.arange(nuevo_alto) * height // nuevo_alto)
+    columnas = (np.arange(nuevo_ancho) * width // nuevo_ancho)
+    return mapa[filas[:, None], columnas]
+
+
+def codificar_mapa(mapa, paleta, clases=None):
+    """
+    Convierte un mapa de etiquetas a índices de la paleta (0 = sin color).
+
+    Los mapas enteros se interpretan como índices de `clases` (nombres de cada valor)
+    o, si no se indica, como índices en el orden de la paleta.
+    """
+    if np.issubdtype(mapa.dtype, np.integer):
+        nombres = clases if clases is not None else list(paleta)
+        orden = {etiqueta: i for i, etiqueta in enumerate(paleta, start=1)}
+        remapeo = np.zeros(max(len(nombres), int(mapa.max(initial=0)) + 1), dtype=np.uint8)
+        remapeo[:len(nombres)] = [orden.get(nombre, 0) for nombre in nombres]
+        return remapeo[np.clip(mapa, 0, None)]
+
+    # Etiquetas de texto: se codifica cada valor distinto una vez y se indexa una sola vez
+    unicas, inversa = np.unique(mapa, return_inverse=True)
+    orden = {etiqueta: i for i, etiqueta in enumerate(paleta, start=1)}
+    remapeo = np.array([orden.get(etiqueta, 0) for etiqueta in unicas.tolist()], dtype=np.uint8)
+    return remapeo[inversa].reshape(mapa.shape)
+
+
+def renderizar_etiquetas(mapa, paleta=PALETA_SUELO, max_dim=None, bgr=False, clases=None):
+    """
+    Colorea un mapa de etiquetas 2D con una sola indexación en la tabla de colores.
+
+    Parámetros:
+    - mapa: array 2D de etiquetas (strings o índices)
+    - paleta: dict etiqueta → color RGB
+    - max_dim: lado mayor de la salida; el mapa se reduce antes de colorear
+    - bgr: devolver colores en orden BGR (para cv2.imwrite)
+    - clases: nombres de cada valor si el mapa es entero
+
+    Retorna:
+    - Imagen uint8 (alto, ancho, 3)
+    """
+    codigos = codificar_mapa(redimensionar_mapa(mapa, max_dim), paleta, clases)
+    return construir_lut(paleta, bgr)[codigos]
+
+
+def superponer_etiquetas(imagen_bgr, mapa, paleta=PALETA_SUELO, alpha=0.5, max_dim=None, clases=None):
+    """
+    Mezcla los colores de las etiquetas sobre la foto original (BGR) con transparencia alpha.
+    Los píxeles sin color conservan la foto.
+    """
+    codigos = codificar_mapa(redimensionar_mapa(mapa, max_dim), paleta, clases)
+    height, width = codigos.shape
+
+    if imagen_bgr.shape[:2] != (height, width):
+        imagen_bgr = cv2.resize(imagen_bgr, (width, height), interpolation=cv2.INTER_AREA)
+
+    colores = construir_lut(paleta, bgr=True)[codigos]
+    mezcla = cv2.addWeighted(colores, alpha, imagen_bgr, 1 - alpha, 0)
+    return np.where((codigos > 0)[..., None], mezcla, imagen_bgr)
+
+
+def dibujar_leyenda(imagen, paleta=PALETA_SUELO, bgr=False):
+    """
+    Dibuja una leyenda (muestra de color + etiqueta) en la esquina superior izquierda.
+    """
+    escala = max(imagen.shape[:2]) / 1000
+    fuente = 0.6 * max(escala, 0.5)
+    alto_linea = int(30 * max(escala, 0.5))
+    x, y = 20, 20
+
+    cv2.rectangle(imagen, (x, y), (x + 12 * alto_linea, y + alto_linea * len(paleta) + 20), (255, 255, 255), -1)
+    for i, (etiqueta, color) in enumerate(paleta.items()):
+        color = tuple(int(c) for c in (color[::-1] if bgr else color))
+        y_linea = y + 10 + i * alto_linea
+        cv2.rectangle(imagen, (x + 10, y_linea), (x + 10 + alto_linea - 8, y_linea + alto_linea - 8), color, -1)
+        cv2.putText(imagen, etiqueta, (x + 10 + alto_linea, y_linea + alto_linea - 12),
+                    cv2.FONT_HERSHEY_SIMPLEX, fuente, (0, 0, 0), 1)
+    return imagen
+
+
+def etiquetas_a_rgb(etiquetas, height, width, incluir_leyenda=False, max_dim=None):
+    mapa = np.asarray(etiquetas).reshape((height, width))
+    resultado = renderizar_etiquetas(mapa, PALETA_SUELO, max_dim=max_dim)
 
     # Leyenda visual (opcional)
     if incluir_leyenda:
-        cv2.rectangle(resultado, (20, 20), (280, 100), (255, 255, 255), -1)
-        cv2.putText(resultado, "LUZ = Amarillo", (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
-        cv2.putText(resultado, "SOMBRA = Gris", (30, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        dibujar_leyenda(resultado, PALETA_SUELO)
 
-    return resultado
\ No newline at end of file
+    return resultado